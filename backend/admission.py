@@ -0,0 +1,371 @@
+"""
+Booking Admission Control
+-------------------------
+Keeps one hot group (a celebrity wedding going on sale) from starving every
+other tenant on the same workers. Runs as pure ASGI middleware in front of
+POST /api/bookings/initiate and sheds excess load early with 429 + Retry-After,
+before any body validation, risk scoring or Redis locking happens.
+
+Checks, cheapest first:
+1. Worker concurrency cap on the booking handler (MAX_INFLIGHT); checked
+   again, with the group cap, after the last await so it holds exactly.
+2. Body size cap (413 past MAX_BODY_BYTES).
+3. Per-client token bucket, keyed on the client address (first
+   X-Forwarded-For hop behind a trusted proxy), plus a per-guest bucket keyed
+   on the guest email in the body. The email is caller-chosen, so it only
+   ever adds a limit; changing it per request does not escape the first.
+4. Per-group token bucket.
+5. Per-group in-flight cap (GROUP_MAX_INFLIGHT), so one group can never hold
+   every handler slot.
+
+Token buckets are shared by all workers through Redis (one hash per bucket,
+refilled and drained by a Lua script). Each worker leases a few tokens at a
+time and spends them locally, so most requests never touch Redis. After a
+denial it also remembers "empty until t", so a burst is shed without a Redis
+round trip per request. The occasional lease is awaited on the event loop
+through redis.asyncio (no blocking call, no hop to a possibly saturated
+threadpool) with a short timeout; a slow or failing Redis admits the request
+(fail open).
+"""
+
+import asyncio
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import anyio
+import redis
+import redis.asyncio
+from redis.cluster import RedisCluster
+
+from backend.inventory_defense import REDIS_URL, MockRedis, redis_client
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+ADMISSION_ENABLED = os.getenv("ANCILE_ADMISSION", "1") == "1"
+GROUP_RATE = float(os.getenv("ANCILE_GROUP_RATE", "50"))          # bookings/s per group
+GROUP_BURST = float(os.getenv("ANCILE_GROUP_BURST", "100"))
+CLIENT_RATE = float(os.getenv("ANCILE_CLIENT_RATE", "2"))         # bookings/s per client
+CLIENT_BURST = float(os.getenv("ANCILE_CLIENT_BURST", "10"))
+GUEST_RATE = float(os.getenv("ANCILE_GUEST_RATE", "2"))           # bookings/s per guest email
+GUEST_BURST = float(os.getenv("ANCILE_GUEST_BURST", "10"))
+MAX_INFLIGHT = int(os.getenv("ANCILE_BOOKING_MAX_INFLIGHT", "64"))  # per worker
+GROUP_MAX_INFLIGHT = int(os.getenv("ANCILE_GROUP_MAX_INFLIGHT", "16"))
+# Only honour X-Forwarded-For behind a proxy that sets it (Vercel always does)
+TRUST_FORWARDED = os.getenv("ANCILE_TRUST_FORWARDED", "1" if os.getenv("VERCEL") else "0") == "1"
+# How long a shared-bucket lease may take before the request is admitted anyway
+LEASE_TIMEOUT_SECONDS = float(os.getenv("ANCILE_ADMISSION_REDIS_TIMEOUT", "0.25"))
+
+ADMISSION_PATHS = ("/api/bookings/initiate",)
+BUCKET_KEY_PREFIX = "rl"
+# Local bucket entries kept per limiter (LRU beyond that)
+LOCAL_BUCKETS_MAX = 10000
+MAX_BODY_BYTES = 64 * 1024
+
+# KEYS[1] = bucket hash; ARGV = rate/s, burst, now_ms, wanted
+# Returns {granted, wait_ms}: wait_ms is how long until one token is back.
+TAKE_TOKENS_LUA = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(now - ts, 0) / 1000 * rate)
+local granted = math.min(tonumber(ARGV[4]), math.floor(tokens))
+tokens = tokens - granted
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+if granted > 0 then return {granted, 0} end
+return {0, math.ceil((1 - tokens) / rate * 1000)}
+"""
+
+
+def _mock_take(client: MockRedis, key: str, rate: float, burst: float, now_ms: int,
+               wanted: int) -> Tuple[int, int]:
+    """TAKE_TOKENS_LUA for MockRedis."""
+    with client.lock:
+        tokens, ts = client.store.get(key, (burst, now_ms))
+        tokens = min(burst, tokens + max(now_ms - ts, 0) / 1000 * rate)
+        granted = min(wanted, math.floor(tokens))
+        client.store[key] = (tokens - granted, now_ms)
+        if granted > 0:
+            return granted, 0
+        return 0, math.ceil((1 - (tokens - granted)) / rate * 1000)
+
+
+class _Lease:
+    """Tokens this worker has already taken from a shared bucket."""
+
+    __slots__ = ("tokens", "empty_until")
+
+    def __init__(self):
+        self.tokens = 0
+        self.empty_until = 0.0
+
+
+class SharedTokenBucket:
+    """
+    Token buckets keyed by name, shared across workers through Redis, with a
+    leased in-process fast path.
+    """
+
+    def __init__(self, name: str, rate: float, burst: float, client=None,
+                 lease_size: Optional[int] = None):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.client = client if client is not None else redis_client
+        # Small leases keep the cross-worker error bounded
+        self.lease_size = lease_size or max(1, int(burst // 20))
+        self.leases: "OrderedDict[str, _Lease]" = OrderedDict()
+        self._async = None  # (loop, redis.asyncio client, script)
+        self._lock = threading.Lock()
+
+    def _key(self, bucket_id: str) -> str:
+        """One hash per bucket (single key: cluster-safe)."""
+        return f"{BUCKET_KEY_PREFIX}:{{{self.name}:{bucket_id}}}"
+
+    def _async_client(self):
+        """redis.asyncio client for ANCILE_REDIS_URL (and its script), per event loop."""
+        loop = asyncio.get_running_loop()
+        if self._async is None or self._async[0] is not loop:
+            if isinstance(self.client, RedisCluster):
+                client = redis.asyncio.RedisCluster.from_url(REDIS_URL, decode_responses=True)
+            else:
+                client = redis.asyncio.Redis.from_url(REDIS_URL, decode_responses=True)
+            self._async = (loop, client, client.register_script(TAKE_TOKENS_LUA))
+        return self._async
+
+    async def _take_shared(self, bucket_id: str) -> Tuple[int, int]:
+        """Leases up to lease_size tokens from the shared bucket."""
+        now_ms = int(time.time() * 1000)
+        key = self._key(bucket_id)
+        if isinstance(self.client, MockRedis):
+            return _mock_take(self.client, key, self.rate, self.burst, now_ms,
+                              self.lease_size)
+        _, client, script = self._async_client()
+        granted, wait_ms = await script(
+            keys=[key], args=[self.rate, self.burst, now_ms, self.lease_size],
+            client=client)
+        return int(granted), int(wait_ms)
+
+    async def try_acquire(self, bucket_id: str) -> float:
+        """
+        Takes one token. Returns 0.0 if admitted, else seconds until a retry
+        can succeed.
+        """
+        now = time.monotonic()
+        with self._lock:
+            lease = self.leases.get(bucket_id)
+            if lease is None:
+                lease = self.leases[bucket_id] = _Lease()
+                if len(self.leases) > LOCAL_BUCKETS_MAX:
+                    self.leases.popitem(last=False)
+            else:
+                self.leases.move_to_end(bucket_id)
+            if lease.tokens > 0:
+                lease.tokens -= 1
+                return 0.0
+            if now < lease.empty_until:
+                return lease.empty_until - now
+
+        try:
+            with anyio.fail_after(LEASE_TIMEOUT_SECONDS):
+                granted, wait_ms = await self._take_shared(bucket_id)
+        except (redis.RedisError, TimeoutError) as e:
+            # Fail open: a Redis blip must not turn into a booking outage
+            logger.error("Rate limiter %s unavailable: %r", self.name, e)
+            return 0.0
+
+        with self._lock:
+            if granted > 0:
+                lease.tokens += granted - 1
+                return 0.0
+            lease.empty_until = now + wait_ms / 1000.0
+            return wait_ms / 1000.0
+
+
+class AdmissionController:
+    """
+    Admission state for one worker: limits, buckets, in-flight counters and
+    shed statistics. Only touched from the event loop (buckets are thread-safe).
+    """
+
+    def __init__(self, enabled: bool = ADMISSION_ENABLED, client=None,
+                 max_inflight: int = MAX_INFLIGHT,
+                 group_max_inflight: int = GROUP_MAX_INFLIGHT,
+                 trust_forwarded: bool = TRUST_FORWARDED,
+                 paths: Iterable[str] = ADMISSION_PATHS):
+        self.enabled = enabled
+        self.max_inflight = max_inflight
+        self.group_max_inflight = group_max_inflight
+        self.trust_forwarded = trust_forwarded
+        self.paths = frozenset(paths)
+        self.groups = SharedTokenBucket("group", GROUP_RATE, GROUP_BURST, client)
+        self.clients = SharedTokenBucket("client", CLIENT_RATE, CLIENT_BURST, client)
+        self.guests = SharedTokenBucket("guest", GUEST_RATE, GUEST_BURST, client)
+        self.in_flight = 0
+        self.group_in_flight: Dict[str, int] = {}
+        self.admitted = 0
+        self.shed: Dict[str, int] = {}
+
+    def client_id(self, scope) -> str:
+        """The client address (first X-Forwarded-For hop behind a trusted proxy)."""
+        if self.trust_forwarded:
+            for name, value in scope.get("headers", ()):
+                if name == b"x-forwarded-for":
+                    return value.split(b",")[0].strip().decode("latin-1")
+        client = scope.get("client")
+        return client[0] if client else "unknown"
+
+    def record_shed(self, reason: str):
+        """Counts one rejected request."""
+        self.shed[reason] = self.shed.get(reason, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for dashboards and load tests."""
+        return {
+            "enabled": self.enabled,
+            "in_flight": self.in_flight,
+            "admitted": self.admitted,
+            "shed": dict(self.shed),
+        }
+
+
+def _booking_keys(body: bytes) -> Tuple[Optional[str], Optional[str]]:
+    """
+    (group_id, guest_email) from a booking body; None where missing or
+    unparsable (validation happens later).
+    """
+    try:
+        fields = json.loads(body)
+        group_id, guest_email = fields.get("group_id"), fields.get("guest_email")
+    except (ValueError, AttributeError):
+        return None, None
+    return (group_id if isinstance(group_id, str) else None,
+            guest_email if isinstance(guest_email, str) else None)
+
+
+async def _send_error(send, status: int, detail: str, reason: str,
+                      headers: Iterable[Tuple[bytes, bytes]] = ()):
+    """Early JSON rejection."""
+    body = json.dumps({"detail": detail, "reason": reason}).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode("latin-1")),
+            *headers,
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _send_429(send, reason: str, retry_after: float):
+    """Early rejection with a Retry-After hint (whole seconds, at least 1)."""
+    await _send_error(send, 429, "Too Many Requests", reason, [
+        (b"retry-after", str(max(1, math.ceil(retry_after))).encode("latin-1"))])
+
+
+class AdmissionMiddleware:
+    """
+    Pure ASGI middleware applying AdmissionController to the booking endpoint.
+    """
+
+    def __init__(self, app, controller: AdmissionController = None):
+        self.app = app
+        self.controller = controller if controller is not None else admission_controller
+
+    async def __call__(self, scope, receive, send):
+        ctl = self.controller
+        if scope["type"] != "http" or not ctl.enabled or scope["method"] != "POST" \
+                or scope["path"] not in ctl.paths:
+            await self.app(scope, receive, send)
+            return
+
+        # Cheap early shed; the binding check is the one before the increment
+        if ctl.in_flight >= ctl.max_inflight:
+            ctl.record_shed("concurrency")
+            await _send_429(send, "concurrency", 1)
+            return
+
+        # The guest and group are in the JSON body: buffer it and replay it downstream
+        chunks: List[bytes] = []
+        size = 0
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] != "http.request":
+                await self.app(scope, receive, send)
+                return
+            chunks.append(message.get("body", b""))
+            size += len(chunks[-1])
+            more_body = message.get("more_body", False)
+            if size > MAX_BODY_BYTES:
+                ctl.record_shed("body_size")
+                await _send_error(send, 413, "Payload Too Large", "body_size")
+                return
+        body = b"".join(chunks)
+        replayed = False
+
+        async def replay():
+            nonlocal replayed
+            if replayed:
+                return await receive()
+            replayed = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        group_id, guest_email = _booking_keys(body)
+        wait = await ctl.clients.try_acquire(ctl.client_id(scope))
+        if wait:
+            ctl.record_shed("client_rate")
+            await _send_429(send, "client_rate", wait)
+            return
+        if guest_email:
+            wait = await ctl.guests.try_acquire(guest_email.strip().lower())
+            if wait:
+                ctl.record_shed("guest_rate")
+                await _send_429(send, "guest_rate", wait)
+                return
+        if group_id is not None:
+            wait = await ctl.groups.try_acquire(group_id)
+            if wait:
+                ctl.record_shed("group_rate")
+                await _send_429(send, "group_rate", wait)
+                return
+        # After the last await, so the checks and the increments below are atomic
+        if ctl.in_flight >= ctl.max_inflight:
+            ctl.record_shed("concurrency")
+            await _send_429(send, "concurrency", 1)
+            return
+        if group_id is not None and \
+                ctl.group_in_flight.get(group_id, 0) >= ctl.group_max_inflight:
+            ctl.record_shed("group_concurrency")
+            await _send_429(send, "group_concurrency", 1)
+            return
+
+        ctl.in_flight += 1
+        ctl.admitted += 1
+        if group_id is not None:
+            ctl.group_in_flight[group_id] = ctl.group_in_flight.get(group_id, 0) + 1
+        try:
+            await self.app(scope, replay, send)
+        finally:
+            ctl.in_flight -= 1
+            if group_id is not None:
+                remaining = ctl.group_in_flight[group_id] - 1
+                if remaining:
+                    ctl.group_in_flight[group_id] = remaining
+                else:
+                    del ctl.group_in_flight[group_id]
+
+
+admission_controller = AdmissionController()
@@ -0,0 +1,197 @@
+"""
+Live Availability Stream
+------------------------
+Pushes room-availability deltas to microsite guests over Server-Sent Events.
+
+Fan-out model:
+1. inventory_defense publishes one JSON delta per hold / release / commit.
+2. Each worker holds ONE Redis pub/sub subscription (a daemon thread) and hands
+   every delta to the event loop exactly once.
+3. The loop fans it out to the local subscribers of that group.
+
+Backpressure: subscribers never queue an unbounded backlog. Each one keeps only
+the latest delta per room type (conflation), so a slow client skips
+intermediate states and receives the current availability when it catches up.
+
+Waitlist offers travel the same channel and reach the group's clients as
+`offer` events keyed by the promoted guest's waitlist ticket.
+"""
+
+import asyncio
+import json
+import logging
+import threading
+import time
+from typing import AsyncIterator, Dict, Optional, Set, Tuple
+
+import redis
+
+from backend.inventory_defense import INVENTORY_EVENTS_CHANNEL, redis_client
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_SECONDS = 15.0
+CLIENT_RETRY_MS = 3000
+RECONNECT_BACKOFF_MAX_SECONDS = 10.0
+
+
+class AvailabilitySubscriber:
+    """One connected SSE client: latest pending delta per room type."""
+
+    __slots__ = ("group_id", "pending", "wakeup", "dropped")
+
+    def __init__(self, group_id: str):
+        self.group_id = group_id
+        self.pending: Dict[str, Tuple[str, Optional[str], str]] = {}
+        self.wakeup = asyncio.Event()
+        self.dropped = 0  # Deltas superseded before the client read them
+
+    def offer(self, slot: str, event_id: Optional[str], data: str,
+              event: str = "availability"):
+        """Stores a delta, replacing any unread one in the same slot (room type)."""
+        if slot in self.pending:
+            self.dropped += 1
+        self.pending[slot] = (event, event_id, data)
+        self.wakeup.set()
+
+    def drain(self) -> Dict[str, Tuple[str, Optional[str], str]]:
+        """Takes every pending delta."""
+        pending, self.pending = self.pending, {}
+        self.wakeup.clear()
+        return pending
+
+
+class AvailabilityHub:
+    """
+    Per-worker fan-out point between the Redis channel and SSE clients.
+    """
+
+    def __init__(self, client=None, channel: str = INVENTORY_EVENTS_CHANNEL):
+        self.client = client if client is not None else redis_client
+        self.channel = channel
+        self.subscribers: Dict[str, Set[AvailabilitySubscriber]] = {}
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.delivered = 0
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._start_lock = threading.Lock()
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        """Starts the single pub/sub listener for this worker (idempotent)."""
+        with self._start_lock:
+            self.loop = loop
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._listen, name="availability-hub", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stops the listener thread."""
+        self._stop.set()
+
+    def subscribe(self, group_id: str) -> AvailabilitySubscriber:
+        """Registers a client for a group's deltas."""
+        self.start(asyncio.get_running_loop())
+        subscriber = AvailabilitySubscriber(group_id)
+        self.subscribers.setdefault(group_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: AvailabilitySubscriber):
+        """Removes a client (called when its stream closes)."""
+        group = self.subscribers.get(subscriber.group_id)
+        if group is not None:
+            group.discard(subscriber)
+            if not group:
+                del self.subscribers[subscriber.group_id]
+
+    def subscriber_count(self) -> int:
+        """Number of connected clients on this worker."""
+        return sum(len(s) for s in self.subscribers.values())
+
+    def dispatch(self, data: str):
+        """Fans one delta out to the group's subscribers (runs on the loop)."""
+        try:
+            delta = json.loads(data)
+        except ValueError:
+            logger.error("Malformed inventory delta: %s", data)
+            return
+        version = delta.get("version")
+        event_id = str(version) if version is not None else None
+        if delta.get("event") == "offer":
+            event, slot = "offer", f"offer:{delta.get('ticket')}"
+        else:
+            event, slot = "availability", delta.get("room_type", "")
+        for subscriber in self.subscribers.get(delta.get("group_id"), ()):
+            subscriber.offer(slot, event_id, data, event)
+            self.delivered += 1
+
+    def _listen(self):
+        """Pub/sub listener thread with reconnect backoff."""
+        backoff = 0.5
+        while not self._stop.is_set():
+            pubsub = None
+            try:
+                pubsub = self.client.pubsub()
+                pubsub.subscribe(self.channel)
+                backoff = 0.5
+                while not self._stop.is_set():
+                    message = pubsub.get_message(
+                        ignore_subscribe_messages=True, timeout=1.0)
+                    if not message or message.get("type") != "message":
+                        continue
+                    if self.loop is not None and not self.loop.is_closed():
+                        self.loop.call_soon_threadsafe(
+                            self.dispatch, message["data"])
+            except redis.RedisError as e:
+                logger.error("Availability hub lost Redis subscription: %s", e)
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, RECONNECT_BACKOFF_MAX_SECONDS)
+            finally:
+                if pubsub is not None:
+                    pubsub.close()
+
+
+def _sse(event: str, data: str, event_id: Optional[str] = None) -> str:
+    """Formats one Server-Sent Event frame."""
+    frame = f"event: {event}\n"
+    if event_id is not None:
+        frame += f"id: {event_id}\n"
+    return frame + f"data: {data}\n\n"
+
+
+async def stream_group_availability(
+    hub: AvailabilityHub,
+    subscriber: AvailabilitySubscriber,
+    snapshot: bytes,
+    snapshot_version: Optional[int] = None,
+    heartbeat: float = HEARTBEAT_SECONDS
+) -> AsyncIterator[str]:
+    """
+    SSE body for one client: the current snapshot, then deltas as they arrive.
+    The subscriber must be registered before the snapshot is read, so no
+    change can fall between the two; deltas the snapshot already covers
+    (version <= snapshot_version) are skipped.
+    Heartbeat comments keep proxies from closing idle connections.
+    """
+    try:
+        yield f"retry: {CLIENT_RETRY_MS}\n"
+        yield _sse("snapshot", snapshot.decode("utf-8"))
+        while True:
+            try:
+                await asyncio.wait_for(subscriber.wakeup.wait(), timeout=heartbeat)
+            except asyncio.TimeoutError:
+                yield f": ping {int(time.time())}\n\n"
+                continue
+            for event, event_id, data in subscriber.drain().values():
+                if snapshot_version is not None and event_id is not None \
+                        and int(event_id) <= snapshot_version:
+                    continue
+                yield _sse(event, data, event_id)
+    finally:
+        hub.unsubscribe(subscriber)
+
+
+availability_hub = AvailabilityHub()
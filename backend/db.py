@@ -0,0 +1,565 @@
+"""
+Database Access Layer
+---------------------
+Pooled access to the groups / inventory_blocks / guests / bookings tables
+defined in database_schema.sql.
+
+- Backends: SQLite (local default, WAL mode) and PostgreSQL (psycopg 3,
+  optional). ANCILE_DATABASE_URL picks one:
+      sqlite:///path/to/ancile.db   sqlite:///:memory:   postgresql://user@host/db
+  The default is ancile_local.db in the system temp dir (writable on
+  read-only deploys), opened on first query. The API seeds the demo group
+  into it when it is empty (ANCILE_SEED_LOCAL, on unless ANCILE_DATABASE_URL
+  is set); `python -m backend.db seed` does the same by hand.
+- SQL is written once in Postgres style ($1 placeholders, ON CONFLICT upserts)
+  and translated per backend.
+- Hot queries are module constants, so every pooled connection compiles them
+  once and reuses the prepared statement (sqlite3 statement cache / psycopg
+  server-side prepare).
+- Sync API for threadpool callers (the inventory engine) and an async API
+  (`await database.afetchone(...)`) that runs on the pool's own executor, so
+  DB waits never block the event loop or the shared request threadpool.
+- Bulk paths (`executemany`) write chunks of rows per transaction.
+"""
+
+import asyncio
+import logging
+import os
+import queue
+import re
+import sqlite3
+import sys
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+try:
+    import psycopg  # Optional: pip install "psycopg[binary]"
+    from psycopg.rows import dict_row
+except ImportError:  # pragma: no cover - depends on the environment
+    psycopg = None
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCHEMA_PATH = os.path.join(ROOT_DIR, "database_schema.sql")
+# Demo data goes into the default local database only, never a configured one
+SEED_LOCAL = os.getenv(
+    "ANCILE_SEED_LOCAL", "0" if os.getenv("ANCILE_DATABASE_URL") else "1") == "1"
+DATABASE_URL = os.getenv(
+    "ANCILE_DATABASE_URL",
+    f"sqlite:///{os.path.join(tempfile.gettempdir(), 'ancile_local.db')}")
+POOL_SIZE = int(os.getenv("ANCILE_DB_POOL_SIZE", "8"))
+POOL_TIMEOUT_SECONDS = 5.0
+BULK_CHUNK = 500
+BOOKINGS_PAGE_SIZE = 5000
+GROUP_ID_CACHE_MAX = 4096
+
+_PLACEHOLDER_RE = re.compile(r"\$(\d+)")
+_UUID_RE = re.compile(r"^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-"
+                      r"[0-9a-fA-F]{12}$")
+
+
+class DatabaseException(Exception):
+    """Base exception for data access errors."""
+
+
+class DatabaseUnavailable(DatabaseException):
+    """No pooled connection could be obtained in time."""
+
+
+# --- Hot queries (Postgres dialect; translated for SQLite) ---
+
+GROUP_COLUMNS = "id, name, subdomain, event_date, city, status, theme"
+GROUP_BY_SUBDOMAIN = f"SELECT {GROUP_COLUMNS} FROM groups WHERE subdomain = $1"
+GROUP_BY_ID = f"SELECT {GROUP_COLUMNS} FROM groups WHERE id = $1"
+GROUP_BLOCKS = (
+    "SELECT room_type_code, tbo_hotel_id, total_allocated, total_booked, rate "
+    "FROM inventory_blocks WHERE group_id = $1 ORDER BY room_type_code")
+BLOCK_COUNTS = (
+    "SELECT total_allocated, total_booked FROM inventory_blocks "
+    "WHERE group_id = $1 AND room_type_code = $2")
+RECORD_BOOKING = (
+    "UPDATE inventory_blocks SET total_booked = total_booked + 1 "
+    "WHERE group_id = $1 AND room_type_code = $2 AND total_booked < total_allocated")
+INSERT_BOOKING = (
+    "INSERT INTO bookings (id, group_id, room_type_code, lock_token, stripe_session_id, "
+    "guest_email, amount_total_cents, markup_cents, net_rate_cents) "
+    "VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9) ON CONFLICT (lock_token) DO NOTHING")
+BOOKING_EXISTS = "SELECT 1 AS booked FROM bookings WHERE lock_token = $1"
+# Keyset pagination over the lock_token index (constant memory, no OFFSET scans)
+BOOKINGS_PAGE = (
+    "SELECT lock_token, group_id, room_type_code, stripe_session_id, amount_total_cents, "
+    "markup_cents, net_rate_cents FROM bookings WHERE lock_token > $1 "
+    "ORDER BY lock_token LIMIT $2")
+# Multi-group variant: IN lists are padded to a power of two so only a handful
+# of statement shapes (and prepared statements) ever exist
+MULTI_GROUP_BLOCKS = (
+    "SELECT g.id AS group_id, g.subdomain, ib.room_type_code, ib.total_allocated, "
+    "ib.total_booked FROM groups g LEFT JOIN inventory_blocks ib ON ib.group_id = g.id "
+    "WHERE g.subdomain IN ({keys}) OR CAST(g.id AS TEXT) IN ({ids}) "
+    "ORDER BY g.id, ib.room_type_code")
+UPSERT_GROUP = (
+    "INSERT INTO groups (id, agent_id, name, subdomain, event_date, status, city, theme) "
+    "VALUES ($1, $2, $3, $4, $5, $6, $7, $8) "
+    "ON CONFLICT (id) DO UPDATE SET name = excluded.name, subdomain = excluded.subdomain, "
+    "event_date = excluded.event_date, status = excluded.status, city = excluded.city, "
+    "theme = excluded.theme")
+UPSERT_BLOCK = (
+    "INSERT INTO inventory_blocks (id, group_id, tbo_hotel_id, room_type_code, "
+    "total_allocated, total_booked, rate, release_date) "
+    "VALUES ($1, $2, $3, $4, $5, $6, $7, $8) "
+    "ON CONFLICT (group_id, room_type_code) DO UPDATE SET "
+    "tbo_hotel_id = excluded.tbo_hotel_id, total_allocated = excluded.total_allocated, "
+    "total_booked = excluded.total_booked, rate = excluded.rate, "
+    "release_date = excluded.release_date")
+UPSERT_GUEST = (
+    "INSERT INTO guests (id, group_id, email, phone, origin_city, "
+    "apt1_cancellation_risk_score) VALUES ($1, $2, $3, $4, $5, $6) "
+    "ON CONFLICT (group_id, email) DO UPDATE SET "
+    "phone = COALESCE(excluded.phone, guests.phone), "
+    "origin_city = COALESCE(excluded.origin_city, guests.origin_city), "
+    "apt1_cancellation_risk_score = COALESCE(excluded.apt1_cancellation_risk_score, "
+    "guests.apt1_cancellation_risk_score)")
+
+
+class _SQLiteBackend:
+    """sqlite3 connections ($n -> ?n placeholders)."""
+
+    name = "sqlite"
+
+    def __init__(self, url: str):
+        path = url[len("sqlite:///"):] if url.startswith("sqlite:///") else url
+        if path in ("", ":memory:"):
+            # Pooled connections must share one in-memory database
+            self.target, self.uri = f"file:ancile-{uuid.uuid4().hex}?mode=memory&cache=shared", True
+        else:
+            self.target, self.uri = path, False
+
+    def connect(self):
+        """Opens one tuned connection."""
+        conn = sqlite3.connect(self.target, uri=self.uri, check_same_thread=False,
+                               cached_statements=256, isolation_level=None, timeout=5.0)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    @staticmethod
+    def translate(sql: str) -> str:
+        """Postgres $n placeholders -> SQLite ?n."""
+        return _PLACEHOLDER_RE.sub(r"?\1", sql)
+
+    @staticmethod
+    def begin(conn):
+        """Starts a write transaction (takes the write lock up front)."""
+        conn.execute("BEGIN IMMEDIATE")
+
+    @staticmethod
+    def apply_schema(conn, script: str):
+        """Runs the schema file."""
+        conn.executescript(script)
+
+
+class _PostgresBackend:
+    """psycopg 3 connections ($n -> %s placeholders, server-side prepared)."""
+
+    name = "postgresql"
+
+    def __init__(self, url: str):
+        if psycopg is None:
+            raise DatabaseException("PostgreSQL URL given but psycopg is not installed.")
+        self.url = url
+
+    def connect(self):
+        """Opens one connection that prepares every statement on first use."""
+        conn = psycopg.connect(self.url, autocommit=True, row_factory=dict_row)
+        conn.prepare_threshold = 0
+        return conn
+
+    @staticmethod
+    def translate(sql: str) -> str:
+        """Postgres $n placeholders -> psycopg %s (each $n is used once, in order)."""
+        numbers = [int(n) for n in _PLACEHOLDER_RE.findall(sql)]
+        if numbers != list(range(1, len(numbers) + 1)):
+            raise DatabaseException(f"Placeholders must appear in order once: {sql}")
+        return _PLACEHOLDER_RE.sub("%s", sql)
+
+    @staticmethod
+    def begin(conn):
+        """Starts a transaction."""
+        conn.execute("BEGIN")
+
+    @staticmethod
+    def apply_schema(conn, script: str):
+        """Runs the schema file."""
+        conn.execute(script)
+
+
+class Database:
+    """
+    Fixed-size connection pool with sync and async query helpers.
+    """
+
+    def __init__(self, url: str = DATABASE_URL, size: int = POOL_SIZE):
+        self.url = url
+        self.size = size
+        self.backend = _PostgresBackend(url) if url.startswith(("postgres://", "postgresql://")) \
+            else _SQLiteBackend(url)
+        self._idle: "queue.LifoQueue" = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+        self._sql_cache: Dict[str, str] = {}
+        self._executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="db")
+        self._keepalive = None
+        self._ready = False
+
+    # --- Pool ---
+
+    def _open(self):
+        """Opens a connection; the first one also bootstraps the schema."""
+        conn = self.backend.connect()
+        if not self._ready:
+            if self.backend.name == "sqlite" and self.backend.uri:
+                # Keep the shared in-memory database alive while the pool exists
+                self._keepalive = self.backend.connect()
+            if self.backend.name == "sqlite" or os.getenv("ANCILE_DB_BOOTSTRAP") == "1":
+                with open(SCHEMA_PATH, "r", encoding="utf-8") as f:
+                    self.backend.apply_schema(conn, f.read())
+            self._ready = True
+        return conn
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        """Borrows a pooled connection (opened lazily, up to `size`)."""
+        conn = None
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                if self._opened < self.size:
+                    conn = self._open()
+                    self._opened += 1
+            if conn is None:
+                try:
+                    conn = self._idle.get(timeout=POOL_TIMEOUT_SECONDS)
+                except queue.Empty as e:
+                    raise DatabaseUnavailable("Database pool exhausted.") from e
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+    def _sql(self, sql: str) -> str:
+        """Backend dialect of a query (translated once)."""
+        translated = self._sql_cache.get(sql)
+        if translated is None:
+            translated = self._sql_cache[sql] = self.backend.translate(sql)
+        return translated
+
+    @contextmanager
+    def transaction(self) -> Iterator[Any]:
+        """A pooled connection inside BEGIN ... COMMIT (ROLLBACK on error)."""
+        with self.connection() as conn:
+            self.backend.begin(conn)
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    # --- Sync API ---
+
+    def fetchone(self, sql: str, params: Sequence[Any] = ()) -> Optional[Dict[str, Any]]:
+        """First row as a dict, or None."""
+        with self.connection() as conn:
+            row = conn.execute(self._sql(sql), params).fetchone()
+        return dict(row) if row is not None else None
+
+    def fetchall(self, sql: str, params: Sequence[Any] = ()) -> List[Dict[str, Any]]:
+        """All rows as dicts."""
+        with self.connection() as conn:
+            rows = conn.execute(self._sql(sql), params).fetchall()
+        return [dict(row) for row in rows]
+
+    def execute(self, sql: str, params: Sequence[Any] = ()) -> int:
+        """Runs one statement; returns the affected row count."""
+        with self.connection() as conn:
+            return conn.execute(self._sql(sql), params).rowcount
+
+    def executemany(self, sql: str, rows: Iterable[Sequence[Any]]) -> int:
+        """Bulk path: BULK_CHUNK rows per transaction. Returns rows written."""
+        statement = self._sql(sql)
+        written = 0
+        chunk: List[Sequence[Any]] = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= BULK_CHUNK:
+                written += self._write_chunk(statement, chunk)
+                chunk = []
+        if chunk:
+            written += self._write_chunk(statement, chunk)
+        return written
+
+    def _write_chunk(self, statement: str, chunk: List[Sequence[Any]]) -> int:
+        """One transaction per chunk."""
+        with self.transaction() as conn:
+            conn.cursor().executemany(statement, chunk)
+        return len(chunk)
+
+    # --- Async API (pool executor, never the event loop) ---
+
+    async def _offload(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def afetchone(self, sql: str, params: Sequence[Any] = ()) -> Optional[Dict[str, Any]]:
+        """Async fetchone."""
+        return await self._offload(self.fetchone, sql, params)
+
+    async def afetchall(self, sql: str, params: Sequence[Any] = ()) -> List[Dict[str, Any]]:
+        """Async fetchall."""
+        return await self._offload(self.fetchall, sql, params)
+
+    async def aexecute(self, sql: str, params: Sequence[Any] = ()) -> int:
+        """Async execute."""
+        return await self._offload(self.execute, sql, params)
+
+    async def aexecutemany(self, sql: str, rows: Iterable[Sequence[Any]]) -> int:
+        """Async bulk write."""
+        return await self._offload(self.executemany, sql, list(rows))
+
+    def close(self):
+        """Closes idle connections and the executor."""
+        self._executor.shutdown(wait=False)
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        if self._keepalive is not None:
+            self._keepalive.close()
+
+
+database = Database()
+
+
+# --- Repository: the queries the backend actually runs ---
+
+_group_ids: Dict[str, str] = {}
+
+
+def _group_row(row: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Driver types -> JSON-friendly values."""
+    if row is not None and row.get("event_date") is not None:
+        row["event_date"] = str(row["event_date"])
+    return row
+
+
+def get_group(group_key: str, db: Database = None) -> Optional[Dict[str, Any]]:
+    """A 'groups' row by subdomain or id."""
+    db = db or database
+    row = db.fetchone(GROUP_BY_SUBDOMAIN, (group_key,))
+    if row is None and (db.backend.name == "sqlite" or _UUID_RE.match(group_key)):
+        row = db.fetchone(GROUP_BY_ID, (group_key,))
+    return _group_row(row)
+
+
+def resolve_group_id(group_key: str, db: Database = None) -> Optional[str]:
+    """Primary key for a group id or subdomain (memoized: ids never change)."""
+    group_id = _group_ids.get(group_key)
+    if group_id is None:
+        group = get_group(group_key, db)
+        if group is None:
+            return None
+        group_id = str(group["id"])
+        if len(_group_ids) >= GROUP_ID_CACHE_MAX:
+            _group_ids.clear()
+        _group_ids[group_key] = group_id
+    return group_id
+
+
+def get_inventory_blocks(group_key: str, db: Database = None) -> List[Dict[str, Any]]:
+    """All 'inventory_blocks' rows for a group."""
+    group_id = resolve_group_id(group_key, db)
+    if group_id is None:
+        return []
+    blocks = (db or database).fetchall(GROUP_BLOCKS, (group_id,))
+    for block in blocks:
+        block["rate"] = float(block["rate"])
+    return blocks
+
+
+def get_blocks_for_groups(group_keys: Sequence[str],
+                          db: Database = None) -> List[Dict[str, Any]]:
+    """
+    Blocks of many groups (ids or subdomains) in ONE query. Rows carry
+    group_id and subdomain so callers can map them back to their keys; a
+    group without blocks gets one row with room_type_code NULL.
+    """
+    if not group_keys:
+        return []
+    keys = list(dict.fromkeys(group_keys))
+    width = 1 << (len(keys) - 1).bit_length()
+    keys += [keys[-1]] * (width - len(keys))
+    sql = MULTI_GROUP_BLOCKS.format(
+        keys=", ".join(f"${i + 1}" for i in range(width)),
+        ids=", ".join(f"${width + i + 1}" for i in range(width)))
+    return (db or database).fetchall(sql, keys + keys)
+
+
+def get_block_counts(group_key: str, room_type: str,
+                     db: Database = None) -> Optional[Dict[str, int]]:
+    """total_allocated / total_booked of one block (None if it does not exist)."""
+    group_id = resolve_group_id(group_key, db)
+    if group_id is None:
+        return None
+    return (db or database).fetchone(BLOCK_COUNTS, (group_id, room_type))
+
+
+class _BlockFull(Exception):
+    """Rolls back a ledger row whose block turned out to be full."""
+
+
+def record_booking(group_key: str, room_type: str, db: Database = None,
+                   booking: Optional[Dict[str, Any]] = None) -> bool:
+    """
+    Books one room; False if the block is full (or missing).
+
+    With `booking` (lock_token plus the payment fields), the ledger row and
+    the total_booked increment are one transaction, and a lock_token that is
+    already booked is a no-op that returns True.
+    """
+    db = db or database
+    group_id = resolve_group_id(group_key, db)
+    if group_id is None:
+        return False
+    if booking is None:
+        return db.execute(RECORD_BOOKING, (group_id, room_type)) == 1
+    row = (str(uuid.uuid4()), group_id, room_type, booking["lock_token"],
+           booking.get("stripe_session_id"), booking.get("guest_email"),
+           booking.get("amount_total_cents"), booking.get("markup_cents"),
+           booking.get("net_rate_cents"))
+    insert, increment = db._sql(INSERT_BOOKING), db._sql(RECORD_BOOKING)  # pylint: disable=protected-access
+    try:
+        with db.transaction() as conn:
+            if conn.execute(insert, row).rowcount == 0:
+                return True  # Redelivered webhook: this hold is already booked
+            if conn.execute(increment, (group_id, room_type)).rowcount != 1:
+                raise _BlockFull()
+    except _BlockFull:
+        return False
+    return True
+
+
+def booking_exists(lock_token: str, db: Database = None) -> bool:
+    """Whether a hold has already been booked under this lock_token."""
+    return (db or database).fetchone(BOOKING_EXISTS, (lock_token,)) is not None
+
+
+def iter_bookings(page_size: int = BOOKINGS_PAGE_SIZE,
+                  db: Database = None) -> Iterator[Dict[str, Any]]:
+    """Every ledger row, in lock_token order, one page in memory at a time."""
+    db = db or database
+    cursor = ""
+    while True:
+        rows = db.fetchall(BOOKINGS_PAGE, (cursor, page_size))
+        yield from rows
+        if len(rows) < page_size:
+            return
+        cursor = rows[-1]["lock_token"]
+
+
+def _guest_row(group_id: str, guest: Dict[str, Any]) -> tuple:
+    """Parameter tuple for UPSERT_GUEST."""
+    return (guest.get("id") or str(uuid.uuid4()), group_id, guest["email"].strip().lower(),
+            guest.get("phone"), guest.get("origin_city"),
+            guest.get("apt1_cancellation_risk_score"))
+
+
+def upsert_guest(group_key: str, guest: Dict[str, Any], db: Database = None) -> bool:
+    """Inserts or updates one guest (keyed by group + email)."""
+    group_id = resolve_group_id(group_key, db)
+    if group_id is None:
+        return False
+    return (db or database).execute(UPSERT_GUEST, _guest_row(group_id, guest)) == 1
+
+
+def upsert_guests(group_key: str, guests: Iterable[Dict[str, Any]],
+                  db: Database = None) -> int:
+    """Bulk guest upsert; returns rows written."""
+    group_id = resolve_group_id(group_key, db)
+    if group_id is None:
+        return 0
+    return (db or database).executemany(
+        UPSERT_GUEST, (_guest_row(group_id, guest) for guest in guests))
+
+
+async def aupsert_guests(group_key: str, guests: Iterable[Dict[str, Any]],
+                         db: Database = None) -> int:
+    """Async bulk guest upsert."""
+    db = db or database
+    return await db._offload(upsert_guests, group_key, list(guests), db)  # pylint: disable=protected-access
+
+
+def seed_group(group_key: str, blocks: List[Dict[str, Any]], db: Database = None,
+               **fields) -> str:
+    """
+    Creates or replaces a group and its blocks (local seed data, benchmarks).
+    On SQLite the key doubles as the id; on Postgres a stable UUID is derived.
+    """
+    db = db or database
+    group_id = fields.get("id") or (
+        group_key if db.backend.name == "sqlite"
+        else str(uuid.uuid5(uuid.NAMESPACE_URL, f"ancile:{group_key}")))
+    db.execute(UPSERT_GROUP, (
+        group_id, fields.get("agent_id", str(uuid.UUID(int=0))),
+        fields.get("name", group_key), fields.get("subdomain", group_key),
+        fields.get("event_date", "2026-12-12"), fields.get("status", "ACTIVE"),
+        fields.get("city"), fields.get("theme", "dark_modern")))
+    db.executemany(UPSERT_BLOCK, (
+        (str(uuid.uuid5(uuid.NAMESPACE_URL, f"ancile:{group_id}:{b['room_type_code']}")),
+         group_id, b.get("tbo_hotel_id", "TBO-LOCAL"), b["room_type_code"],
+         b["total_allocated"], b.get("total_booked", 0), b.get("rate", 0.0),
+         b.get("release_date", "2026-11-12"))
+        for b in blocks))
+    _group_ids.pop(group_key, None)
+    return group_id
+
+
+# Local development data (seeded into an empty SQLite database)
+LOCAL_SEED: Dict[str, Dict[str, Any]] = {
+    "demo": {
+        "group": {"name": "Demo Wedding", "event_date": "2026-12-12", "city": "Bali",
+                  "theme": "dark_modern"},
+        "blocks": [
+            {"room_type_code": "DELUXE_OCEAN", "tbo_hotel_id": "TBO-1001",
+             "total_allocated": 50, "total_booked": 38, "rate": 250.00},
+            {"room_type_code": "STANDARD_GARDEN", "tbo_hotel_id": "TBO-1001",
+             "total_allocated": 30, "total_booked": 25, "rate": 180.00},
+        ]
+    }
+}
+
+
+def seed_local_data(db: Database = None) -> bool:
+    """Seeds LOCAL_SEED into an empty SQLite database."""
+    db = db or database
+    if db.backend.name != "sqlite" or db.fetchone("SELECT id FROM groups LIMIT 1"):
+        return False
+    for key, seed in LOCAL_SEED.items():
+        seed_group(key, seed["blocks"], db, **seed["group"])
+    logger.info("Seeded local database with %d demo group(s).", len(LOCAL_SEED))
+    return True
+
+
+if __name__ == "__main__":
+    # python -m backend.db seed  -> demo group(s) into an empty SQLite database
+    if sys.argv[1:] != ["seed"]:
+        sys.exit("usage: python -m backend.db seed")
+    print("Seeded." if seed_local_data() else "Nothing to seed (not SQLite, or not empty).")
@@ -0,0 +1,328 @@
+"""
+Demand Heatmap Aggregator
+-------------------------
+Streaming aggregation of booking-initiation and hold events into rolling,
+time-bucketed windows per (city, group, room type) and per city.
+
+- Each series is a compact ring buffer (array of uint32, one slot per bucket)
+  with a running total, so ingest is O(1) and expiry is amortized O(1).
+- /api/analytics/heatmap reads a precomputed per-city rollup: O(cities).
+- Each worker periodically snapshots its rings to Redis. Snapshots restore the
+  window after a restart, and peers' snapshots are merged into the rollup so
+  every worker serves the cluster-wide picture.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import redis
+
+from backend.fast_json import dumps
+from backend.inventory_defense import _get_db_group, redis_client
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+BUCKET_SECONDS = 60
+WINDOW_BUCKETS = 60          # 60 x 1 min = rolling 1 hour
+SNAPSHOT_INTERVAL_SECONDS = 30.0
+ROLLUP_TTL_SECONDS = 2.0
+SNAPSHOT_KEY_PREFIX = "heatmap:snapshot"
+# Memory bounds: block rings kept per worker, and memoized group -> city entries
+MAX_TRACKED_BLOCKS = 20000
+GROUP_CITY_CACHE_SIZE = 4096
+
+# Series stored per ring
+INITIATIONS, HOLDS = 0, 1
+SERIES = 2
+# Holds weigh more than page-level booking attempts
+HOLD_WEIGHT = 3
+
+# demand_score thresholds -> status (highest first)
+STATUS_THRESHOLDS = ((500, "Critical"), (150, "High"), (30, "Elevated"), (0, "Normal"))
+UNKNOWN_CITY = "Unknown"
+
+
+class _Ring:
+    """Rolling window of SERIES counters, one slot per time bucket."""
+
+    __slots__ = ("counts", "totals", "epoch")
+
+    def __init__(self, epoch: int):
+        self.counts = array("I", bytes(4 * SERIES * WINDOW_BUCKETS))
+        self.totals = [0] * SERIES
+        self.epoch = epoch
+
+    def advance(self, epoch: int):
+        """Expires buckets that fell out of the window."""
+        if epoch <= self.epoch:
+            return
+        steps = min(epoch - self.epoch, WINDOW_BUCKETS)
+        for step in range(1, steps + 1):
+            base = ((self.epoch + step) % WINDOW_BUCKETS) * SERIES
+            for series in range(SERIES):
+                self.totals[series] -= self.counts[base + series]
+                self.counts[base + series] = 0
+        self.epoch = epoch
+
+    def add(self, epoch: int, series: int, amount: int = 1):
+        """Counts an event in the current bucket."""
+        self.advance(epoch)
+        self.counts[(epoch % WINDOW_BUCKETS) * SERIES + series] += amount
+        self.totals[series] += amount
+
+    def to_state(self) -> Dict[str, Any]:
+        """Serializable form for snapshots."""
+        return {"epoch": self.epoch, "counts": self.counts.tolist()}
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> "_Ring":
+        """Rebuilds a ring from a snapshot."""
+        ring = cls(state["epoch"])
+        ring.counts = array("I", state["counts"])
+        for series in range(SERIES):
+            ring.totals[series] = sum(ring.counts[series::SERIES])
+        return ring
+
+
+def demand_status(score: int) -> str:
+    """Maps a demand score onto the dashboard status label."""
+    for threshold, label in STATUS_THRESHOLDS:
+        if score >= threshold:
+            return label
+    return STATUS_THRESHOLDS[-1][1]
+
+
+class DemandAggregator:
+    """
+    In-process streaming aggregator behind the demand heatmap.
+    """
+
+    def __init__(self, client=None, worker_id: Optional[str] = None,
+                 clock=time.time):
+        self.client = client if client is not None else redis_client
+        # A stable ANCILE_WORKER_ID lets a restarted worker resume its window
+        self.worker_id = worker_id or os.getenv("ANCILE_WORKER_ID") or \
+            f"{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.clock = clock
+        self.blocks: Dict[Tuple[str, str, str], _Ring] = {}
+        self.cities: Dict[str, _Ring] = {}
+        self._city_of_group: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._pruned_epoch = -1
+        self.untracked = 0  # Events past MAX_TRACKED_BLOCKS (counted per city only)
+        self._rollup: Optional[Dict[str, Any]] = None
+        self._rollup_at = 0.0
+        self._rollup_body: Optional[Tuple[Dict[str, Any], bytes]] = None
+        self._peer_cities: Dict[str, List[int]] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def _epoch(self) -> int:
+        """Current bucket number."""
+        return int(self.clock() // BUCKET_SECONDS)
+
+    def _city(self, group_id: str) -> str:
+        """Destination city of a group (LRU-memoized; unknown groups are not)."""
+        with self._lock:
+            city = self._city_of_group.get(group_id)
+            if city is not None:
+                self._city_of_group.move_to_end(group_id)
+                return city
+        group = _get_db_group(group_id)
+        if group is None:
+            return UNKNOWN_CITY
+        city = group.get("city") or UNKNOWN_CITY
+        with self._lock:
+            self._city_of_group[group_id] = city
+            if len(self._city_of_group) > GROUP_CITY_CACHE_SIZE:
+                self._city_of_group.popitem(last=False)
+        return city
+
+    def record(self, group_id: str, room_type: str, series: int, amount: int = 1):
+        """Ingests one event."""
+        epoch = self._epoch()
+        city = self._city(group_id)
+        key = (city, group_id, room_type)
+        with self._lock:
+            ring = self.blocks.get(key)
+            if ring is None and len(self.blocks) >= MAX_TRACKED_BLOCKS \
+                    and self._pruned_epoch != epoch:
+                self._pruned_epoch = epoch
+                self._prune(epoch)
+            if ring is None and len(self.blocks) < MAX_TRACKED_BLOCKS:
+                ring = self.blocks[key] = _Ring(epoch)
+            if ring is not None:
+                ring.add(epoch, series, amount)
+            else:
+                self.untracked += 1
+            city_ring = self.cities.get(city)
+            if city_ring is None:
+                city_ring = self.cities[city] = _Ring(epoch)
+            city_ring.add(epoch, series, amount)
+
+    def record_initiation(self, group_id: str, room_type: str):
+        """A guest started a booking."""
+        self.record(group_id, room_type, INITIATIONS)
+
+    def record_hold(self, group_id: str, room_type: str):
+        """A room hold was granted."""
+        self.record(group_id, room_type, HOLDS)
+
+    def city_totals(self) -> Dict[str, List[int]]:
+        """Rolling per-city totals (this worker only)."""
+        epoch = self._epoch()
+        with self._lock:
+            totals = {}
+            for city, ring in self.cities.items():
+                ring.advance(epoch)
+                totals[city] = list(ring.totals)
+            return totals
+
+    def rollup(self) -> Dict[str, Any]:
+        """Precomputed cluster-wide heatmap; rebuilt at most every ROLLUP_TTL_SECONDS."""
+        now = time.monotonic()
+        if self._rollup is not None and now - self._rollup_at < ROLLUP_TTL_SECONDS:
+            return self._rollup
+
+        merged = self.city_totals()
+        for city, totals in self._peer_cities.items():
+            current = merged.setdefault(city, [0] * SERIES)
+            for series in range(SERIES):
+                current[series] += totals[series]
+
+        regions = []
+        for city, totals in merged.items():
+            score = totals[INITIATIONS] + HOLD_WEIGHT * totals[HOLDS]
+            if score == 0:
+                continue
+            regions.append({
+                "city": city,
+                "demand_score": score,
+                "status": demand_status(score),
+                "initiations": totals[INITIATIONS],
+                "holds": totals[HOLDS]
+            })
+        regions.sort(key=lambda r: r["demand_score"], reverse=True)
+        self._rollup = {
+            "regions": regions,
+            "window_seconds": BUCKET_SECONDS * WINDOW_BUCKETS,
+            "generated_at": round(self.clock(), 3)
+        }
+        self._rollup_at = now
+        return self._rollup
+
+    def rollup_body(self) -> bytes:
+        """rollup() as JSON bytes, serialized once per rebuild."""
+        rollup = self.rollup()
+        cached = self._rollup_body
+        if cached is None or cached[0] is not rollup:
+            cached = self._rollup_body = (rollup, dumps(rollup))
+        return cached[1]
+
+    def breakdown(self, city: str) -> List[Dict[str, Any]]:
+        """Per (group, room type) drill-down for one city (this worker only)."""
+        epoch = self._epoch()
+        rows = []
+        with self._lock:
+            for (ring_city, group_id, room_type), ring in self.blocks.items():
+                if ring_city != city:
+                    continue
+                ring.advance(epoch)
+                rows.append({
+                    "group_id": group_id,
+                    "room_type": room_type,
+                    "initiations": ring.totals[INITIATIONS],
+                    "holds": ring.totals[HOLDS]
+                })
+        rows.sort(key=lambda r: r["initiations"] + HOLD_WEIGHT * r["holds"], reverse=True)
+        return rows
+
+    # --- Redis snapshots ---
+
+    def _prune(self, epoch: int):
+        """Drops rings whose whole window has expired (caller holds the lock)."""
+        for rings in (self.blocks, self.cities):
+            for ring in rings.values():
+                ring.advance(epoch)
+            for key in [k for k, ring in rings.items() if not any(ring.totals)]:
+                del rings[key]
+
+    def snapshot(self):
+        """Writes this worker's rings to Redis and refreshes peer totals."""
+        epoch = self._epoch()
+        with self._lock:
+            self._prune(epoch)
+            state = {
+                "worker": self.worker_id,
+                "epoch": epoch,
+                "cities": {city: ring.to_state() for city, ring in self.cities.items()},
+                "blocks": [[*key, ring.to_state()] for key, ring in self.blocks.items()]
+            }
+        key = f"{SNAPSHOT_KEY_PREFIX}:{self.worker_id}"
+        self.client.set(key, json.dumps(state), ex=int(SNAPSHOT_INTERVAL_SECONDS * 4))
+        self._peer_cities = self._load_peer_cities(epoch)
+
+    def _load_peer_cities(self, epoch: int) -> Dict[str, List[int]]:
+        """Rolling city totals from other workers' live snapshots."""
+        peers: Dict[str, List[int]] = {}
+        for key in self.client.scan_iter(match=f"{SNAPSHOT_KEY_PREFIX}:*"):
+            if key.endswith(f":{self.worker_id}"):
+                continue
+            raw = self.client.get(key)
+            if not raw:
+                continue
+            for city, ring_state in json.loads(raw)["cities"].items():
+                ring = _Ring.from_state(ring_state)
+                ring.advance(epoch)
+                current = peers.setdefault(city, [0] * SERIES)
+                for series in range(SERIES):
+                    current[series] += ring.totals[series]
+        return peers
+
+    def restore(self) -> bool:
+        """Reloads this worker's last snapshot (e.g. after a restart)."""
+        raw = self.client.get(f"{SNAPSHOT_KEY_PREFIX}:{self.worker_id}")
+        if not raw:
+            return False
+        state = json.loads(raw)
+        with self._lock:
+            self.cities = {city: _Ring.from_state(s) for city, s in state["cities"].items()}
+            self.blocks = {(c, g, r): _Ring.from_state(s) for c, g, r, s in state["blocks"]}
+        return True
+
+    def start(self):
+        """Restores the last snapshot and starts the snapshot thread (idempotent)."""
+        if self._thread and self._thread.is_alive():
+            return
+        try:
+            if self.restore():
+                logger.info("Heatmap window restored for worker %s", self.worker_id)
+        except (redis.RedisError, ValueError) as e:
+            logger.error("Heatmap restore failed: %s", e)
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="heatmap-snapshot", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the snapshot thread."""
+        self._stop.set()
+
+    def _run(self):
+        """Snapshot loop."""
+        while not self._stop.wait(SNAPSHOT_INTERVAL_SECONDS):
+            try:
+                self.snapshot()
+            except (redis.RedisError, ValueError) as e:
+                logger.error("Heatmap snapshot failed: %s", e)
+
+
+demand_aggregator = DemandAggregator()
@@ -0,0 +1,73 @@
+"""
+Fast JSON Responses
+-------------------
+One serializer for every JSON body the API produces: orjson when installed
+(several times faster than the stdlib and emits bytes directly), compact stdlib
+json otherwise.
+
+- FastJSONResponse: the app's default response class. Handlers on hot paths
+  return it directly, which also skips FastAPI's jsonable_encoder pass.
+- dumps(): for payloads that are serialized once and cached as bytes
+  (microsite config, heatmap rollup, availability snapshot).
+- StaticJSON: a body that never changes after startup, serialized once.
+"""
+
+import datetime
+import decimal
+import json
+from typing import Any, Dict, Optional
+
+from fastapi.responses import JSONResponse, Response
+
+try:
+    import orjson  # Optional: pip install orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+JSON_MEDIA_TYPE = "application/json"
+
+
+def _default(obj: Any) -> Any:
+    """Types neither serializer handles natively."""
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    if isinstance(obj, (datetime.date, datetime.datetime)):
+        return obj.isoformat()
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+    def dumps(content: Any) -> bytes:
+        """Compact UTF-8 JSON bytes."""
+        return orjson.dumps(content, default=_default, option=_ORJSON_OPTIONS)
+else:
+    def dumps(content: Any) -> bytes:
+        """Compact UTF-8 JSON bytes."""
+        return json.dumps(content, default=_default, ensure_ascii=False,
+                          separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with dumps()."""
+
+    media_type = JSON_MEDIA_TYPE
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class StaticJSON:
+    """A JSON body serialized once and served as bytes."""
+
+    def __init__(self, content: Any):
+        self.body = dumps(content)
+
+    def response(self, headers: Optional[Dict[str, str]] = None) -> Response:
+        """A response carrying the cached bytes."""
+        return Response(content=self.body, media_type=JSON_MEDIA_TYPE, headers=headers)
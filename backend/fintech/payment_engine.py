@@ -12,7 +12,7 @@ Logic:
 
 import logging
 import os
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 
 import stripe
 
@@ -47,7 +47,8 @@ class PaymentProcessor:
         total_amount_cents: int,  # $250.00 -> 25000
         agent_connect_id: str,   # The Agent's Stripe Account ID (acct_...)
         markup_cents: int,       # $50.00 -> 5000 (Agent's Profit)
-        currency: str = "usd"
+        currency: str = "usd",
+        booking_metadata: Optional[Dict[str, str]] = None
     ) -> Dict[str, Any]:
         """
         Creates a Stripe Checkout Session with split payments.
@@ -56,6 +57,8 @@ class PaymentProcessor:
             total_amount_cents: Total charged to guest (e.g., 25000).
             markup_cents: The amount transfered to the agent (e.g., 5000).
             agent_connect_id: The destination connected account for the markup.
+            booking_metadata: group_id / room_type / lock_token of the held room,
+                echoed back by the webhook so the hold can be committed.
 
         Returns:
             JSON with checkout_url and session_id.
@@ -119,7 +122,8 @@ class PaymentProcessor:
                 metadata={
                     "type": "hotel_booking",
                     "markup": markup_cents,
-                    "net_rate_held": total_amount_cents - markup_cents
+                    "net_rate_held": total_amount_cents - markup_cents,
+                    **(booking_metadata or {})
                 }
             )
 
@@ -137,6 +141,10 @@ class PaymentProcessor:
         """
         Handles 'checkout.session.completed' to confirm payment and trigger
         DB/Redis commitment.
+
+        Returns:
+            The completed session object (truthy) so the caller can commit the
+            hold referenced in its metadata, or False for ignored events.
         """
         event = None
         try:
@@ -151,10 +159,46 @@ class PaymentProcessor:
             ) from exc
 
         if event['type'] == 'checkout.session.completed':
-            session = event['data']['object']
-            # Commit the lock (Redis -> SQL) - Mechanism to be implemented in integration phase
+            session = _plain(event['data']['object'])
+            # Commit the lock (Redis -> SQL) is done by the caller from session metadata
             logger.info(
                 "Payment Successful for Session: %s. Triggering Inventory Commit.", session['id'])
-            return True
+            return session
 
         return False
+
+    @staticmethod
+    def session_payment(session: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Booking and split fields of a completed checkout session, as written
+        to the bookings ledger and checked by reconciliation. Stripe returns
+        metadata values as strings; amounts come back as int cents (None if
+        absent or unparseable).
+        """
+        session = _plain(session)
+        metadata = session.get("metadata") or {}
+        return {
+            "stripe_session_id": session.get("id"),
+            "lock_token": metadata.get("lock_token"),
+            "group_id": metadata.get("group_id"),
+            "room_type": metadata.get("room_type"),
+            "booking_type": metadata.get("type"),
+            "guest_email": session.get("customer_email")
+            or (session.get("customer_details") or {}).get("email"),
+            "amount_total_cents": _cents(session.get("amount_total")),
+            "markup_cents": _cents(metadata.get("markup")),
+            "net_rate_cents": _cents(metadata.get("net_rate_held")),
+        }
+
+
+def _plain(obj: Any) -> Any:
+    """StripeObject -> dict (recent stripe-python objects are not dicts)."""
+    return obj.to_dict() if hasattr(obj, "to_dict") else obj
+
+
+def _cents(value: Any) -> Optional[int]:
+    """Integer cents from a Stripe amount or metadata string."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,470 @@
+"""
+Payment Reconciliation
+----------------------
+Checks every `checkout.session.completed` Stripe event against the bookings
+ledger and the live holds in Redis, and reports:
+
+- split_error:       markup / net_rate_held metadata missing, negative, or not
+                     adding up to amount_total;
+- mismatch:          the event and its booking disagree (group, room type,
+                     session or amounts);
+- missing_booking:   paid, but never committed and the hold has expired
+                     (the guest paid and has no room);
+- orphaned_hold:     paid and the hold is still live: never committed (the
+                     webhook failed), or committed without the hold being
+                     dropped (the room is counted twice);
+- duplicate_payment: a second completed session for an already-paid hold;
+- unpaid_booking:    a booked hold with no completed session in the export;
+- unattributed:      a hotel_booking session without a lock_token.
+
+Memory stays constant whatever the export size (a partitioned hash join):
+
+1. Events are streamed page by page from the source and appended to one of
+   `partitions` spill files by hash(lock_token). The source cursor and the
+   spill file sizes are checkpointed every CHECKPOINT_PAGES pages; a restarted
+   run truncates the files back to the checkpoint and resumes at the cursor.
+2. Bookings (keyset-paged over the lock_token index) and live holds (a SCAN
+   of the holds ZSETs) are spilled the same way.
+3. Partitions are joined one at a time: its bookings and holds are loaded into
+   dicts (the hash indexes) and its events streamed past them. Peak memory is
+   one partition, i.e. ~(events + bookings) / partitions rows.
+
+Sources: StripeEventSource (Events API, `starting_after` paging; Stripe only
+keeps 30 days of events) and ExportFileSource (a JSON-lines export, one event
+per line; also the local stand-in for tests and benchmarks).
+
+Run it after the webhook backlog has drained: a session paid seconds ago may
+legitimately still hold its room.
+
+Usage:
+    python -m backend.fintech.reconciliation --export events.jsonl
+    python -m backend.fintech.reconciliation --stripe --run-dir reconciliation_runs/nightly
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import time
+import zlib
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import stripe
+
+from backend import db, inventory_defense
+from backend.fast_json import dumps, orjson
+from backend.fintech.payment_engine import PaymentProcessor
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+RECONCILIATION_DIR = os.getenv("ANCILE_RECONCILIATION_DIR",
+                               os.path.join(ROOT_DIR, "reconciliation_runs"))
+PARTITIONS = int(os.getenv("ANCILE_RECONCILIATION_PARTITIONS", "64"))
+PAGE_SIZE = 100  # Stripe's maximum list page
+CHECKPOINT_PAGES = 50
+HOLDS_SCAN_MATCH = "inv:*:holds"
+COMPLETED = "checkout.session.completed"
+
+# Issue kinds
+SPLIT_ERROR = "split_error"
+MISMATCH = "mismatch"
+MISSING_BOOKING = "missing_booking"
+ORPHANED_HOLD = "orphaned_hold"
+DUPLICATE_PAYMENT = "duplicate_payment"
+UNPAID_BOOKING = "unpaid_booking"
+UNATTRIBUTED = "unattributed"
+
+EVENTS, BOOKINGS, HOLDS = "events", "bookings", "holds"
+_loads = orjson.loads if orjson is not None else json.loads
+
+
+class ReconciliationException(Exception):
+    """The run directory does not belong to this source / configuration."""
+
+
+class ExportFileSource:
+    """Stripe events from a JSON-lines export; the cursor is a byte offset."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.name = f"export:{os.path.abspath(path)}"
+        self._file = None
+
+    def page(self, cursor: Optional[int], limit: int) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """Up to `limit` events from `cursor`, and the next cursor (None at the end)."""
+        if self._file is None:
+            self._file = open(self.path, "rb")  # pylint: disable=consider-using-with
+        if self._file.tell() != (cursor or 0):
+            self._file.seek(cursor or 0)
+        events = []
+        while len(events) < limit:
+            line = self._file.readline()
+            if not line:
+                return events, None
+            if line.strip():
+                events.append(_loads(line))
+        return events, self._file.tell()
+
+    def close(self):
+        """Closes the export file."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class StripeEventSource:
+    """Completed checkout sessions from the Stripe Events API; the cursor is an event id."""
+
+    def __init__(self, created_gte: Optional[int] = None):
+        self.created_gte = created_gte
+        self.name = f"stripe:{COMPLETED}:{created_gte or 0}"
+
+    def page(self, cursor: Optional[str], limit: int) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """One list page, and the id to continue after (None at the end)."""
+        params: Dict[str, Any] = {"type": COMPLETED, "limit": limit}
+        if cursor:
+            params["starting_after"] = cursor
+        if self.created_gte:
+            params["created"] = {"gte": self.created_gte}
+        page = stripe.Event.list(**params)
+        events = [event.to_dict() for event in page.data]
+        return events, (events[-1]["id"] if events and page.has_more else None)
+
+    def close(self):
+        """Nothing to release."""
+
+
+def split_problems(amount: Optional[int], markup: Optional[int],
+                   net: Optional[int]) -> List[str]:
+    """What is wrong with a session's split metadata (empty if it adds up)."""
+    if markup is None or net is None:
+        return ["markup / net_rate_held metadata missing"]
+    if markup < 0 or net < 0:
+        return [f"negative split: markup {markup}, net {net}"]
+    if amount is not None and markup + net != amount:
+        return [f"markup {markup} + net {net} != amount_total {amount}"]
+    if amount is not None and markup >= amount:
+        return [f"markup {markup} >= amount_total {amount}"]
+    return []
+
+
+class Reconciler:
+    """
+    One reconciliation run in `run_dir` (spill files, checkpoint, report).
+    Running it again on the same directory resumes where it stopped.
+    """
+
+    def __init__(self, source, run_dir: Optional[str] = None, partitions: int = PARTITIONS,
+                 database: Optional[db.Database] = None, client=None):
+        self.source = source
+        self.run_dir = run_dir or os.path.join(RECONCILIATION_DIR, "current")
+        self.partitions = partitions
+        self.database = database or db.database
+        self.client = client
+        self.state: Dict[str, Any] = {}
+        self._report = None
+        self._groups: Dict[str, str] = {}
+
+    # --- Files ---
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.run_dir, name)
+
+    def _spill_path(self, kind: str, partition: int) -> str:
+        return self._path(f"{kind}-{partition:03d}.jsonl")
+
+    def _partition(self, token: str) -> int:
+        return zlib.crc32(token.encode("utf-8")) % self.partitions
+
+    def _open_spills(self, kind: str, sizes: Optional[List[int]] = None) -> List[Any]:
+        """Spill files of one kind, truncated to `sizes` (empty if None)."""
+        files = []
+        for partition in range(self.partitions):
+            f = open(self._spill_path(kind, partition), "ab")  # pylint: disable=consider-using-with
+            f.truncate(sizes[partition] if sizes else 0)
+            f.seek(0, os.SEEK_END)
+            files.append(f)
+        return files
+
+    @staticmethod
+    def _sync(files: List[Any]) -> List[int]:
+        """Flushes and fsyncs spill files; returns their sizes."""
+        sizes = []
+        for f in files:
+            f.flush()
+            os.fsync(f.fileno())
+            sizes.append(f.tell())
+        return sizes
+
+    def _read(self, kind: str, partition: int) -> Iterator[List[Any]]:
+        path = self._spill_path(kind, partition)
+        if not os.path.exists(path):
+            return
+        with open(path, "rb") as f:
+            for line in f:
+                yield _loads(line)
+
+    def _save_state(self, **changes):
+        """Syncs the report and atomically replaces the checkpoint."""
+        self._report.flush()
+        os.fsync(self._report.fileno())
+        self.state.update(changes, report_size=self._report.tell())
+        tmp = self._path("checkpoint.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._path("checkpoint.json"))
+
+    def _load_state(self):
+        path = self._path("checkpoint.json")
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.state = json.load(f)
+            if self.state["source"] != self.source.name or \
+                    self.state["partitions"] != self.partitions:
+                raise ReconciliationException(
+                    f"{self.run_dir} holds a run of {self.state['source']} "
+                    f"({self.state['partitions']} partitions).")
+            return
+        self.state = {
+            "source": self.source.name, "partitions": self.partitions, "phase": EVENTS,
+            "cursor": None, "pages": 0, "spill_sizes": None, "report_size": 0,
+            "next_partition": 0, "started_at": time.time(), "finished_at": None,
+            "counts": {}, "cents": {"paid": 0, "matched": 0, "at_risk": 0},
+        }
+
+    # --- Helpers ---
+
+    def _group_id(self, key: Optional[str]) -> Optional[str]:
+        """Ledger group id of a metadata / hold group key (the key itself if unknown)."""
+        if not key:
+            return key
+        group_id = self._groups.get(key)
+        if group_id is None:
+            group_id = self._groups[key] = db.resolve_group_id(key, self.database) or key
+        return group_id
+
+    def _count(self, name: str, n: int = 1):
+        counts = self.state["counts"]
+        counts[name] = counts.get(name, 0) + n
+
+    def _issue(self, kind: str, amount: Optional[int] = None, **fields):
+        """Appends one finding to the report (see _at_risk for the cents)."""
+        self._count(kind)
+        self._report.write(dumps({"kind": kind, "amount_total_cents": amount, **fields}) + b"\n")
+
+    def _at_risk(self, amount: Optional[int]):
+        """Adds one payment or booking to the at-risk total; once, however many findings."""
+        self.state["cents"]["at_risk"] += amount or 0
+
+    # --- Phases ---
+
+    def _spill_events(self):
+        """Phase 1: source pages -> event partitions (checkpointed)."""
+        files = self._open_spills(EVENTS, self.state["spill_sizes"])
+        cursor, pages = self.state["cursor"], self.state["pages"]
+        try:
+            while True:
+                events, cursor = self.source.page(cursor, PAGE_SIZE)
+                pages += 1
+                for event in events:
+                    self._spill_event(event, files)
+                if cursor is None:
+                    break
+                if pages % CHECKPOINT_PAGES == 0:
+                    self._save_state(cursor=cursor, pages=pages, spill_sizes=self._sync(files))
+            self._save_state(phase=BOOKINGS, cursor=None, pages=pages,
+                             spill_sizes=self._sync(files))
+        finally:
+            for f in files:
+                f.close()
+
+    def _spill_event(self, event: Dict[str, Any], files: List[Any]):
+        self._count("events")
+        if event.get("type") != COMPLETED:
+            return
+        payment = PaymentProcessor.session_payment(event["data"]["object"])
+        token = payment["lock_token"]
+        if not token:
+            if payment["booking_type"] == "hotel_booking":
+                self._issue(UNATTRIBUTED, payment["amount_total_cents"],
+                            stripe_session_id=payment["stripe_session_id"],
+                            event_id=event.get("id"))
+                self._at_risk(payment["amount_total_cents"])
+            else:
+                self._count("ignored")
+            return
+        self._count("sessions")
+        self.state["cents"]["paid"] += payment["amount_total_cents"] or 0
+        files[self._partition(token)].write(dumps([
+            token, payment["stripe_session_id"], self._group_id(payment["group_id"]),
+            payment["room_type"], payment["amount_total_cents"], payment["markup_cents"],
+            payment["net_rate_cents"], event.get("id")]) + b"\n")
+
+    def _spill_bookings(self):
+        """Phase 2: bookings ledger -> booking partitions (cheap, redone on restart)."""
+        files = self._open_spills(BOOKINGS)
+        try:
+            for row in db.iter_bookings(db=self.database):
+                self._count("bookings")
+                files[self._partition(row["lock_token"])].write(dumps([
+                    row["lock_token"], str(row["group_id"]), row["room_type_code"],
+                    row["stripe_session_id"], row["amount_total_cents"], row["markup_cents"],
+                    row["net_rate_cents"]]) + b"\n")
+            self._sync(files)
+        finally:
+            for f in files:
+                f.close()
+        self._save_state(phase=HOLDS)
+
+    def _spill_holds(self):
+        """Phase 3: live holds (every holds ZSET) -> hold partitions."""
+        client = self.client or inventory_defense.redis_client
+        files = self._open_spills(HOLDS)
+        now_ms = time.time() * 1000
+        try:
+            for key in client.scan_iter(match=HOLDS_SCAN_MATCH):
+                block = inventory_defense.parse_holds_key(key)
+                if block is None:
+                    continue
+                group_id = self._group_id(block[0])
+                for token in client.zrangebyscore(key, now_ms, "+inf"):
+                    self._count("live_holds")
+                    files[self._partition(token)].write(
+                        dumps([token, group_id, block[1]]) + b"\n")
+            self._sync(files)
+        finally:
+            for f in files:
+                f.close()
+        self._save_state(phase="join")
+
+    def _join(self):
+        """Phase 4: one partition at a time, checkpointed after each."""
+        for partition in range(self.state["next_partition"], self.partitions):
+            self._join_partition(partition)
+            self._save_state(next_partition=partition + 1)
+        self._save_state(phase="done", finished_at=time.time())
+
+    def _join_partition(self, partition: int):
+        bookings = {row[0]: row for row in self._read(BOOKINGS, partition)}
+        holds = {row[0] for row in self._read(HOLDS, partition)}
+        paid = set()
+        for token, session_id, group_id, room_type, amount, markup, net, event_id in \
+                self._read(EVENTS, partition):
+            where = {"lock_token": token, "stripe_session_id": session_id,
+                     "group_id": group_id, "room_type": room_type}
+            if token in paid:
+                self._issue(DUPLICATE_PAYMENT, amount, event_id=event_id,
+                            detail="second completed session for one hold", **where)
+                self._at_risk(amount)
+                continue
+            paid.add(token)
+            clean = True
+            for problem in split_problems(amount, markup, net):
+                self._issue(SPLIT_ERROR, amount, detail=problem, **where)
+                clean = False
+
+            booking = bookings.get(token)
+            if booking is None:
+                if token in holds:
+                    self._issue(ORPHANED_HOLD, amount, **where,
+                                detail="paid, never committed, hold still live")
+                else:
+                    self._issue(MISSING_BOOKING, amount, **where,
+                                detail="paid, never committed, hold expired")
+                self._at_risk(amount)
+                continue
+
+            _, b_group, b_room, b_session, b_amount, b_markup, b_net = booking
+            diffs = [f"{name}: event {ours!r} != booking {theirs!r}"
+                     for name, ours, theirs in (
+                         ("group_id", group_id, b_group), ("room_type", room_type, b_room),
+                         ("stripe_session_id", session_id, b_session),
+                         ("amount_total_cents", amount, b_amount),
+                         ("markup_cents", markup, b_markup), ("net_rate_cents", net, b_net))
+                     if ours is not None and theirs is not None and ours != theirs]
+            if diffs:
+                self._issue(MISMATCH, amount, detail="; ".join(diffs), **where)
+                clean = False
+            if token in holds:
+                self._issue(ORPHANED_HOLD, amount, **where,
+                            detail="booked but hold still live (room counted twice)")
+                clean = False
+            if clean:
+                self._count("matched")
+                self.state["cents"]["matched"] += amount or 0
+            else:
+                self._at_risk(amount)
+
+        for token, b_group, b_room, b_session, b_amount, _, _ in bookings.values():
+            if token not in paid:
+                self._issue(UNPAID_BOOKING, b_amount, lock_token=token,
+                            stripe_session_id=b_session, group_id=b_group, room_type=b_room,
+                            detail="booked with no completed session in the export")
+                self._at_risk(b_amount)
+
+    # --- Entry point ---
+
+    def run(self) -> Dict[str, Any]:
+        """Runs (or resumes) the reconciliation; returns the summary."""
+        os.makedirs(self.run_dir, exist_ok=True)
+        self._load_state()
+        self._report = open(self._path("report.jsonl"), "ab")  # pylint: disable=consider-using-with
+        self._report.truncate(self.state["report_size"])
+        self._report.seek(0, os.SEEK_END)
+        started = time.perf_counter()
+        try:
+            if self.state["phase"] == EVENTS:
+                if self.state["pages"]:
+                    logger.info("Resuming reconciliation at page %d", self.state["pages"])
+                self._spill_events()
+            if self.state["phase"] == BOOKINGS:
+                self._spill_bookings()
+            if self.state["phase"] == HOLDS:
+                self._spill_holds()
+            if self.state["phase"] == "join":
+                self._join()
+        finally:
+            self._report.close()
+            self.source.close()
+        summary = self.summary()
+        with open(self._path("summary.json"), "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        logger.info("Reconciliation %s in %.1fs: %s", self.state["phase"],
+                    time.perf_counter() - started, summary["counts"])
+        return summary
+
+    def summary(self) -> Dict[str, Any]:
+        """Counts per outcome, cent totals and where the report is."""
+        return {
+            "source": self.state["source"],
+            "status": self.state["phase"],
+            "counts": dict(sorted(self.state["counts"].items())),
+            "cents": self.state["cents"],
+            "report": self._path("report.jsonl"),
+            "started_at": self.state["started_at"],
+            "finished_at": self.state["finished_at"],
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reconcile Stripe payments against bookings")
+    origin = parser.add_mutually_exclusive_group(required=True)
+    origin.add_argument("--export", help="JSON-lines Stripe event export")
+    origin.add_argument("--stripe", action="store_true", help="Page the Stripe Events API")
+    parser.add_argument("--since", type=int, help="Stripe: events created at/after (epoch s)")
+    parser.add_argument("--run-dir", help="Spill / checkpoint directory (resumed if present)")
+    parser.add_argument("--partitions", type=int, default=PARTITIONS)
+    parser.add_argument("--fresh", action="store_true", help="Discard a previous run in --run-dir")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    event_source = ExportFileSource(args.export) if args.export \
+        else StripeEventSource(args.since)
+    reconciler = Reconciler(event_source, args.run_dir, args.partitions)
+    if args.fresh:
+        shutil.rmtree(reconciler.run_dir, ignore_errors=True)
+    print(json.dumps(reconciler.run(), indent=2))
@@ -0,0 +1,281 @@
+"""
+Origin Distance Feature
+-----------------------
+Guest origin -> event venue distance (km) for the APT-1 model, with no
+geocoding on the request path.
+
+- Offline build: `python -m backend.geo_distance build` compiles
+  backend/data/cities.csv (name, country, lat, lon, aliases) into a flat
+  binary index: sorted 64-bit hashes of normalized names -> row, plus
+  latitude / longitude columns in radians.
+- Runtime: the index is memory-mapped (no parsing at startup, one copy in the
+  page cache for every worker). A lookup is one normalized-name hash plus a
+  binary search. Where the index is missing and cannot be written (read-only
+  deploys), the same layout is compiled from the CSV into memory instead.
+- Single requests are cached per (origin, venue) pair. Whole guest lists go
+  through a vectorized numpy haversine.
+
+Layout (little endian):
+    magic b"ANCGEO1\\0" | n_keys u4 | n_rows u4
+    keys u8[n_keys] | rows u4[n_keys] (padded to 8 bytes)
+    lat f8[n_rows] | lon f8[n_rows]
+"""
+
+import argparse
+import csv
+import hashlib
+import logging
+import math
+import mmap
+import os
+import re
+import struct
+import tempfile
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+SOURCE_PATH = os.path.join(DATA_DIR, "cities.csv")
+INDEX_PATH = os.getenv("ANCILE_GEO_INDEX", os.path.join(DATA_DIR, "cities.geo"))
+
+# What APT-1 was fed before real distances existed; still used for unknown cities
+DEFAULT_DISTANCE_KM = 500.0
+EARTH_RADIUS_KM = 6371.0088
+PAIR_CACHE_MAX = 65536
+
+MAGIC = b"ANCGEO1\0"
+_HEADER = struct.Struct("<8sII")
+_NON_ALNUM_RE = re.compile(r"[^a-z0-9]+")
+
+
+class GeoIndexException(Exception):
+    """The city index is missing or malformed."""
+
+
+def normalize_city(name: str) -> str:
+    """'  São Paulo, BR ' -> 'sao paulo br' (accents folded, punctuation dropped)."""
+    text = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode("ascii")
+    return " ".join(_NON_ALNUM_RE.sub(" ", text.lower()).split())
+
+
+def _hash(key: str) -> int:
+    """Stable 64-bit hash of a normalized name (same in every process)."""
+    return int.from_bytes(hashlib.blake2b(key.encode("ascii"), digest_size=8).digest(),
+                          "little")
+
+
+def _candidates(name: str) -> Tuple[str, ...]:
+    """Lookup keys, most specific first: the full name, then its first comma part."""
+    full = normalize_city(name)
+    head = normalize_city(name.split(",", 1)[0])
+    return (full, head) if head != full else (full,)
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km; radians in, numpy arrays broadcast."""
+    a = np.sin((lat2 - lat1) / 2.0) ** 2 + \
+        np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2.0) ** 2
+    return 2.0 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def _haversine_scalar(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """haversine_km for one pair (math is ~10x cheaper than numpy on scalars)."""
+    a = math.sin((lat2 - lat1) / 2.0) ** 2 + \
+        math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2.0) ** 2
+    return 2.0 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def compile_index(source: str = SOURCE_PATH) -> bytes:
+    """Compiles the city CSV into the binary index layout."""
+    lats: List[float] = []
+    lons: List[float] = []
+    keys: Dict[int, int] = {}
+    with open(source, "r", encoding="utf-8", newline="") as f:
+        for record in csv.DictReader(f):
+            row = len(lats)
+            lats.append(math.radians(float(record["lat"])))
+            lons.append(math.radians(float(record["lon"])))
+            names = [record["name"], *filter(None, (record.get("aliases") or "").split("|"))]
+            country = normalize_city(record.get("country") or "")
+            for name in names:
+                for key in {normalize_city(name), f"{normalize_city(name)} {country}".strip()}:
+                    # Earlier rows win (list the more likely city first)
+                    keys.setdefault(_hash(key), row)
+
+    hashes = np.array(sorted(keys), dtype="<u8")
+    rows = np.array([keys[h] for h in hashes.tolist()], dtype="<u4")
+    return b"".join((
+        _HEADER.pack(MAGIC, len(hashes), len(lats)),
+        hashes.tobytes(),
+        rows.tobytes(),
+        b"\0" * (-rows.nbytes % 8),
+        np.array(lats, dtype="<f8").tobytes(),
+        np.array(lons, dtype="<f8").tobytes(),
+    ))
+
+
+def build_index(source: str = SOURCE_PATH, target: str = INDEX_PATH) -> int:
+    """
+    Compiles the city CSV into the binary index (written atomically, so
+    running workers keep their old mapping). Returns the number of keys.
+    """
+    data = compile_index(source)
+    # A temp file per builder: workers building at the same cold start must
+    # never write into one another's file before the rename
+    fd, tmp = tempfile.mkstemp(prefix=os.path.basename(target) + ".",
+                               dir=os.path.dirname(target) or ".")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(tmp, 0o644)  # mkstemp creates 0600
+        os.replace(tmp, target)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    _, n_keys, n_rows = _HEADER.unpack_from(data, 0)
+    logger.info("Geo index built: %d cities, %d names -> %s", n_rows, n_keys, target)
+    return n_keys
+
+
+class GeoIndex:
+    """
+    Memory-mapped city index with cached origin -> venue distances.
+    """
+
+    def __init__(self, path: Optional[str] = INDEX_PATH, data: Optional[bytes] = None):
+        """Maps the index file at `path`, or reads an in-memory `data` buffer."""
+        self.path = path
+        if data is None:
+            with open(path, "rb") as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._buffer = data
+        magic, n_keys, n_rows = _HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise GeoIndexException(f"Not a geo index: {path or 'buffer'}")
+        offset = _HEADER.size
+        self.keys = np.frombuffer(data, dtype="<u8", count=n_keys, offset=offset)
+        offset += self.keys.nbytes
+        self.rows = np.frombuffer(data, dtype="<u4", count=n_keys, offset=offset)
+        offset += self.rows.nbytes + (-self.rows.nbytes % 8)
+        self.lat = np.frombuffer(data, dtype="<f8", count=n_rows, offset=offset)
+        self.lon = np.frombuffer(data, dtype="<f8", count=n_rows, offset=offset + 8 * n_rows)
+        self._pairs: Dict[Tuple[str, str], float] = {}
+
+    def __len__(self) -> int:
+        return len(self.lat)
+
+    def _find(self, hashes: np.ndarray) -> np.ndarray:
+        """Rows for an array of name hashes (-1 where unknown)."""
+        pos = np.minimum(self.keys.searchsorted(hashes), len(self.keys) - 1)
+        return np.where(self.keys[pos] == hashes, self.rows[pos].astype(np.int64), -1)
+
+    def row(self, name: str) -> int:
+        """Row of a city name or alias (-1 if unknown)."""
+        for key in _candidates(name):
+            if key:
+                found = int(self._find(np.array([_hash(key)], dtype="<u8"))[0])
+                if found >= 0:
+                    return found
+        return -1
+
+    def rows_for(self, names: Iterable[str]) -> np.ndarray:
+        """Rows for many names at once (-1 where unknown)."""
+        names = list(names)
+        full = np.empty(len(names), dtype="<u8")
+        head = np.empty(len(names), dtype="<u8")
+        for i, name in enumerate(names):
+            keys = _candidates(name or "")
+            full[i] = _hash(keys[0])
+            head[i] = _hash(keys[-1])
+        found = self._find(full)
+        return np.where(found >= 0, found, self._find(head))
+
+    def distance_km(self, origin: str, venue: str) -> Optional[float]:
+        """Origin -> venue distance (None if either city is unknown)."""
+        pair = (origin, venue)
+        km = self._pairs.get(pair)
+        if km is None:
+            a, b = self.row(origin), self.row(venue)
+            km = -1.0 if a < 0 or b < 0 else _haversine_scalar(
+                float(self.lat[a]), float(self.lon[a]), float(self.lat[b]), float(self.lon[b]))
+            if len(self._pairs) >= PAIR_CACHE_MAX:
+                self._pairs.clear()
+            self._pairs[pair] = km
+        return None if km < 0 else km
+
+    def distances_km(self, origins: Iterable[str], venue: str) -> np.ndarray:
+        """Distances from every origin to one venue (NaN where unknown)."""
+        origins = list(origins)
+        venue_row = self.row(venue)
+        if venue_row < 0:
+            return np.full(len(origins), np.nan)
+        # Guest lists repeat a handful of cities: resolve each distinct name once
+        unique, inverse = np.unique(np.asarray(origins, dtype=object).astype(str),
+                                    return_inverse=True)
+        rows = self.rows_for(unique.tolist())
+        known = rows >= 0
+        km = np.full(len(unique), np.nan)
+        km[known] = haversine_km(self.lat[rows[known]], self.lon[rows[known]],
+                                 self.lat[venue_row], self.lon[venue_row])
+        return km[inverse]
+
+
+def load_index(path: str = INDEX_PATH, source: str = SOURCE_PATH) -> Optional[GeoIndex]:
+    """
+    Maps the index, (re)building it first if it is missing or older than the
+    CSV. If it cannot be written (read-only filesystem), the CSV is compiled
+    into memory for this process instead.
+    """
+    try:
+        if os.path.exists(source) and (
+                not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(source)):
+            try:
+                build_index(source, path)
+            except OSError as e:
+                logger.warning("Geo index not writable (%s); compiling it in memory.", e)
+                return GeoIndex(None, compile_index(source))
+        return GeoIndex(path)
+    except (OSError, ValueError, GeoIndexException) as e:
+        logger.error("Geo index unavailable, using default distance: %s", e)
+        return None
+
+
+geo_index = load_index()
+
+
+def origin_distance_km(origin: Optional[str], venue: Optional[str]) -> float:
+    """APT-1 distance feature for one guest (DEFAULT_DISTANCE_KM if unknown)."""
+    if geo_index is None or not origin or not venue:
+        return DEFAULT_DISTANCE_KM
+    km = geo_index.distance_km(origin, venue)
+    return DEFAULT_DISTANCE_KM if km is None else km
+
+
+def origin_distances_km(origins: Iterable[Optional[str]], venue: Optional[str]) -> np.ndarray:
+    """APT-1 distance feature for a whole guest list."""
+    origins = [origin or "" for origin in origins]
+    if geo_index is None or not venue:
+        return np.full(len(origins), DEFAULT_DISTANCE_KM)
+    km = geo_index.distances_km(origins, venue)
+    return np.where(np.isnan(km), DEFAULT_DISTANCE_KM, km)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="City index for the origin distance feature")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_cmd = commands.add_parser("build", help="Compile the city CSV into the binary index")
+    build_cmd.add_argument("--source", default=SOURCE_PATH)
+    build_cmd.add_argument("--target", default=INDEX_PATH)
+    lookup_cmd = commands.add_parser("distance", help="Distance between two cities")
+    lookup_cmd.add_argument("origin")
+    lookup_cmd.add_argument("venue")
+    args = parser.parse_args()
+    if args.command == "build":
+        print(f"Indexed {build_index(args.source, args.target)} names.")
+    else:
+        print(f"{origin_distance_km(args.origin, args.venue):.1f} km")
@@ -3,22 +3,100 @@ Inventory Defense Engine
 ------------------------
 Implements the 'Atomic Lock' mechanism to prevent double-booking using Redis
 for optimistic concurrency control.
+
+Keyspace (Redis Cluster ready):
+    inv:{<group_id>:<room_type>}:holds      ZSET  lock_token -> hold expiry (ms)
+    inv:{<group_id>:<room_type>}:waitlist   ZSET  guest -> arrival sequence (FIFO)
+    inv:{<group_id>:<room_type>}:waitseq    STR   arrival sequence counter
+    inv:{<group_id>:<room_type>}:offers     HASH  promoted guest -> "<lock_token>|<expiry ms>"
+
+Every key of a block shares the {<group_id>:<room_type>} hash tag, so a block's
+state lives on one shard. The availability check and the hold are one
+atomic Lua script, and counting holds is a single ZCOUNT instead of a SCAN
+across every node.
 """
 
+import json
 import logging
+import os
+import queue
+import threading
+import time
 import uuid
 import fnmatch
-from typing import Dict
+from typing import Any, Dict, List, Optional, Tuple
 
 import redis
+from redis.cluster import RedisCluster
+from redis.exceptions import RedisClusterException
+
+from backend import db
+from backend.tracing import span
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Redis Connection with Fallback
-# In a real app, use environment variables for host/port
+# ANCILE_REDIS_MODE=standalone|cluster, ANCILE_REDIS_URL=redis://host:port/db
+# (in cluster mode the URL is any startup node)
 # utilizing decode_responses=True to get strings back instead of bytes
+REDIS_MODE = os.getenv("ANCILE_REDIS_MODE", "standalone")
+REDIS_URL = os.getenv("ANCILE_REDIS_URL", "redis://localhost:6379/0")
+
+HOLD_TTL_SECONDS = 600  # 10 minutes to complete payment
+
+
+class MockPubSub:
+    """In-memory mock of a redis-py PubSub connection."""
+
+    def __init__(self, broker):
+        self.broker = broker
+        self.channels = set()
+        self.messages = queue.Queue()
+
+    def subscribe(self, *channels):
+        """Simulate SUBSCRIBE."""
+        for channel in channels:
+            self.channels.add(channel)
+            self.broker.subscribers.setdefault(channel, set()).add(self)
+
+    def get_message(self, ignore_subscribe_messages=False, timeout=0.0):
+        """Simulate PubSub.get_message (subscribe confirmations are not emitted)."""
+        _ = ignore_subscribe_messages
+        try:
+            return self.messages.get(timeout=timeout) if timeout else \
+                self.messages.get_nowait()
+        except queue.Empty:
+            return None
+
+    def close(self):
+        """Simulate closing the PubSub connection."""
+        for channel in self.channels:
+            self.broker.subscribers.get(channel, set()).discard(self)
+        self.channels.clear()
+
+
+class _MockPipeline:
+    """Buffers MockRedis commands until execute()."""
+
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def __getattr__(self, name):
+        def queue_command(*args, **kwargs):
+            self.commands.append((name, args, kwargs))
+            return self
+        return queue_command
+
+    def execute(self):
+        """Runs the buffered commands; returns their results in order."""
+        with self.client.lock:
+            results = [getattr(self.client, name)(*args, **kwargs)
+                       for name, args, kwargs in self.commands]
+        self.commands = []
+        return results
 
 
 class MockRedis:
@@ -27,6 +105,8 @@ class MockRedis:
     def __init__(self):
         """Initialize the mock store."""
         self.store = {}
+        self.subscribers = {}
+        self.lock = threading.RLock()
         logging.warning(
             "⚠️ REDIS NOT CONNECTED: Using In-Memory Mock. Do not use in production.")
 
@@ -43,6 +123,12 @@ class MockRedis:
         """Simulate REDIS GET command."""
         return self.store.get(key)
 
+    def incr(self, key, amount=1):
+        """Simulate REDIS INCRBY command."""
+        with self.lock:
+            self.store[key] = int(self.store.get(key, 0)) + amount
+            return self.store[key]
+
     def delete(self, key):
         """Simulate REDIS DEL command."""
         if key in self.store:
@@ -50,24 +136,244 @@ class MockRedis:
             return 1
         return 0
 
+    def pipeline(self, transaction=True):
+        """Simulate a REDIS pipeline (commands run in order on execute)."""
+        _ = transaction
+        return _MockPipeline(self)
+
     def scan_iter(self, match="*"):
         """Simulate REDIS SCAN command using glob matching."""
-        for key in self.store:
+        for key in list(self.store):
             if fnmatch.fnmatch(key, match):
                 yield key
 
+    def pttl(self, key):
+        """Simulate REDIS PTTL (expiry is not tracked: -1 = no TTL)."""
+        return -1 if key in self.store else -2
+
+    def claim_legacy_hold(self, key):
+        """Simulate the CLAIM_LEGACY_HOLD_LUA script atomically."""
+        with self.lock:
+            ttl_ms = self.pttl(key)
+            self.delete(key)
+            return ttl_ms
+
+    def pexpire(self, key, ms):
+        """Simulate REDIS PEXPIRE (no-op: expiry is not tracked)."""
+        _ = ms
+        return key in self.store
+
+    def zadd(self, key, mapping):
+        """Simulate REDIS ZADD."""
+        with self.lock:
+            zset = self.store.setdefault(key, {})
+            added = sum(1 for member in mapping if member not in zset)
+            zset.update(mapping)
+            return added
+
+    def zrem(self, key, *members):
+        """Simulate REDIS ZREM."""
+        with self.lock:
+            zset = self.store.get(key, {})
+            removed = sum(1 for m in members if zset.pop(m, None) is not None)
+            if key in self.store and not zset:
+                del self.store[key]
+            return removed
+
+    def zcount(self, key, min_score, max_score):
+        """Simulate REDIS ZCOUNT (numeric bounds or '-inf' / '+inf')."""
+        low, high = float(min_score), float(max_score)
+        with self.lock:
+            return sum(1 for score in self.store.get(key, {}).values()
+                       if low <= score <= high)
+
+    def zremrangebyscore(self, key, min_score, max_score):
+        """Simulate REDIS ZREMRANGEBYSCORE."""
+        low, high = float(min_score), float(max_score)
+        with self.lock:
+            zset = self.store.get(key, {})
+            expired = [m for m, score in zset.items() if low <= score <= high]
+            for member in expired:
+                del zset[member]
+            return len(expired)
+
+    def zrangebyscore(self, key, min_score, max_score, withscores=False):
+        """Simulate REDIS ZRANGEBYSCORE (numeric bounds or '-inf' / '+inf')."""
+        low, high = float(min_score), float(max_score)
+        with self.lock:
+            members = sorted((score, m) for m, score in self.store.get(key, {}).items()
+                             if low <= score <= high)
+        return [(m, score) for score, m in members] if withscores else [m for _, m in members]
+
+    def zscore(self, key, member):
+        """Simulate REDIS ZSCORE."""
+        return self.store.get(key, {}).get(member)
+
+    def zcard(self, key):
+        """Simulate REDIS ZCARD."""
+        return len(self.store.get(key, {}))
+
+    def zrank(self, key, member):
+        """Simulate REDIS ZRANK (O(n) here)."""
+        with self.lock:
+            zset = self.store.get(key, {})
+            if member not in zset:
+                return None
+            score = zset[member]
+            return sum(1 for m, s in zset.items() if (s, m) < (score, member))
+
+    def zpopmin(self, key, count=1):
+        """Simulate REDIS ZPOPMIN."""
+        with self.lock:
+            zset = self.store.get(key, {})
+            popped = sorted(zset.items(), key=lambda item: (item[1], item[0]))[:count]
+            for member, _ in popped:
+                del zset[member]
+            if key in self.store and not zset:
+                del self.store[key]
+            return popped
+
+    def hset(self, key, field, value):
+        """Simulate REDIS HSET (single field)."""
+        with self.lock:
+            fields = self.store.setdefault(key, {})
+            added = int(field not in fields)
+            fields[field] = value
+            return added
+
+    def hget(self, key, field):
+        """Simulate REDIS HGET."""
+        return self.store.get(key, {}).get(field)
+
+    def hdel(self, key, *fields):
+        """Simulate REDIS HDEL."""
+        with self.lock:
+            hashed = self.store.get(key, {})
+            removed = sum(1 for f in fields if hashed.pop(f, None) is not None)
+            if key in self.store and not hashed:
+                del self.store[key]
+            return removed
+
+    def sadd(self, key, *members):
+        """Simulate REDIS SADD."""
+        with self.lock:
+            members_set = self.store.setdefault(key, set())
+            added = len(set(members) - members_set)
+            members_set.update(members)
+            return added
+
+    def srem(self, key, *members):
+        """Simulate REDIS SREM."""
+        with self.lock:
+            members_set = self.store.get(key, set())
+            removed = len(members_set & set(members))
+            members_set.difference_update(members)
+            return removed
+
+    def smembers(self, key):
+        """Simulate REDIS SMEMBERS."""
+        with self.lock:
+            return set(self.store.get(key, set()))
+
+    def acquire_hold(self, key, token, now_ms, ttl_ms, allocated, booked,
+                     waitlist=None):
+        """Simulate the ACQUIRE_HOLD_LUA script atomically."""
+        with self.lock:
+            self.zremrangebyscore(key, "-inf", now_ms)
+            held = len(self.store.get(key, {}))
+            if held + booked >= allocated or (waitlist and self.zcard(waitlist)):
+                return [0, held]
+            self.zadd(key, {token: now_ms + ttl_ms})
+            return [1, held + 1]
+
+    def claim_hold(self, key, token, now_ms, grace_ms):
+        """Simulate the CLAIM_HOLD_LUA script atomically."""
+        with self.lock:
+            expiry = self.zscore(key, token)
+            if expiry is None or float(expiry) <= now_ms:
+                return 0
+            self.zadd(key, {token: now_ms + grace_ms})
+            return 1
+
+    def publish(self, channel, message):
+        """Simulate REDIS PUBLISH command."""
+        receivers = self.subscribers.get(channel, set())
+        for pubsub in list(receivers):
+            pubsub.messages.put(
+                {"type": "message", "channel": channel, "data": message})
+        return len(receivers)
+
+    def pubsub(self):
+        """Simulate REDIS PubSub connection."""
+        return MockPubSub(self)
+
     def ping(self):
         """Simulate REDIS PING command."""
         return True
 
 
-try:
-    redis_client = redis.Redis(
-        host='localhost', port=6379, db=0, decode_responses=True)
-    redis_client.ping()
-    logger.info("✅ Redis Connected Successfully.")
-except redis.ConnectionError:
-    redis_client = MockRedis()
+def _connect_redis():
+    """Standalone or cluster client per ANCILE_REDIS_MODE, MockRedis if unreachable."""
+    try:
+        if REDIS_MODE == "cluster":
+            client = RedisCluster.from_url(REDIS_URL, decode_responses=True)
+        else:
+            client = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+        client.ping()
+        logger.info("✅ Redis Connected Successfully (%s).", REDIS_MODE)
+        return client
+    except (redis.ConnectionError, RedisClusterException):
+        return MockRedis()
+
+
+redis_client = _connect_redis()
+
+# Atomic check-and-hold for one block. Both keys share the block's hash tag,
+# so it is cluster-safe.
+# KEYS[1] = holds ZSET, KEYS[2] = waitlist ZSET
+# ARGV = token, now_ms, ttl_ms, allocated, booked
+# Returns {1, held_after} on success or {0, held} when the block is full.
+# While guests are waitlisted, freed rooms belong to them (see waitlist.py),
+# so newcomers are refused instead of jumping the queue.
+ACQUIRE_HOLD_LUA = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[2])
+local held = redis.call('ZCARD', KEYS[1])
+if held + tonumber(ARGV[5]) >= tonumber(ARGV[4])
+        or redis.call('ZCARD', KEYS[2]) > 0 then
+    return {0, held}
+end
+redis.call('ZADD', KEYS[1], tonumber(ARGV[2]) + tonumber(ARGV[3]), ARGV[1])
+redis.call('PEXPIRE', KEYS[1], ARGV[3])
+return {1, held + 1}
+"""
+_acquire_hold_script = None
+
+# Claims a live hold for commit: succeeds only while the token is unexpired,
+# and pushes its expiry out by the grace period so it cannot lapse (and the
+# room go to someone else) while the booking is written.
+# KEYS[1] = holds ZSET; ARGV = token, now_ms, grace_ms. Returns 1 or 0.
+CLAIM_HOLD_LUA = """
+local expiry = redis.call('ZSCORE', KEYS[1], ARGV[1])
+if not expiry or tonumber(expiry) <= tonumber(ARGV[2]) then
+    return 0
+end
+redis.call('ZADD', KEYS[1], 'XX', tonumber(ARGV[2]) + tonumber(ARGV[3]), ARGV[1])
+return 1
+"""
+_claim_hold_script = None
+COMMIT_GRACE_MS = 30_000
+
+# Takes one legacy lock:* hold: its remaining TTL (-2 if it is already gone)
+# and the delete happen together, so a hold released meanwhile is never moved
+# and two migrators never both move the same one. Single key: cluster-safe.
+CLAIM_LEGACY_HOLD_LUA = """
+local ttl = redis.call('PTTL', KEYS[1])
+if ttl ~= -2 then
+    redis.call('DEL', KEYS[1])
+end
+return ttl
+"""
+_claim_legacy_hold_script = None
 
 
 class InventoryException(Exception):
@@ -78,61 +384,345 @@ class InventoryFullException(InventoryException):
     """Exception raised when inventory is fully allocated or held."""
 
 
-# Mock Database Helper (Replace with actual SQL query later)
+class HoldExpiredException(InventoryException):
+    """Exception raised when a paid hold expired before it could be committed."""
+
+
+# Bumped on every hold / commit so caches in any worker can revalidate cheaply
+INVENTORY_VERSION_PREFIX = "inv_version"
+# Availability deltas are published here; each worker holds ONE subscription
+INVENTORY_EVENTS_CHANNEL = "inventory_events"
+
+
+def _get_db_group(group_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Fetches a 'groups' row by id or subdomain.
+    """
+    return db.get_group(group_id)
+
+
+def _get_db_inventory_blocks(group_id: str) -> List[Dict[str, Any]]:
+    """
+    Fetches all 'inventory_blocks' rows for a group.
+    """
+    return db.get_inventory_blocks(group_id)
 
 
 def _get_db_inventory_counts(group_id: str, room_type: str) -> Dict[str, int]:
     """
-    Simulates fetching 'total_allocated' and 'total_booked' from SQL.
+    Fetches 'total_allocated' and 'total_booked' of one block (prepared query).
+    Unknown blocks count as zero rooms, so they can never be held.
     """
-    # Mock Implementation: Connect to PostgreSQL and query the 'inventory_blocks' table
-    # SELECT total_allocated, total_booked ...
     logger.debug("Fetching DB counts for Group: %s, Room: %s",
                  group_id, room_type)
+    counts = db.get_block_counts(group_id, room_type)
+    if counts is None:
+        return {"total_allocated": 0, "total_booked": 0}
+    return counts
+
+
+def _record_db_booking(group_id: str, room_type: str,
+                       booking: Optional[Dict[str, Any]] = None):
+    """
+    'UPDATE inventory_blocks SET total_booked = total_booked + 1', guarded
+    in the WHERE clause so it can never exceed the allocation, plus the
+    bookings ledger row when `booking` is given.
+    """
+    if not db.record_booking(group_id, room_type, booking=booking):
+        # Mirrors the check_inventory_limit constraint
+        raise InventoryFullException(
+            "409 Conflict: Commit would exceed allocation.")
+
+
+def block_group_id(group_key: str) -> Optional[str]:
+    """
+    Ledger id of a group id or subdomain (None if unknown). Every Redis key,
+    version and delta of a block uses this id, so a block has one hold set
+    whichever key the caller booked through.
+    """
+    return db.resolve_group_id(group_key)
+
+
+def block_tag(group_id: str, room_type: str) -> str:
+    """Redis Cluster hash tag shared by every key of one room block."""
+    return f"{{{group_id}:{room_type}}}"
+
+
+def holds_key(group_id: str, room_type: str) -> str:
+    """ZSET of active holds (lock_token -> expiry in ms) for a room block."""
+    return f"inv:{block_tag(group_id, room_type)}:holds"
+
+
+def parse_holds_key(key: str) -> Optional[Tuple[str, str]]:
+    """(group_id, room_type) of a holds key, or None for any other key."""
+    if not (key.startswith("inv:{") and key.endswith("}:holds")):
+        return None
+    group_id, sep, room_type = key[5:-7].rpartition(":")
+    return (group_id, room_type) if sep else None
+
+
+def waitlist_key(group_id: str, room_type: str) -> str:
+    """FIFO ZSET of guests waiting for a sold-out room block."""
+    return f"inv:{block_tag(group_id, room_type)}:waitlist"
+
+
+def _now_ms() -> int:
+    """Wall clock in milliseconds (hold expiry scores)."""
+    return int(time.time() * 1000)
+
+
+def count_active_holds(group_id: str, room_type: str) -> int:
+    """
+    Counts pending (unpaid, unexpired) holds for a room block in Redis.
+    """
+    return int(redis_client.zcount(holds_key(group_id, room_type), _now_ms(), "+inf"))
+
+
+def _try_acquire_hold(group_id: str, room_type: str, lock_token: str,
+                      allocated: int, booked: int) -> Tuple[bool, int]:
+    """
+    Runs the atomic check-and-hold. Returns (acquired, holds_after).
+    """
+    global _acquire_hold_script  # pylint: disable=global-statement
+    key = holds_key(group_id, room_type)
+    waitlist = waitlist_key(group_id, room_type)
+    ttl_ms = HOLD_TTL_SECONDS * 1000
+    if isinstance(redis_client, MockRedis):
+        result = redis_client.acquire_hold(
+            key, lock_token, _now_ms(), ttl_ms, allocated, booked, waitlist)
+    else:
+        if _acquire_hold_script is None:
+            _acquire_hold_script = redis_client.register_script(ACQUIRE_HOLD_LUA)
+        result = _acquire_hold_script(
+            keys=[key, waitlist],
+            args=[lock_token, _now_ms(), ttl_ms, allocated, booked],
+            client=redis_client)
+    return bool(int(result[0])), int(result[1])
+
+
+def _claim_hold(group_id: str, room_type: str, lock_token: str) -> bool:
+    """
+    Runs the atomic live-hold claim. True if the hold was still live.
+    """
+    global _claim_hold_script  # pylint: disable=global-statement
+    key = holds_key(group_id, room_type)
+    if isinstance(redis_client, MockRedis):
+        return bool(redis_client.claim_hold(key, lock_token, _now_ms(), COMMIT_GRACE_MS))
+    if _claim_hold_script is None:
+        _claim_hold_script = redis_client.register_script(CLAIM_HOLD_LUA)
+    return bool(int(_claim_hold_script(
+        keys=[key], args=[lock_token, _now_ms(), COMMIT_GRACE_MS], client=redis_client)))
+
+
+def _claim_legacy_hold(key: str) -> int:
+    """Atomically removes a legacy hold key; returns its PTTL before removal."""
+    global _claim_legacy_hold_script  # pylint: disable=global-statement
+    if isinstance(redis_client, MockRedis):
+        return redis_client.claim_legacy_hold(key)
+    if _claim_legacy_hold_script is None:
+        _claim_legacy_hold_script = redis_client.register_script(CLAIM_LEGACY_HOLD_LUA)
+    return int(_claim_legacy_hold_script(keys=[key], client=redis_client))
+
+
+def migrate_legacy_holds() -> int:
+    """
+    One-off migration of pre-cluster holds (lock:<group>:<room>:<uuid> string
+    keys) into the per-block ZSETs, keeping their remaining TTL.
+    Safe to run repeatedly; returns the number of holds moved.
+    Run it with `python -m backend.inventory_defense` (it SCANs the keyspace).
+    """
+    moved = 0
+    for key in redis_client.scan_iter(match="lock:*"):
+        try:
+            group_id, room_type, lock_token = key[len("lock:"):].rsplit(":", 2)
+        except ValueError:
+            continue
+        ttl_ms = _claim_legacy_hold(key)
+        if ttl_ms == -2:
+            continue  # Expired, released or moved meanwhile
+        if ttl_ms < 0:
+            ttl_ms = HOLD_TTL_SECONDS * 1000
+        target = holds_key(group_id, room_type)
+        redis_client.zadd(target, {lock_token: _now_ms() + ttl_ms})
+        if redis_client.pttl(target) < ttl_ms:
+            redis_client.pexpire(target, ttl_ms)
+        moved += 1
+    if moved:
+        logger.info("Migrated %d legacy inventory holds to hash-tagged ZSETs.", moved)
+    return moved
+
+
+def get_inventory_version(group_id: str) -> int:
+    """
+    Returns the change counter for a group's inventory.
+    """
+    return int(redis_client.get(f"{INVENTORY_VERSION_PREFIX}:{group_id}") or 0)
+
+
+def get_block_availability(group_id: str, room_type: str) -> Dict[str, int]:
+    """
+    Live availability of a single room block (SQL counts + Redis holds).
+    """
+    group_id = block_group_id(group_id) or group_id
+    db_counts = _get_db_inventory_counts(group_id, room_type)
+    allocated = db_counts["total_allocated"]
+    booked = db_counts["total_booked"]
+    held = count_active_holds(group_id, room_type)
+    return {
+        "allocated": allocated,
+        "booked": booked,
+        "held": held,
+        "remaining": max(allocated - booked - held, 0)
+    }
+
+
+def _notify_inventory_change(group_id: str, room_type: str, event: str,
+                             counts: Optional[Dict[str, int]] = None):
+    """
+    Records that a block's availability changed (hold, release or commit)
+    and publishes the new availability for live microsite streams.
+    `counts` (allocated / booked / held) is the caller's view of the block
+    after the change; only when it is missing is the block re-read.
+    """
+    version = redis_client.incr(f"{INVENTORY_VERSION_PREFIX}:{group_id}")
+    logger.debug("Inventory changed (%s): %s/%s", event, group_id, room_type)
+    try:
+        if counts is not None:
+            availability = {**counts, "remaining": max(
+                counts["allocated"] - counts["booked"] - counts["held"], 0)}
+        else:
+            availability = get_block_availability(group_id, room_type)
+        delta = {
+            "group_id": group_id,
+            "room_type": room_type,
+            "event": event,
+            "version": version,
+            **availability
+        }
+        redis_client.publish(INVENTORY_EVENTS_CHANNEL, json.dumps(delta))
+    except redis.RedisError as e:
+        # Streams are best-effort; never fail a booking over a missed delta
+        logger.error("Failed to publish inventory delta: %s", e)
+
+
+def get_group_availability(group_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Combines the group's persistent blocks (SQL) with live holds (Redis).
+    Returns None if the group does not exist.
+    """
+    group = _get_db_group(group_id)
+    if group is None:
+        return None
+
+    blocks = []
+    for block in _get_db_inventory_blocks(group["id"]):
+        room_type = block["room_type_code"]
+        held = count_active_holds(group["id"], room_type)
+        allocated = block["total_allocated"]
+        booked = block["total_booked"]
+        blocks.append({
+            "room_type": room_type,
+            "price": block["rate"],
+            "allocated": allocated,
+            "booked": booked,
+            "held": held,
+            "remaining": max(allocated - booked - held, 0)
+        })
+    return {"group": group, "blocks": blocks}
+
+
+def get_availability_snapshot(group_keys: List[str]) -> Dict[str, Any]:
+    """
+    Availability of every block of many groups in a constant number of round
+    trips: one SQL query for the counts and one pipelined ZCOUNT batch for the
+    holds. Columnar layout (one array per field, `group` indexes `groups`)
+    keeps dashboard payloads small.
+    """
+    rows = db.get_blocks_for_groups(group_keys)
+    blocks = [row for row in rows if row["room_type_code"] is not None]
+    now = _now_ms()
+    pipe = redis_client.pipeline(transaction=False)
+    for row in blocks:
+        pipe.zcount(holds_key(str(row["group_id"]), row["room_type_code"]), now, "+inf")
+    held = iter([int(n) for n in pipe.execute()] if blocks else [])
+
+    groups: List[str] = []
+    index: Dict[str, int] = {}
+    found = set()
+    columns: Dict[str, List[Any]] = {
+        "group": [], "room_type": [], "allocated": [], "booked": [], "held": [], "remaining": []}
+    for row in rows:
+        group_id = str(row["group_id"])
+        if group_id not in index:
+            index[group_id] = len(groups)
+            groups.append(group_id)
+        found.update((group_id, row["subdomain"]))
+        if row["room_type_code"] is None:
+            continue  # A group with no blocks yet: found, but nothing to list
+        holds = next(held)
+        allocated, booked = row["total_allocated"], row["total_booked"]
+        columns["group"].append(index[group_id])
+        columns["room_type"].append(row["room_type_code"])
+        columns["allocated"].append(allocated)
+        columns["booked"].append(booked)
+        columns["held"].append(holds)
+        columns["remaining"].append(max(allocated - booked - holds, 0))
     return {
-        "total_allocated": 50,  # Example hard limit
-        "total_booked": 45      # Example current confirmed bookings
+        "as_of_ms": now,
+        "groups": groups,
+        "not_found": [key for key in dict.fromkeys(group_keys) if key not in found],
+        "blocks": columns,
     }
 
 
-def acquire_inventory_lock(group_id: str, room_type: str) -> str:
+def acquire_inventory_lock(group_id: str, room_type: str,
+                           lock_token: Optional[str] = None) -> str:
     """
     Implements the Atomic Inventory Lock (Optimistic Concurrency Control).
 
     Logic:
     1. Check SQL: Is booked_count < total_allocated?
     2. Check Redis: count(active_locks) + booked_count < total_allocated?
-    3. Lock: SETNX key lock:group_id:room_type:{uuid} with 600s TTL.
+    3. Lock: ZADD lock_token to the block's holds ZSET with a 600s expiry.
+    Steps 2 and 3 run as one Lua script, atomically. While the block has a
+    waitlist, freed rooms go to the waiters (backend/waitlist.py) first.
+
+    A caller-chosen lock_token makes the call idempotent: if that token
+    already holds an unexpired room, it is returned without a second hold
+    (used by resumable batch jobs).
 
     Returns:
         lock_token (str): Unique token if successful.
 
     Raises:
-        409 Conflict (InventoryFullException) if room is taken.
+        409 Conflict (InventoryFullException) if room is taken or the block
+        does not exist (checked before any Redis write).
     """
+    group_id = block_group_id(group_id)
+    if group_id is None:
+        raise InventoryFullException("409 Conflict: Unknown inventory block.")
 
-    # Generate a lock key prefix
-    lock_prefix = f"lock:{group_id}:{room_type}"
+    if lock_token is not None:
+        expiry = redis_client.zscore(holds_key(group_id, room_type), lock_token)
+        if expiry is not None and float(expiry) > _now_ms():
+            return lock_token
 
     # 1. Fetch persistent state from SQL
-    db_counts = _get_db_inventory_counts(group_id, room_type)
+    with span("inventory.db_counts"):
+        db_counts = db.get_block_counts(group_id, room_type)
+    if db_counts is None:
+        raise InventoryFullException("409 Conflict: Unknown inventory block.")
     allocated = db_counts["total_allocated"]
     booked = db_counts["total_booked"]
 
-    # 2. Count active locks in Redis (Pending bookings)
-    # We use SCAN to count keys matching the prefix to know how many are currently held
-    # Note: In high concurrency, a Lua script would be safer to check-and-set atomically.
-    # For Phase 1 prototype, we count then set.
+    # 2 + 3. Count unexpired holds and add ours in ONE atomic script on the
+    # block's shard, so concurrent guests can no longer both pass the check.
+    lock_token = lock_token or str(uuid.uuid4())
+    with span("inventory.acquire_hold"):
+        is_locked, active_locks = _try_acquire_hold(
+            group_id, room_type, lock_token, allocated, booked)
 
-    # Find all active locks for this room block
-    active_locks = 0
-    pattern = f"{lock_prefix}:*"
-    for _ in redis_client.scan_iter(match=pattern):
-        active_locks += 1
-
-    available_inventory = allocated - (booked + active_locks)
-
-    if available_inventory <= 0:
+    if not is_locked:
         logger.warning(
             "Inventory Full: Allocated=%d, Booked=%d, ActiveLocks=%d",
             allocated, booked, active_locks
@@ -140,26 +730,60 @@ def acquire_inventory_lock(group_id: str, room_type: str) -> str:
         raise InventoryFullException(
             "409 Conflict: Inventory Fully Allocated or Held.")
 
-    # 3. Attempt to Acquire Lock
-    lock_token = str(uuid.uuid4())
-    lock_key = f"{lock_prefix}:{lock_token}"
-
-    # SETNX is implied by set(..., nx=True)
-    # TTL = 600 seconds (10 minutes)
-    is_locked = redis_client.set(lock_key, "HELD", ex=600, nx=True)
-
-    if is_locked:
-        logger.info("Lock Acquired: %s", lock_key)
-        return lock_token
-    else:
-        # Should rarely happen given we use a UUID in the key, unless uuid collision
-        raise InventoryFullException("409 Conflict: Contentious lock failure.")
+    logger.info("Lock Acquired: %s:%s", holds_key(group_id, room_type), lock_token)
+    with span("inventory.notify"):
+        _notify_inventory_change(group_id, room_type, "hold", {
+            "allocated": allocated, "booked": booked, "held": active_locks})
+    return lock_token
 
 
 def release_inventory_lock(group_id: str, room_type: str, lock_token: str):
     """
     Releases the lock manually (e.g. if payment fails or user cancels).
     """
-    key = f"lock:{group_id}:{room_type}:{lock_token}"
-    redis_client.delete(key)
-    logger.info("Lock Released: %s", key)
+    group_id = block_group_id(group_id)
+    if group_id is None:
+        logger.warning("Release for unknown group ignored: %s", lock_token)
+        return
+    key = holds_key(group_id, room_type)
+    if redis_client.zrem(key, lock_token):
+        _notify_inventory_change(group_id, room_type, "release")
+    logger.info("Lock Released: %s:%s", key, lock_token)
+
+
+def commit_inventory_lock(group_id: str, room_type: str, lock_token: str,
+                          payment: Optional[Dict[str, Any]] = None):
+    """
+    Converts a held room into a confirmed booking once payment succeeds.
+    SQL 'total_booked' is incremented before the Redis hold is dropped so the
+    room is never counted as free in between.
+
+    The booking is written to the ledger under its lock_token (with the
+    session / split fields in `payment`), so committing the same hold twice
+    books it once.
+
+    Only a live hold is booked: if it expired first (the room may already be
+    someone else's), HoldExpiredException is raised and the payment must be
+    refunded. A redelivered webhook for a hold already booked is a no-op.
+    """
+    group_id = block_group_id(group_id)
+    if group_id is None:
+        logger.error("Commit for unknown group: %s", lock_token)
+        raise HoldExpiredException("409 Conflict: Unknown inventory block.")
+    key = holds_key(group_id, room_type)
+    if not _claim_hold(group_id, room_type, lock_token):
+        if db.booking_exists(lock_token):
+            logger.info("Lock Already Committed: %s:%s", key, lock_token)
+            return
+        logger.error("Hold Expired Before Commit: %s:%s", key, lock_token)
+        raise HoldExpiredException(
+            "409 Conflict: Hold expired before payment completed.")
+    _record_db_booking(group_id, room_type, {**(payment or {}), "lock_token": lock_token})
+    redis_client.zrem(key, lock_token)
+    _notify_inventory_change(group_id, room_type, "commit")
+    logger.info("Lock Committed: %s:%s", key, lock_token)
+
+
+if __name__ == "__main__":
+    # python -m backend.inventory_defense  -> migrate legacy holds in place
+    print(f"Moved {migrate_legacy_holds()} legacy holds.")
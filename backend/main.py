@@ -10,42 +10,81 @@ Ties together:
 5. Viral Growth (Referrals)
 """
 
+import asyncio
 import logging
 import os
-import uuid
-import re
+import threading
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional, Union
 import joblib
 from fastapi import APIRouter, FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, HTMLResponse, JSONResponse
+from fastapi.responses import (
+    FileResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
+)
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 
+from backend import db
+from backend.admission import AdmissionMiddleware, admission_controller
 from backend.fintech.payment_engine import PaymentProcessor
 from backend.inventory_defense import (
+    HoldExpiredException,
     InventoryFullException,
     acquire_inventory_lock,
+    commit_inventory_lock,
+    get_availability_snapshot,
+    migrate_legacy_holds,
     release_inventory_lock,
 )
+from backend.demand_heatmap import demand_aggregator
+from backend.fast_json import FastJSONResponse, StaticJSON, dumps
+from backend.geo_distance import origin_distance_km, origin_distances_km
+from backend.availability_stream import availability_hub, stream_group_availability
+from backend.metrics import MetricsMiddleware, metrics_registry
+from backend.microsite_cache import GroupConfigCache, etag_matches
+from backend.onboarding import OnboardingEngine, OnboardingException, verify_guest_identity
+from backend.static_shell import SpaShell, StaticEntry, pick_encoding
 from backend.growth import ViralLoopEngine
 from backend.tbo_client import TBOClient
+from backend.tracing import span, tracer
+from backend.waitlist import waitlist, waitlist_promoter, waitlist_ticket
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    """Per-worker startup (optional demo seed, background threads) and shutdown."""
+    if db.SEED_LOCAL:
+        # Demo group(s) (frontend 'demo' flow) into an empty local SQLite database
+        db.seed_local_data()
+    spa_shell.start()
+    demand_aggregator.start()
+    if waitlist.enabled:
+        waitlist_promoter.start()
+    try:
+        onboarding_engine.start()
+    except OSError as e:
+        logger.warning("Onboarding disabled: checkpoint directory %s unusable (%s)",
+                       onboarding_engine.directory, e)
+    yield
+    onboarding_engine.stop()
+    waitlist_promoter.stop()
+    demand_aggregator.stop()
+    spa_shell.stop()
+
 
 # Initialize App
-app = FastAPI(title="Project Ancile Backend", version="1.0.0")
+# orjson-rendered JSON for every handler that returns plain data
+app = FastAPI(title="Project Ancile Backend", version="1.0.0",
+              default_response_class=FastJSONResponse, lifespan=lifespan)
 
 
-@app.middleware("http")
-async def log_requests(request: Request, call_next):
-    """Log every incoming request for debugging Vercel routing."""
-    method = request.method
-    url = str(request.url)
-    print(f"Incoming: {method} {url}")
-    try:
-        response = await call_next(request)
-        print(f"Outgoing: {response.status_code} for {url}")
-        return response
-    except Exception as e:  # pylint: disable=broad-except
-        print(f"Error processing {url}: {str(e)}")
-        raise e
+# Booking admission control (429 + Retry-After), inside metrics so sheds are counted
+app.add_middleware(AdmissionMiddleware)
+# Request metrics (Prometheus at /api/metrics) + sampled access logging
+app.add_middleware(MetricsMiddleware)
 
 # Logging
 logging.basicConfig(level=logging.INFO)
@@ -55,6 +94,12 @@ logger = logging.getLogger("ancile_backend")
 payment_engine = PaymentProcessor()
 growth_engine = ViralLoopEngine()
 tbo_client = TBOClient()
+group_config_cache = GroupConfigCache()
+
+# Move holds written by pre-cluster releases into the hash-tagged keyspace.
+# Opt-in: it SCANs the whole keyspace (prefer `python -m backend.inventory_defense`)
+if os.getenv("ANCILE_MIGRATE_LEGACY_HOLDS", "0") == "1":
+    migrate_legacy_holds()
 
 # ML Runtime (Scikit-Learn Pickle)
 ML_FOLDER = os.path.dirname(__file__)
@@ -96,6 +141,11 @@ class InventoryRequest(BaseModel):
     room_type: str
 
 
+class AvailabilitySnapshotRequest(BaseModel):
+    """Request model for a multi-group availability snapshot."""
+    group_ids: List[str]
+
+
 class BookingRequest(BaseModel):
     """Request model for initiating a booking."""
     group_id: str
@@ -117,6 +167,68 @@ class BookingResponse(BaseModel):
     risk_score: float
 
 
+# Lean response models for the hot read endpoints. They document the payloads;
+# the handlers return pre-serialized bodies, so nothing is re-validated per request.
+
+
+class RoomAvailability(BaseModel):
+    """Live availability of one room block."""
+    room_type: str
+    price: float
+    allocated: int
+    booked: int
+    held: int
+    remaining: int
+
+
+class GroupConfigResponse(BaseModel):
+    """Microsite configuration (served from the per-group byte cache)."""
+    group_id: str
+    name: str
+    event_date: str
+    microsite_url: str
+    theme: str
+    inventory: List[RoomAvailability]
+
+
+class HeatmapRegion(BaseModel):
+    """Rolling demand of one destination city."""
+    city: str
+    demand_score: int
+    status: str
+    initiations: int
+    holds: int
+
+
+class HeatmapRollup(BaseModel):
+    """Cluster-wide demand heatmap."""
+    regions: List[HeatmapRegion]
+    window_seconds: int
+    generated_at: float
+
+
+class HeatmapBlock(BaseModel):
+    """Demand of one (group, room type) in a city."""
+    group_id: str
+    room_type: str
+    initiations: int
+    holds: int
+
+
+class HeatmapBreakdown(BaseModel):
+    """Per-block drill-down for one city."""
+    city: str
+    blocks: List[HeatmapBlock]
+
+
+class HotelSearchResponse(BaseModel):
+    """Hotel search results."""
+    status: str
+    provider: str
+    data: Dict[str, Any]
+    error_detail: Optional[str] = None
+
+
 class IdentityVerificationRequest(BaseModel):
     """Request model for guest identity verification."""
     guest_name: str
@@ -132,42 +244,159 @@ class IdentityVerificationResponse(BaseModel):
     facial_match_probability: float
 
 
+class OnboardingGuest(BaseModel):
+    """One guest of an onboarding manifest."""
+    guest_name: str
+    guest_email: str
+    passport_number: str
+    id_type: str = "Passport"
+    origin_city: str
+    booking_lead_time: int
+    avg_income_proxy: float = 50000.0
+    relation_to_host: str = "Friend"
+
+
+class OnboardingJobRequest(BaseModel):
+    """Request model for onboarding a whole guest manifest into one block."""
+    group_id: str
+    room_type: str
+    room_price: float
+    agent_id: str
+    guests: List[OnboardingGuest]
+
+
 # --- Endpoints ---
 router = APIRouter(prefix="/api")
 
 
+# Fixed once the model has (or has not) loaded
+HEALTH_BODY = StaticJSON({
+    "status": "active", "version": "1.0.0",
+    "ai_status": "pickle" if sklearn_pipeline else "offline"
+})
+
+
 @router.get("/health")
 def health_check():
     """Returns the API health status and AI engine availability."""
-    ai_status = "pickle" if sklearn_pipeline else "offline"
-    return {"status": "active", "version": "1.0.0", "ai_status": ai_status}
+    return HEALTH_BODY.response()
 
 
-@router.get("/groups/{group_id}")
-def get_group_config(group_id: str):
-    """Retrieves the configuration for a specific group microsite."""
-    return {
-        "group_id": group_id,
-        "microsite_url": f"https://{group_id}.ancile.app",
-        "theme": "dark_modern",
-        "inventory": [
-            {"room_type": "DELUXE_OCEAN", "price": 250.00, "remaining": 12},
-            {"room_type": "STANDARD_GARDEN", "price": 180.00, "remaining": 5}
-        ]
-    }
+@router.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Per-route request counters, latency histograms and in-flight gauge."""
+    return PlainTextResponse(
+        metrics_registry.render_prometheus(),
+        media_type="text/plain; version=0.0.4; charset=utf-8")
 
 
-@router.post("/bookings/initiate", response_model=BookingResponse)
-def initiate_booking(request: BookingRequest):
-    """The Core Transaction Flow: AI Risk Check, Inventory Lock, and Payment Setup."""
+@router.get("/metrics/stages")
+def get_stage_latencies():
+    """Per-stage p50 / p99 of traced spans (booking, TBO, webhook)."""
+    return {"stages": tracer.aggregator.summary()}
+
+
+@router.get("/metrics/admission")
+def get_admission_stats():
+    """Booking admission control: admitted requests and 429s by reason."""
+    return admission_controller.stats()
+
+
+@router.get("/groups/{group_id}", response_model=GroupConfigResponse)
+def get_group_config(group_id: str, request: Request):
+    """
+    Retrieves the configuration for a specific group microsite.
+    Served from the per-group cache; matching If-None-Match polls get a 304.
+    """
+    cached = group_config_cache.get(group_id)
+    if cached is None:
+        raise HTTPException(status_code=404, detail="Group Not Found")
+    headers = {"ETag": cached.etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), cached.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=cached.body, media_type="application/json", headers=headers)
+
+
+@router.get("/groups/{group_id}/availability/stream")
+async def stream_group_availability_events(group_id: str):
+    """
+    Server-Sent Events feed of room availability for a group microsite.
+    Sends the current config as a 'snapshot' event, then 'availability' deltas
+    and waitlist 'offer' events (matched by the guest's waitlist ticket).
+    """
+    cached = await run_in_threadpool(group_config_cache.get, group_id)
+    if cached is None:
+        raise HTTPException(status_code=404, detail="Group Not Found")
+    # Subscribe first, then take the snapshot: a change landing in between
+    # arrives as a delta instead of being lost
+    subscriber = availability_hub.subscribe(cached.group_key)
+    cached = await run_in_threadpool(group_config_cache.get, group_id)
+    if cached is None:
+        availability_hub.unsubscribe(subscriber)
+        raise HTTPException(status_code=404, detail="Group Not Found")
+    return StreamingResponse(
+        stream_group_availability(availability_hub, subscriber, cached.body, cached.version),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(availability_hub.unsubscribe, subscriber)
+    )
+
+
+# Upper bound on groups per snapshot (bounds the SQL IN list and the Redis pipeline)
+MAX_SNAPSHOT_GROUPS = 1000
+
+
+@router.post("/availability/snapshot")
+def get_availability_snapshot_for_groups(request: AvailabilitySnapshotRequest):
+    """
+    Remaining rooms for every block of many groups (agent dashboards), in one
+    SQL query and one pipelined Redis call. Columnar: blocks.<field>[i]
+    describes block i, whose group is groups[blocks.group[i]].
+    """
+    if len(request.group_ids) > MAX_SNAPSHOT_GROUPS:
+        raise HTTPException(status_code=400,
+                            detail=f"At most {MAX_SNAPSHOT_GROUPS} groups per snapshot.")
+    with span("availability.snapshot", groups=len(request.group_ids)):
+        snapshot = get_availability_snapshot(request.group_ids)
+        body = dumps(snapshot)
+    return Response(content=body, media_type="application/json",
+                    headers={"Cache-Control": "no-store"})
+
+
+# group id -> venue city, oldest evicted first; groups do not move
+VENUE_CITY_CACHE_SIZE = 4096
+_venue_cities: "OrderedDict[str, str]" = OrderedDict()
+_venue_cities_lock = threading.Lock()
+
+
+def _venue_city(group_id: str) -> str:
+    """
+    Event city of a group ("" if unknown). Known cities are memoized, so
+    scoring costs no DB round trip; misses are not, so made-up ids never fill
+    the memo and a group created later is found.
+    """
+    city = _venue_cities.get(group_id)
+    if city is not None:
+        return city
+    city = (db.get_group(group_id) or {}).get("city") or ""
+    if city:
+        with _venue_cities_lock:
+            _venue_cities[group_id] = city
+            if len(_venue_cities) > VENUE_CITY_CACHE_SIZE:
+                _venue_cities.popitem(last=False)
+    return city
+
+
+def _score_cancellation_risk(request: BookingRequest) -> float:
+    """APT-1 cancellation risk for a booking request (0.5 when the model is offline)."""
     risk_score = 0.5
     if sklearn_pipeline:
         try:
-            mock_distance = 500.0
+            distance_km = origin_distance_km(request.origin_city, _venue_city(request.group_id))
             price_ratio = request.room_price / \
                 (request.avg_income_proxy if request.avg_income_proxy > 0 else 1.0)
             input_data = [[
-                mock_distance,
+                distance_km,
                 float(request.booking_lead_time),
                 float(price_ratio),
                 str(request.relation_to_host)
@@ -178,38 +407,116 @@ def initiate_booking(request: BookingRequest):
             logger.error("AI Feature processing failed: %s", e)
         except Exception as e:  # pylint: disable=broad-except
             logger.error("Unexpected AI Inference failure: %s", e)
+    return risk_score
 
-    try:
-        lock_token = acquire_inventory_lock(
-            request.group_id, request.room_type)
-    except InventoryFullException as exc:
-        raise HTTPException(status_code=409, detail="Sold Out!") from exc
 
-    # try:
-    #     total_cents = int(request.room_price * 100)
-    #     session = payment_engine.create_checkout_session(
-    #         guest_email=request.guest_email,
-    #         room_name=request.room_type,
-    #         total_amount_cents=total_cents,
-    #         agent_connect_id="acct_123456789",
-    #         markup_cents=5000
-    #     )
-    # except Exception as e:
-    #     release_inventory_lock(request.group_id, request.room_type, lock_token)
-    #     raise HTTPException(
-    #         status_code=500, detail="Payment Sync Error") from e
-
-    # STRICT MOCK MODE for Payments
-    session = {
-        "checkout_url": "https://checkout.stripe.com/test-mock-url",
-        "session_id": "sess_test_123"
-    }
+def _waitlisted(request: BookingRequest, position: int) -> FastJSONResponse:
+    """
+    409 for a sold-out block. `detail` stays "Sold Out!"; the guest's waitlist
+    place, ticket (matches SSE 'offer' events) and status URL sit beside it.
+    """
+    return FastJSONResponse(status_code=409, content={
+        "detail": "Sold Out!",
+        "waitlist_position": position,
+        "waitlist_ticket": waitlist_ticket(
+            request.group_id, request.room_type, request.guest_email),
+        "waitlist_url": f"/api/bookings/waitlist/{request.group_id}/{request.room_type}"
+    })
 
-    return {
-        "lock_token": lock_token,
-        "checkout_url": session["checkout_url"],
-        "risk_score": risk_score
-    }
+
+@router.post("/bookings/initiate", response_model=BookingResponse)
+def initiate_booking(request: BookingRequest):
+    """The Core Transaction Flow: AI Risk Check, Inventory Lock, and Payment Setup."""
+    with span("booking.initiate", group_id=request.group_id, room_type=request.room_type):
+        lock_token = None
+        if waitlist.enabled:
+            with span("booking.waitlist"):
+                # A promoted waiter claims the hold set aside for them; a guest
+                # still queued is answered before any scoring or locking.
+                lock_token = waitlist.claim(
+                    request.group_id, request.room_type, request.guest_email)
+                if lock_token is None:
+                    position = waitlist.position(
+                        request.group_id, request.room_type, request.guest_email)
+                    if position is not None:
+                        demand_aggregator.record_initiation(
+                            request.group_id, request.room_type)
+                        return _waitlisted(request, position)
+
+        with span("booking.risk_score"):
+            risk_score = _score_cancellation_risk(request)
+
+        if lock_token is None:
+            with span("booking.inventory_lock"):
+                try:
+                    lock_token = acquire_inventory_lock(
+                        request.group_id, request.room_type)
+                except InventoryFullException as exc:
+                    # Demand is counted, and guests queued, only for blocks
+                    # that exist, so made-up ids cannot grow either
+                    if db.get_block_counts(request.group_id, request.room_type) is None:
+                        raise HTTPException(status_code=409, detail="Sold Out!") from exc
+                    demand_aggregator.record_initiation(request.group_id, request.room_type)
+                    if not waitlist.enabled:
+                        raise HTTPException(status_code=409, detail="Sold Out!") from exc
+                    position = waitlist.enqueue(
+                        request.group_id, request.room_type, request.guest_email)
+                    return _waitlisted(request, position)
+        demand_aggregator.record_initiation(request.group_id, request.room_type)
+        demand_aggregator.record_hold(request.group_id, request.room_type)
+
+        with span("booking.guest_upsert"):
+            try:
+                db.upsert_guest(request.group_id, {
+                    "email": request.guest_email,
+                    "origin_city": request.origin_city,
+                    "apt1_cancellation_risk_score": round(risk_score, 2)
+                })
+            except Exception:
+                # Never strand the hold for its whole TTL on a DB error
+                release_inventory_lock(request.group_id, request.room_type, lock_token)
+                raise
+
+        with span("booking.checkout_session"):
+            # try:
+            #     total_cents = int(request.room_price * 100)
+            #     session = payment_engine.create_checkout_session(
+            #         guest_email=request.guest_email,
+            #         room_name=request.room_type,
+            #         total_amount_cents=total_cents,
+            #         agent_connect_id="acct_123456789",
+            #         markup_cents=5000,
+            #         booking_metadata={
+            #             "group_id": request.group_id,
+            #             "room_type": request.room_type,
+            #             "lock_token": lock_token
+            #         }
+            #     )
+            # except Exception as e:
+            #     release_inventory_lock(request.group_id, request.room_type, lock_token)
+            #     raise HTTPException(
+            #         status_code=500, detail="Payment Sync Error") from e
+
+            # STRICT MOCK MODE for Payments
+            session = {
+                "checkout_url": "https://checkout.stripe.com/test-mock-url",
+                "session_id": "sess_test_123"
+            }
+
+        return {
+            "lock_token": lock_token,
+            "checkout_url": session["checkout_url"],
+            "risk_score": risk_score
+        }
+
+
+@router.get("/bookings/waitlist/{group_id}/{room_type}")
+def get_waitlist_status(group_id: str, room_type: str, guest_email: str):
+    """
+    A sold-out guest's place in the block's waitlist. Once 'offered', the next
+    POST /bookings/initiate returns the room set aside for them.
+    """
+    return waitlist.status(group_id, room_type, guest_email)
 
 
 @router.post("/webhook/stripe")
@@ -217,55 +524,187 @@ async def stripe_webhook(request: Request):
     """Handles incoming Stripe webhooks for payment processing."""
     payload = await request.body()
     sig_header = request.headers.get('stripe-signature')
-    try:
-        success = payment_engine.handle_webhook(
-            payload, sig_header, "whsec_test_secret")
-        return {"status": "processed"} if success else {"status": "ignored"}
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e)) from e
+    with span("webhook.stripe"):
+        with span("webhook.verify"):
+            try:
+                session = payment_engine.handle_webhook(
+                    payload, sig_header, "whsec_test_secret")
+            except Exception as e:
+                raise HTTPException(status_code=400, detail=str(e)) from e
+        if not session:
+            return {"status": "ignored"}
+
+        metadata = session.get("metadata") or {}
+        if metadata.get("lock_token"):
+            with span("webhook.commit", group_id=metadata.get("group_id")):
+                try:
+                    commit_inventory_lock(
+                        metadata["group_id"], metadata["room_type"], metadata["lock_token"],
+                        payment=payment_engine.session_payment(session))
+                except HoldExpiredException as exc:
+                    # Acknowledged (a retry cannot revive the hold); the
+                    # payment is flagged for refund instead of overbooking
+                    logger.error("Refund Required for Session %s: %s",
+                                 session.get("id"), exc)
+                    return {"status": "refund_required"}
+                except InventoryFullException as exc:
+                    logger.error("Inventory Commit Failed for Session %s: %s",
+                                 session.get("id"), exc)
+                    raise HTTPException(
+                        status_code=409, detail="Commit Conflict") from exc
+        return {"status": "processed"}
 
 
 @router.post("/identity/verify", response_model=IdentityVerificationResponse)
 async def verify_identity(request: IdentityVerificationRequest):
     """Simulates a high-security identity verification process."""
-    verification_id = str(uuid.uuid4())
-    status = "passed"
-    risk = "Low"
-    if "terror" in request.guest_name.lower():
-        status, risk = "failed", "High"
+    return verify_guest_identity(request.guest_name, request.passport_number, request.id_type)
+
+
+def _score_guest_batch(group_id: str, guests: List[Dict[str, Any]]) -> List[float]:
+    """APT-1 cancellation risk for a batch of manifest guests in one predict_proba call."""
+    if not sklearn_pipeline:
+        return [0.5] * len(guests)
+    distances = origin_distances_km((g.get("origin_city") for g in guests), _venue_city(group_id))
+    rows = [[
+        float(km),
+        float(g["booking_lead_time"]),
+        float(g["room_price"] / (g["avg_income_proxy"] if g["avg_income_proxy"] > 0 else 1.0)),
+        str(g["relation_to_host"])
+    ] for g, km in zip(guests, distances)]
+    try:
+        return [float(p[1]) for p in sklearn_pipeline.predict_proba(rows)]
+    except Exception as e:  # pylint: disable=broad-except
+        logger.error("Batch AI Inference failed: %s", e)
+        return [0.5] * len(guests)
+
+
+# Manifest pipeline runner, started with the app; resumes jobs a crash left unfinished
+onboarding_engine = OnboardingEngine(score_batch=_score_guest_batch)
+ONBOARDING_POLL_SECONDS = 0.1
+ONBOARDING_REMOTE_POLL_SECONDS = 1.0
+
+
+def _onboarding_job(job_id: str):
+    """A job by id, or 404."""
+    job = onboarding_engine.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Onboarding job not found")
+    return job
+
+
+@router.post("/onboarding/jobs", status_code=202)
+def create_onboarding_job(request: OnboardingJobRequest):
+    """
+    Queues a guest manifest: identity check, APT-1 scoring and a room hold per
+    guest, run in the background. Poll the status URL or stream the results.
+    """
+    if not onboarding_engine.running:
+        raise HTTPException(status_code=503, detail="Onboarding Disabled")
+    if db.get_block_counts(request.group_id, request.room_type) is None:
+        raise HTTPException(status_code=404, detail="Inventory Block Not Found")
+    guests = [{**guest.model_dump(), "room_price": request.room_price}
+              for guest in request.guests]
+    try:
+        job = onboarding_engine.submit(request.group_id, request.room_type,
+                                       request.agent_id, guests)
+    except OnboardingException as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
     return {
-        "verification_id": verification_id,
-        "status": status,
-        "risk_assessment": risk,
-        "facial_match_probability": 0.98
+        "job_id": job.job_id,
+        "status": job.status,
+        "total": len(guests),
+        "status_url": f"/api/onboarding/jobs/{job.job_id}",
+        "results_url": f"/api/onboarding/jobs/{job.job_id}/results"
     }
 
 
-@router.get("/analytics/heatmap")
-def get_demand_heatmap():
-    """Returns simulated demand heatmap data for strategic visualizations."""
-    return {"regions": [{"city": "Bali", "demand_score": 850, "status": "Critical"}]}
+@router.get("/onboarding/jobs/{job_id}")
+def get_onboarding_job(job_id: str, since: int = 0):
+    """Job progress plus the per-guest results after cursor `since` (pass back `next`)."""
+    return _onboarding_job(job_id).summary(max(since, 0))
+
+
+@router.get("/onboarding/jobs/{job_id}/results")
+async def stream_onboarding_results(job_id: str):
+    """Per-guest results as NDJSON, streamed as the pipeline produces them."""
+    job = _onboarding_job(job_id)
+    # A job another worker runs is only visible through its checkpoint
+    local = onboarding_engine.owns(job_id)
+
+    async def lines():
+        nonlocal job
+        sent = 0
+        while True:
+            finished = job.finished or job.status == "interrupted"
+            results = job.results
+            while sent < len(results):
+                yield dumps(results[sent]) + b"\n"
+                sent += 1
+            if finished:
+                yield dumps({"done": job.status, "processed": sent}) + b"\n"
+                return
+            if local:
+                await asyncio.sleep(ONBOARDING_POLL_SECONDS)
+            else:
+                await asyncio.sleep(ONBOARDING_REMOTE_POLL_SECONDS)
+                job = await run_in_threadpool(onboarding_engine.get, job_id)
+                if job is None:
+                    return  # Checkpoint deleted (past retention)
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@router.get("/analytics/heatmap", response_model=Union[HeatmapRollup, HeatmapBreakdown])
+def get_demand_heatmap(city: Optional[str] = None):
+    """
+    Rolling demand per destination city, from booking-initiation and hold events.
+    Served from the aggregator's precomputed rollup (O(cities)), serialized once
+    per rebuild; pass ?city= for the per group / room type drill-down.
+    """
+    if city:
+        return FastJSONResponse({"city": city, "blocks": demand_aggregator.breakdown(city)})
+    return Response(content=demand_aggregator.rollup_body(), media_type="application/json")
 
 
 # --- New Advertised Feature Endpoints ---
 
+MOCK_LOGIN_BODY = StaticJSON({
+    "token": "mock_jwt_token_12345",
+    "user": {
+        "id": "u_001",
+        "name": "Operative 01",
+        "clearance": "Top Secret"
+    }
+})
+
+
 @router.post("/auth/login")
 def auth_login(request: Request):
     """
     Mock Authentication Endpoint.
     Resolves the console 405 error.
     """
-    return {
-        "token": "mock_jwt_token_12345",
-        "user": {
-            "id": "u_001",
-            "name": "Operative 01",
-            "clearance": "Top Secret"
-        }
-    }
+    return MOCK_LOGIN_BODY.response()
+
+
+# Fallback Mock Data so localhost 'works' visibly (static: serialized once)
+MOCK_HOTEL_SEARCH_BODY = StaticJSON({
+    "status": "mock_fallback",
+    "provider": "TBO (Simulated)",
+    "data": {
+        "HotelResult": [
+            {"HotelName": "Grand Hyatt Bali",
+                "StarRating": 5, "Price": 250},
+            {"HotelName": "Ubud Hanging Gardens",
+                "StarRating": 5, "Price": 450}
+        ]
+    },
+    "error_detail": "Mock Mode Enforced"
+})
 
 
-@router.get("/hotels/search")
+@router.get("/hotels/search", response_model=HotelSearchResponse)
 def search_hotels(city: str, nights: int = 1):
     """
     TBO CONNECT: Live Hotel Search (Advertised Feature #2).
@@ -285,20 +724,7 @@ def search_hotels(city: str, nights: int = 1):
     # except Exception as e:  # pylint: disable=broad-except
     #     logger.error("TBO Search Error: %s", e)
 
-    # Fallback Mock Data so localhost 'works' visibly
-    return {
-        "status": "mock_fallback",
-        "provider": "TBO (Simulated)",
-        "data": {
-            "HotelResult": [
-                {"HotelName": "Grand Hyatt Bali",
-                    "StarRating": 5, "Price": 250},
-                {"HotelName": "Ubud Hanging Gardens",
-                    "StarRating": 5, "Price": 450}
-            ]
-        },
-        "error_detail": "Mock Mode Enforced"
-    }
+    return MOCK_HOTEL_SEARCH_BODY.response()
 
 
 @router.post("/growth/referral-link")
@@ -331,50 +757,40 @@ def debug_frontend():
     return {"dist_exists": False, "cwd": os.getcwd()}
 
 
-async def get_corrected_index():
-    """Reads index.html and replaces stale asset links with actual files on disk."""
-    index_file = os.path.join(FRONTEND_DIST, "index.html")
-    if not os.path.exists(index_file):
-        return None
-    with open(index_file, "r", encoding="utf-8") as f:
-        content = f.read()
-    assets_dir = os.path.join(FRONTEND_DIST, "assets")
-    if os.path.exists(assets_dir):
-        js, css = "", ""
-        for f in os.listdir(assets_dir):
-            if f.startswith("index-") and f.endswith(".js"):
-                js = f
-            elif f.startswith("index-") and f.endswith(".css"):
-                css = f
-        if js:
-            content = re.sub(
-                r'src="/assets/index-[^"]+\.js"', f'src="/assets/{js}"', content)
-        if css:
-            content = re.sub(
-                r'href="/assets/index-[^"]+\.css"', f'href="/assets/{css}"', content)
-    return content
+spa_shell = SpaShell(FRONTEND_DIST)
+
+
+def _serve_entry(entry: StaticEntry, request: Request) -> Response:
+    """Serves an indexed file: 304, precompressed bytes, or a disk stream."""
+    headers = {"ETag": entry.etag, "Cache-Control": entry.cache_control}
+    if etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers=headers)
+    if entry.body is None:
+        return FileResponse(entry.path, stat_result=entry.stat,
+                            media_type=entry.content_type, headers=headers)
+    payload, encoding = pick_encoding(
+        request.headers.get("accept-encoding"), entry.body)
+    headers["Vary"] = "Accept-Encoding"
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=payload, media_type=entry.content_type, headers=headers)
 
 
 @app.get("/{full_path:path}")
-async def serve_frontend(full_path: str):
+async def serve_frontend(full_path: str, request: Request):
     """Serves the React frontend and handles client-side SPA routing."""
     if full_path.startswith("api/"):
         raise HTTPException(status_code=404)
     clean_path = full_path.strip("/")
-    if not clean_path:
-        content = await get_corrected_index()
-        if content:
-            return HTMLResponse(content=content)
-        return JSONResponse(status_code=404, content={"e": "No Index"})
-
-    file_path = os.path.join(FRONTEND_DIST, clean_path)
-    if os.path.exists(file_path) and os.path.isfile(file_path):
-        return FileResponse(file_path)
-
-    content = await get_corrected_index()
-    if content:
-        return HTMLResponse(content=content)
-    return JSONResponse(status_code=404, content={"e": "No Build"})
+    if clean_path:
+        entry = spa_shell.lookup(clean_path)
+        if entry is not None:
+            return _serve_entry(entry, request)
+
+    if spa_shell.index is not None:
+        return _serve_entry(spa_shell.index, request)
+    return JSONResponse(status_code=404,
+                        content={"e": "No Build" if clean_path else "No Index"})
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,206 @@
+"""
+Request Instrumentation
+-----------------------
+Low-overhead per-route request metrics with a Prometheus text exporter, plus
+sampled, structured, non-blocking access logging.
+
+- Counters per (method, route, status) and latency histograms per (method, route).
+- In-flight gauge.
+- Routes are labelled by their template (/api/groups/{group_id}), never the raw
+  URL, so label cardinality stays bounded.
+- Access logs are JSON lines handed to a QueueHandler; a background listener
+  does the actual stdout I/O, so the event loop never blocks on it.
+
+All updates happen on the event loop thread, so no locks are needed.
+"""
+
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import time
+from bisect import bisect_left
+from typing import Dict, List, Tuple
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Histogram upper bounds in seconds (+Inf is implicit)
+LATENCY_BUCKETS: Tuple[float, ...] = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+ACCESS_LOG_SAMPLE_RATE = float(os.getenv("ANCILE_ACCESS_LOG_SAMPLE_RATE", "0.01"))
+# Requests slower than this are always logged
+ACCESS_LOG_SLOW_SECONDS = float(os.getenv("ANCILE_ACCESS_LOG_SLOW_SECONDS", "1.0"))
+
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+class _Histogram:
+    """Fixed-bucket latency histogram (non-cumulative counts)."""
+
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts: List[int] = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        """Adds one sample."""
+        self.counts[bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """
+    In-process request metrics store.
+    """
+
+    def __init__(self):
+        self.requests: Dict[Tuple[str, str, int], int] = {}
+        self.latency: Dict[Tuple[str, str], _Histogram] = {}
+        self.in_flight = 0
+        self.started_at = time.time()
+
+    def observe(self, method: str, route: str, status: int, seconds: float):
+        """Records one finished request."""
+        key = (method, route, status)
+        self.requests[key] = self.requests.get(key, 0) + 1
+        hist_key = (method, route)
+        hist = self.latency.get(hist_key)
+        if hist is None:
+            hist = self.latency[hist_key] = _Histogram()
+        hist.observe(seconds)
+
+    def render_prometheus(self) -> str:
+        """Exports all metrics in Prometheus text exposition format."""
+        lines = [
+            "# HELP ancile_http_requests_total Finished HTTP requests.",
+            "# TYPE ancile_http_requests_total counter",
+        ]
+        for (method, route, status), value in sorted(self.requests.items()):
+            lines.append(
+                f'ancile_http_requests_total{{method="{method}",route="{_escape(route)}",'
+                f'status="{status}"}} {value}')
+
+        lines += [
+            "# HELP ancile_http_request_duration_seconds HTTP request latency.",
+            "# TYPE ancile_http_request_duration_seconds histogram",
+        ]
+        for (method, route), hist in sorted(self.latency.items()):
+            labels = f'method="{method}",route="{_escape(route)}"'
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, hist.counts):
+                cumulative += count
+                lines.append(
+                    f'ancile_http_request_duration_seconds_bucket{{{labels},le="{bound}"}} '
+                    f'{cumulative}')
+            lines.append(
+                f'ancile_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} '
+                f'{hist.count}')
+            lines.append(
+                f"ancile_http_request_duration_seconds_sum{{{labels}}} {hist.total:.6f}")
+            lines.append(
+                f"ancile_http_request_duration_seconds_count{{{labels}}} {hist.count}")
+
+        lines += [
+            "# HELP ancile_http_requests_in_flight Requests currently being served.",
+            "# TYPE ancile_http_requests_in_flight gauge",
+            f"ancile_http_requests_in_flight {self.in_flight}",
+            "# HELP ancile_process_start_time_seconds Start time of the process.",
+            "# TYPE ancile_process_start_time_seconds gauge",
+            f"ancile_process_start_time_seconds {self.started_at:.3f}",
+        ]
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    """Escapes a Prometheus label value."""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _build_access_logger() -> logging.Logger:
+    """JSON-line access logger whose I/O runs on a background listener thread."""
+    access = logging.getLogger("ancile_backend.access")
+    if access.level == logging.NOTSET:
+        access.setLevel(logging.INFO)
+    access.propagate = False
+    if not access.handlers:
+        log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+        stream = logging.StreamHandler()
+        stream.setFormatter(logging.Formatter("%(message)s"))
+        listener = logging.handlers.QueueListener(log_queue, stream)
+        listener.start()
+        access.addHandler(logging.handlers.QueueHandler(log_queue))
+    return access
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware (no BaseHTTPMiddleware task / stream overhead)
+    recording latency, status and in-flight count for every HTTP request.
+    """
+
+    def __init__(self, app, registry: MetricsRegistry = None,
+                 sample_rate: float = ACCESS_LOG_SAMPLE_RATE,
+                 access_logger: logging.Logger = None):
+        self.app = app
+        self.registry = registry if registry is not None else metrics_registry
+        self.sample_rate = sample_rate
+        self.access_logger = access_logger
+        self._random = random.random
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        registry = self.registry
+        status_holder = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder[0] = message["status"]
+            await send(message)
+
+        registry.in_flight += 1
+        started = time.perf_counter()
+        error = None
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            registry.in_flight -= 1
+            route = scope.get("route")
+            route_path = getattr(route, "path", UNMATCHED_ROUTE)
+            status = status_holder[0]
+            registry.observe(scope["method"], route_path, status, elapsed)
+            if error is not None or status >= 500 or elapsed >= ACCESS_LOG_SLOW_SECONDS \
+                    or self._random() < self.sample_rate:
+                self._log_access(scope, route_path, status, elapsed, error)
+
+    def _log_access(self, scope, route_path, status, elapsed, error):
+        """Emits one structured access-log line (queued, non-blocking)."""
+        if self.access_logger is None:
+            self.access_logger = _build_access_logger()
+        record = {
+            "ts": round(time.time(), 3),
+            "method": scope["method"],
+            "path": scope["path"],
+            "route": route_path,
+            "status": status,
+            "duration_ms": round(elapsed * 1000, 3),
+        }
+        if error is not None:
+            record["error"] = repr(error)
+        self.access_logger.info(json.dumps(record, separators=(",", ":")))
+
+
+metrics_registry = MetricsRegistry()
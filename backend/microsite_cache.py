@@ -0,0 +1,160 @@
+"""
+Microsite Config Cache
+----------------------
+Serves the guest-facing group microsite config from a per-group cache.
+Entries are pre-serialized with a strong ETag so repeat polls can be answered
+with 304 Not Modified without rebuilding the payload.
+
+Invalidation: every hold / release / commit bumps the group's inventory version
+in Redis (see inventory_defense), so any worker revalidates with a single GET.
+A short max-age covers holds that silently expire via TTL.
+"""
+
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, NamedTuple, Optional
+
+from backend.fast_json import dumps
+from backend.inventory_defense import get_group_availability, get_inventory_version
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+CACHE_MAX_AGE_SECONDS = 15.0
+CACHE_MAX_GROUPS = 10_000
+
+
+class CachedPayload(NamedTuple):
+    """A pre-serialized response body and its validators."""
+    group_key: str  # Resolved group id (requests may use the subdomain)
+    body: bytes
+    etag: str
+    version: int
+    built_at: float
+
+
+def build_group_config(group_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Builds the microsite payload from group / block data and live hold counts.
+    """
+    availability = get_group_availability(group_id)
+    if availability is None:
+        return None
+    group = availability["group"]
+    return {
+        "group_id": group["id"],
+        "name": group["name"],
+        "event_date": group["event_date"],
+        "microsite_url": f"https://{group['subdomain']}.ancile.app",
+        "theme": group.get("theme", "dark_modern"),
+        "inventory": availability["blocks"]
+    }
+
+
+def compute_etag(body: bytes) -> str:
+    """Strong ETag derived from the serialized body."""
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Evaluates an If-None-Match header against the current ETag."""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+class GroupConfigCache:
+    """
+    Per-group cache of serialized microsite configs.
+    """
+
+    def __init__(
+        self,
+        builder: Callable[[str], Optional[Dict[str, Any]]] = build_group_config,
+        version_fn: Callable[[str], int] = get_inventory_version,
+        max_age: float = CACHE_MAX_AGE_SECONDS
+    ):
+        self.builder = builder
+        self.version_fn = version_fn
+        self.max_age = max_age
+        self._entries: "OrderedDict[str, CachedPayload]" = OrderedDict()
+        self._build_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _is_fresh(self, entry: CachedPayload, version: int) -> bool:
+        """Entry is valid for the current version and still within max-age."""
+        return entry.version == version and \
+            (time.monotonic() - entry.built_at) < self.max_age
+
+    def get(self, group_id: str) -> Optional[CachedPayload]:
+        """
+        Returns the cached payload for a group, rebuilding it if stale.
+        Returns None if the group does not exist.
+        """
+        entry = self._entries.get(group_id)
+        group_key = entry.group_key if entry is not None else group_id
+        version = self.version_fn(group_key)
+        if entry is not None and self._is_fresh(entry, version):
+            self.hits += 1
+            return entry
+
+        with self._lock:
+            build_lock = self._build_locks.setdefault(group_id, threading.Lock())
+
+        # Single-flight: concurrent pollers of one group share a single rebuild
+        with build_lock:
+            entry = self._entries.get(group_id)
+            if entry is not None and self._is_fresh(entry, version):
+                self.hits += 1
+                return entry
+
+            self.misses += 1
+            payload = None
+            try:
+                payload = self.builder(group_id)
+            finally:
+                if payload is None:
+                    # Unknown group (or failed build): keep no lock for it,
+                    # so probing random ids cannot grow the map
+                    with self._lock:
+                        self._entries.pop(group_id, None)
+                        self._build_locks.pop(group_id, None)
+            if payload is None:
+                return None
+            if payload["group_id"] != group_key:
+                # First lookup by subdomain: version lives under the real id
+                group_key = payload["group_id"]
+                version = self.version_fn(group_key)
+            body = dumps(payload)
+            entry = CachedPayload(
+                group_key, body, compute_etag(body), version, time.monotonic())
+            with self._lock:
+                self._entries[group_id] = entry
+                self._entries.move_to_end(group_id)
+                while len(self._entries) > CACHE_MAX_GROUPS:
+                    evicted, _ = self._entries.popitem(last=False)
+                    self._build_locks.pop(evicted, None)
+            return entry
+
+    def invalidate(self, group_id: str):
+        """Drops a group's cached payload in this worker."""
+        with self._lock:
+            self._entries.pop(group_id, None)
+
+    def clear(self):
+        """Drops every cached payload in this worker."""
+        with self._lock:
+            self._entries.clear()
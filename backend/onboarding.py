@@ -0,0 +1,517 @@
+"""
+Bulk Guest Onboarding
+---------------------
+Runs a whole guest manifest (identity check -> APT-1 risk score -> room hold)
+as one background job instead of two HTTP calls per guest.
+
+Pipeline (one per job, on the onboarding runner's own event loop):
+
+    manifest -> [identity x IDENTITY_CONCURRENCY] -> [score, batched] -> [hold x HOLD_CONCURRENCY]
+
+- Stages are connected by bounded queues, so a slow stage back-pressures the
+  ones before it. Blocking work runs on one shared, bounded thread pool.
+- Scoring is vectorized: up to SCORE_BATCH guests per predict_proba call,
+  followed by one bulk guest upsert.
+- Each finished guest is appended to the job's checkpoint file (JSON lines:
+  a manifest line, one line per guest, a final 'done' line). On restart,
+  unfinished jobs resume with only the guests that are missing. Finished
+  checkpoints are deleted after RETENTION_HOURS.
+- A running job holds an exclusive lock on its checkpoint, so when several
+  workers start on the same directory each unfinished job is resumed once.
+- Hold tokens are derived from (job, guest), and acquire_inventory_lock is
+  idempotent for a known token. A guest who was held just before a crash
+  keeps that one hold instead of getting a second.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    import fcntl  # POSIX only; without it checkpoints are not locked
+except ImportError:  # pragma: no cover - depends on the platform
+    fcntl = None
+
+from backend import db
+from backend.inventory_defense import InventoryFullException, acquire_inventory_lock
+from backend.waitlist import waitlist
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+ONBOARDING_DIR = os.getenv("ANCILE_ONBOARDING_DIR",
+                           os.path.join(tempfile.gettempdir(), "ancile-onboarding"))
+IDENTITY_CONCURRENCY = int(os.getenv("ANCILE_ONBOARDING_IDENTITY_CONCURRENCY", "16"))
+HOLD_CONCURRENCY = int(os.getenv("ANCILE_ONBOARDING_HOLD_CONCURRENCY", "8"))
+SCORE_BATCH = 64
+SCORE_FLUSH_SECONDS = 0.02
+STAGE_QUEUE_SIZE = 128
+FSYNC_EVERY = 32
+JOBS_IN_MEMORY = 200
+# Finished checkpoints older than this are deleted when the engine starts
+RETENTION_HOURS = float(os.getenv("ANCILE_ONBOARDING_RETENTION_HOURS", "72"))
+# Bytes read from the end of a checkpoint to find its 'done' line
+TAIL_BYTES = 4096
+MAX_MANIFEST_GUESTS = 5000
+
+# Per-guest outcomes
+HELD = "held"
+WAITLISTED = "waitlisted"
+SOLD_OUT = "sold_out"
+IDENTITY_FAILED = "identity_failed"
+ERROR = "error"
+
+ScoreBatch = Callable[[str, List[Dict[str, Any]]], List[float]]
+
+
+class OnboardingException(Exception):
+    """Base exception for onboarding jobs."""
+
+
+def verify_guest_identity(guest_name: str, passport_number: str,
+                          id_type: str = "Passport") -> Dict[str, Any]:
+    """Simulates a high-security identity verification process."""
+    _ = (passport_number, id_type)
+    status, risk = "passed", "Low"
+    if "terror" in guest_name.lower():
+        status, risk = "failed", "High"
+    return {
+        "verification_id": str(uuid.uuid4()),
+        "status": status,
+        "risk_assessment": risk,
+        "facial_match_probability": 0.98
+    }
+
+
+def _neutral_scores(group_id: str, guests: List[Dict[str, Any]]) -> List[float]:
+    """Fallback scorer (APT-1 offline)."""
+    _ = group_id
+    return [0.5] * len(guests)
+
+
+class OnboardingJob:
+    """One manifest being onboarded, plus its results so far."""
+
+    def __init__(self, job_id: str, group_id: str, room_type: str, agent_id: str,
+                 guests: List[Dict[str, Any]], created_at: Optional[float] = None):
+        self.job_id = job_id
+        self.group_id = group_id
+        self.room_type = room_type
+        self.agent_id = agent_id
+        self.guests = guests
+        self.created_at = created_at or time.time()
+        self.results: List[Dict[str, Any]] = []
+        self.done_indices = set()
+        self.status = "queued"
+        self.error: Optional[str] = None
+        self.finished_at: Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        """True once no more results will be added."""
+        return self.status in ("completed", "failed")
+
+    def manifest(self) -> Dict[str, Any]:
+        """Checkpoint header."""
+        return {"job_id": self.job_id, "group_id": self.group_id, "room_type": self.room_type,
+                "agent_id": self.agent_id, "created_at": self.created_at,
+                "guests": self.guests}
+
+    def add_result(self, result: Dict[str, Any]):
+        """Records one finished guest."""
+        self.done_indices.add(result["i"])
+        self.results.append(result)
+
+    def summary(self, since: int = 0) -> Dict[str, Any]:
+        """Status, counts by outcome, and the results after cursor `since`."""
+        counts: Dict[str, int] = {}
+        results = self.results
+        for result in results:
+            counts[result["status"]] = counts.get(result["status"], 0) + 1
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "group_id": self.group_id,
+            "room_type": self.room_type,
+            "total": len(self.guests),
+            "processed": len(results),
+            "counts": counts,
+            "error": self.error,
+            "results": results[since:],
+            "next": len(results),
+        }
+
+
+class _Checkpoint:
+    """
+    Append-only JSON-lines checkpoint of one job. Opening it takes an exclusive
+    lock (BlockingIOError if another process is running the job).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "a+", encoding="utf-8")  # pylint: disable=consider-using-with
+        if fcntl is not None:
+            try:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                self._file.close()
+                raise
+        self._unsynced = 0
+        if self._file.tell():
+            self._file.seek(self._file.tell() - 1)
+            if self._file.read(1) != "\n":
+                self._file.write("\n")  # Close off a line torn by a crash
+
+    def write(self, record: Dict[str, Any], sync: bool = False):
+        """Appends one record (fsync'd every FSYNC_EVERY records and on demand)."""
+        self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self._file.flush()
+        self._unsynced += 1
+        if sync or self._unsynced >= FSYNC_EVERY:
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+
+    def close(self):
+        """Syncs and closes the file."""
+        if not self._file.closed:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+
+    @staticmethod
+    def in_use(path: str) -> bool:
+        """True while some process (this one included) is running the job."""
+        if fcntl is None:
+            return True
+        with open(path, "r", encoding="utf-8") as f:
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return True
+        return False
+
+    @staticmethod
+    def finished(path: str) -> Optional[bool]:
+        """
+        Whether the last line is a 'done' record, read from the file's tail
+        only (None when it cannot tell, e.g. an oversized final line).
+        """
+        with open(path, "rb") as f:
+            f.seek(max(os.fstat(f.fileno()).st_size - TAIL_BYTES, 0))
+            lines = f.read().splitlines()
+        try:
+            return "done" in json.loads(lines[-1]) if len(lines) > 1 else False
+        except ValueError:
+            return None
+
+    @staticmethod
+    def load(path: str) -> Optional[OnboardingJob]:
+        """Rebuilds a job from its checkpoint (None if the header is unreadable)."""
+        job = None
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # Line torn by a crash; its guest is simply redone
+                if job is None:
+                    if "guests" not in record:
+                        return None
+                    job = OnboardingJob(record["job_id"], record["group_id"],
+                                        record["room_type"], record["agent_id"],
+                                        record["guests"], record["created_at"])
+                elif "done" in record:
+                    job.status = record["done"]
+                    job.error = record.get("error")
+                    job.finished_at = record.get("at")
+                elif record["i"] not in job.done_indices:
+                    job.add_result(record)
+        return job
+
+
+class OnboardingEngine:
+    """
+    Accepts manifests and runs them as staged pipelines on a background
+    event loop.
+    """
+
+    def __init__(self, score_batch: Optional[ScoreBatch] = None,
+                 verify: Callable[..., Dict[str, Any]] = verify_guest_identity,
+                 directory: str = ONBOARDING_DIR,
+                 identity_concurrency: int = IDENTITY_CONCURRENCY,
+                 hold_concurrency: int = HOLD_CONCURRENCY):
+        self.score_batch = score_batch or _neutral_scores
+        self.verify = verify
+        self.directory = directory
+        self.identity_concurrency = identity_concurrency
+        self.hold_concurrency = hold_concurrency
+        self.jobs: "OrderedDict[str, OnboardingJob]" = OrderedDict()
+        self._executor = ThreadPoolExecutor(
+            max_workers=identity_concurrency + hold_concurrency + 2,
+            thread_name_prefix="onboarding")
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._tasks: Dict[str, "asyncio.Future"] = {}
+        self._lock = threading.Lock()
+
+    # --- Lifecycle ---
+
+    def start(self) -> int:
+        """Starts the runner loop and resumes unfinished jobs. Returns how many."""
+        if self._thread is not None:
+            return 0
+        os.makedirs(self.directory, exist_ok=True)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever,
+                                        name="onboarding-runner", daemon=True)
+        self._thread.start()
+        return self.resume()
+
+    def stop(self):
+        """Cancels running jobs (their checkpoints stay resumable) and stops the loop."""
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._cancel_all(), self._loop).result(timeout=10)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        self._loop.close()
+        self._loop = self._thread = None
+        self._tasks.clear()
+
+    @staticmethod
+    async def _cancel_all():
+        """Cancels every job task and waits for it to unwind."""
+        tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    @property
+    def running(self) -> bool:
+        """True while the runner loop accepts jobs."""
+        return self._loop is not None
+
+    def owns(self, job_id: str) -> bool:
+        """True if this engine ran (or is running) the job, so its object is live."""
+        return job_id in self.jobs
+
+    def resume(self) -> int:
+        """
+        Restarts every job whose checkpoint has no 'done' line, and deletes
+        finished checkpoints past the retention window.
+        """
+        resumed = 0
+        expired_before = time.time() - RETENTION_HOURS * 3600
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith(".jsonl") or name[:-len(".jsonl")] in self._tasks:
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                if _Checkpoint.finished(path):
+                    if os.path.getmtime(path) < expired_before:
+                        os.remove(path)
+                    continue
+            except OSError:
+                continue  # Deleted by another worker meanwhile
+            try:
+                checkpoint = _Checkpoint(path)
+            except BlockingIOError:
+                continue  # Another worker is running it
+            job = _Checkpoint.load(path)
+            if job is None or job.finished:
+                checkpoint.close()
+                continue
+            logger.info("Resuming onboarding job %s (%d/%d guests done)",
+                        job.job_id, len(job.results), len(job.guests))
+            self._schedule(job, checkpoint)
+            resumed += 1
+        return resumed
+
+    # --- Jobs ---
+
+    def _path(self, job_id: str) -> str:
+        return os.path.join(self.directory, f"{job_id}.jsonl")
+
+    def _remember(self, job: OnboardingJob):
+        """Keeps recent jobs in memory; older ones are reloaded from disk."""
+        with self._lock:
+            self.jobs[job.job_id] = job
+            self.jobs.move_to_end(job.job_id)
+            while len(self.jobs) > JOBS_IN_MEMORY:
+                oldest_id, oldest = next(iter(self.jobs.items()))
+                if not oldest.finished:
+                    break
+                del self.jobs[oldest_id]
+
+    def _schedule(self, job: OnboardingJob, checkpoint: "_Checkpoint"):
+        self._remember(job)
+        self._tasks[job.job_id] = asyncio.run_coroutine_threadsafe(
+            self._run(job, checkpoint), self._loop)
+
+    def submit(self, group_id: str, room_type: str, agent_id: str,
+               guests: List[Dict[str, Any]]) -> OnboardingJob:
+        """Checkpoints the manifest and queues the job."""
+        if len(guests) > MAX_MANIFEST_GUESTS:
+            raise OnboardingException(f"At most {MAX_MANIFEST_GUESTS} guests per job.")
+        if self._loop is None:
+            raise OnboardingException("Onboarding runner is not started.")
+        job = OnboardingJob(uuid.uuid4().hex, group_id, room_type, agent_id, guests)
+        checkpoint = _Checkpoint(self._path(job.job_id))
+        checkpoint.write(job.manifest(), sync=True)
+        self._schedule(job, checkpoint)
+        return job
+
+    def get(self, job_id: str) -> Optional[OnboardingJob]:
+        """
+        A job by id: the live object if this engine runs it, else a fresh read
+        of its checkpoint ('running' if another worker holds it, 'interrupted'
+        if nobody does).
+        """
+        job = self.jobs.get(job_id)
+        if job is None and all(c.isalnum() for c in job_id):
+            path = self._path(job_id)
+            try:
+                job = _Checkpoint.load(path)
+                if job is not None and not job.finished:
+                    job.status = "running" if _Checkpoint.in_use(path) else "interrupted"
+            except FileNotFoundError:
+                return None
+        return job
+
+    # --- Pipeline ---
+
+    def hold_token(self, job: OnboardingJob, index: int) -> str:
+        """Deterministic lock token of one guest in one job."""
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f"ancile-onboarding:{job.job_id}:{index}"))
+
+    def _hold(self, job: OnboardingJob, index: int) -> Dict[str, Any]:
+        """Stage 3 (blocking): holds a room, or queues the guest if the block is full."""
+        guest = job.guests[index]
+        try:
+            token = acquire_inventory_lock(job.group_id, job.room_type,
+                                           lock_token=self.hold_token(job, index))
+            return {"status": HELD, "lock_token": token}
+        except InventoryFullException:
+            if not waitlist.enabled:
+                return {"status": SOLD_OUT}
+            position = waitlist.enqueue(job.group_id, job.room_type, guest["guest_email"])
+            return {"status": WAITLISTED, "waitlist_position": position}
+
+    def _score(self, job: OnboardingJob, batch: List[Tuple[int, str]]) -> List[float]:
+        """Stage 2 (blocking): one vectorized APT-1 call plus one bulk guest upsert."""
+        guests = [job.guests[i] for i, _ in batch]
+        scores = [round(float(s), 4) for s in self.score_batch(job.group_id, guests)]
+        db.upsert_guests(job.group_id, (
+            {"email": g["guest_email"], "origin_city": g.get("origin_city"),
+             "apt1_cancellation_risk_score": round(score, 2)}
+            for g, score in zip(guests, scores)))
+        return scores
+
+    async def _run(self, job: OnboardingJob, checkpoint: "_Checkpoint"):
+        """Runs the remaining guests of a job through the three stages."""
+        loop = asyncio.get_running_loop()
+        job.status = "running"
+        to_identity: asyncio.Queue = asyncio.Queue(STAGE_QUEUE_SIZE)
+        to_score: asyncio.Queue = asyncio.Queue(STAGE_QUEUE_SIZE)
+        to_hold: asyncio.Queue = asyncio.Queue(STAGE_QUEUE_SIZE)
+
+        def record(index: int, **fields):
+            result = {"i": index, "guest_email": job.guests[index]["guest_email"], **fields}
+            job.add_result(result)
+            checkpoint.write(result)
+
+        async def feed():
+            for index in range(len(job.guests)):
+                if index not in job.done_indices:
+                    await to_identity.put(index)
+            for _ in range(self.identity_concurrency):
+                await to_identity.put(None)
+
+        async def identity_worker():
+            while (index := await to_identity.get()) is not None:
+                guest = job.guests[index]
+                try:
+                    verdict = await loop.run_in_executor(
+                        self._executor, self.verify, guest["guest_name"],
+                        guest.get("passport_number", ""), guest.get("id_type", "Passport"))
+                except Exception as e:  # pylint: disable=broad-except
+                    record(index, status=ERROR, stage="identity", detail=str(e))
+                    continue
+                if verdict["status"] != "passed":
+                    record(index, status=IDENTITY_FAILED,
+                           verification_id=verdict["verification_id"])
+                    continue
+                await to_score.put((index, verdict["verification_id"]))
+
+        async def scorer():
+            closed = False
+            while not closed:
+                item = await to_score.get()
+                if item is None:
+                    break
+                batch = [item]
+                while len(batch) < SCORE_BATCH:
+                    try:
+                        item = await asyncio.wait_for(to_score.get(), SCORE_FLUSH_SECONDS)
+                    except asyncio.TimeoutError:
+                        break
+                    if item is None:
+                        closed = True
+                        break
+                    batch.append(item)
+                try:
+                    scores = await loop.run_in_executor(self._executor, self._score, job, batch)
+                except Exception as e:  # pylint: disable=broad-except
+                    for index, _ in batch:
+                        record(index, status=ERROR, stage="score", detail=str(e))
+                    continue
+                for (index, verification_id), score in zip(batch, scores):
+                    await to_hold.put((index, verification_id, score))
+
+        async def hold_worker():
+            while (item := await to_hold.get()) is not None:
+                index, verification_id, score = item
+                try:
+                    outcome = await loop.run_in_executor(self._executor, self._hold, job, index)
+                except Exception as e:  # pylint: disable=broad-except
+                    outcome = {"status": ERROR, "stage": "hold", "detail": str(e)}
+                record(index, verification_id=verification_id, risk_score=score, **outcome)
+
+        async def identity_stage():
+            await asyncio.gather(*(identity_worker() for _ in range(self.identity_concurrency)))
+            await to_score.put(None)
+
+        async def score_stage():
+            await scorer()
+            for _ in range(self.hold_concurrency):
+                await to_hold.put(None)
+
+        started = time.perf_counter()
+        try:
+            await asyncio.gather(feed(), identity_stage(), score_stage(),
+                                 *(hold_worker() for _ in range(self.hold_concurrency)))
+            job.status = "completed"
+        except asyncio.CancelledError:
+            # Stopped (shutdown): leave the checkpoint open-ended so it resumes
+            job.status = "interrupted"
+            checkpoint.close()
+            raise
+        except Exception as e:  # pylint: disable=broad-except
+            logger.error("Onboarding job %s failed: %s", job.job_id, e)
+            job.status, job.error = "failed", str(e)
+        job.finished_at = time.time()
+        checkpoint.write({"done": job.status, "error": job.error, "at": job.finished_at},
+                         sync=True)
+        checkpoint.close()
+        self._tasks.pop(job.job_id, None)
+        logger.info("Onboarding job %s %s: %d guests in %.2fs", job.job_id, job.status,
+                    len(job.results), time.perf_counter() - started)
@@ -3,71 +3,344 @@ Privacy Shield Engine
 ---------------------
 Handles local, edge-based processing of sensitive Guest PII using Ollama (Llama-3).
 Crucial for "Celebrity Shield" feature where names never leave the laptop.
+
+Most guest-list entries follow the "Name (VIP, Vegan)" convention, so a
+deterministic fast path classifies those with compiled keyword tables. Only the
+entries it cannot classify confidently are batched to the local LLM.
 """
 
+import hashlib
 import json
 import logging
-from typing import Dict, Any
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
 import requests
+from requests.adapters import HTTPAdapter
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
 # OLLAMA CONFIG
 # We assume Ollama is running on localhost:11434
-OLLAMA_URL = "http://localhost:11434/api/generate"
+OLLAMA_BASE_URL = "http://localhost:11434"
+OLLAMA_GENERATE_PATH = "/api/generate"
 MODEL_NAME = "llama3:8b-instruct-q4_0"  # Or just 'llama3' depending on pull
 
+# Max ambiguous entries sent to the LLM in a single prompt
+LLM_BATCH_SIZE = 25
+# Per-entry extraction cache (content hash -> (role, diet))
+CACHE_MAX_ENTRIES = 50_000
 
-class PrivacyShield:
+# Health probing: steady-state interval while up, exponential backoff while down
+PROBE_TIMEOUT_SECONDS = 1.0
+PROBE_INTERVAL_SECONDS = 5.0
+PROBE_BACKOFF_BASE_SECONDS = 0.5
+PROBE_BACKOFF_MAX_SECONDS = 8.0
+
+DEFAULT_ROLE = "Guest"
+DEFAULT_DIET = "None"
+UNRESOLVED = "Unclassified"
+
+# --- Compiled Keyword Tables ---
+# alias (normalized, lowercase) -> canonical label
+
+ROLE_KEYWORDS: Dict[str, str] = {
+    "vip": "VIP",
+    "ultra vip": "Ultra VIP",
+    "vvip": "Ultra VIP",
+    "celebrity": "Ultra VIP",
+    "bride": "Bride Side",
+    "bride side": "Bride Side",
+    "brides side": "Bride Side",
+    "bridal party": "Bride Side",
+    "bridesmaid": "Bride Side",
+    "groom": "Groom Side",
+    "groom side": "Groom Side",
+    "grooms side": "Groom Side",
+    "groomsman": "Groom Side",
+    "best man": "Groom Side",
+    "family": "Family",
+    "friend": "Friend",
+    "colleague": "Colleague",
+    "plus one": "Plus One",
+    "+1": "Plus One",
+    "child": "Child",
+    "kid": "Child",
+    "speaker": "Speaker",
+    "sponsor": "Sponsor",
+    "staff": "Staff",
+    "vendor": "Vendor",
+}
+
+DIET_KEYWORDS: Dict[str, str] = {
+    "vegan": "Vegan",
+    "veg": "Vegetarian",
+    "veggie": "Vegetarian",
+    "vegetarian": "Vegetarian",
+    "jain": "Jain",
+    "gf": "Gluten-Free",
+    "gluten free": "Gluten-Free",
+    "coeliac": "Gluten-Free",
+    "celiac": "Gluten-Free",
+    "df": "Dairy-Free",
+    "dairy free": "Dairy-Free",
+    "lactose free": "Dairy-Free",
+    "nut allergy": "Nut Allergy",
+    "nut free": "Nut Allergy",
+    "paleo": "Paleo",
+    "keto": "Keto",
+    "halal": "Halal",
+    "kosher": "Kosher",
+    "pescatarian": "Pescatarian",
+    "none": DEFAULT_DIET,
+    "no restrictions": DEFAULT_DIET,
+    "na": DEFAULT_DIET,
+}
+
+# Splits a line on commas / semicolons that are NOT inside (...)
+_ENTRY_SPLIT_RE = re.compile(r"[,;](?![^(]*\))")
+# "Name: tags" / "Name - tags" lines carry their own commas, keep them whole
+_TAIL_LINE_RE = re.compile(r"^[^(]*?(?::|\s-\s)")
+# Leading list markers: "1.", "2)", "-", "*", "•"
+_BULLET_RE = re.compile(r"^\s*(?:\d+[.)]|[-*•])\s*")
+# "Name (tag, tag)" or "Name - tag / tag" or "Name: tag"
+_TAGGED_RE = re.compile(r"^(?P<name>[^(:]+?)\s*(?:\((?P<paren>[^)]*)\)|(?:\s-\s|:)(?P<tail>.+))\s*$")
+_TAG_SPLIT_RE = re.compile(r"\s*[,/|&]\s*|\s+and\s+")
+_NA_RE = re.compile(r"\bn/a\b", re.IGNORECASE)
+_TAG_CLEAN_RE = re.compile(r"[^a-z0-9+/ ]")
+_WS_RE = re.compile(r"\s+")
+# 1-4 capitalised words, allowing initials, hyphens and apostrophes
+_NAME_RE = re.compile(r"^[A-Z][\w'.\-]*(?:\s+[A-Z][\w'.\-]*){0,3}$")
+
+_EXTRACTION_CACHE: "OrderedDict[str, Tuple[str, str]]" = OrderedDict()
+# Handlers run on the threadpool; OrderedDict reordering is not thread-safe
+_EXTRACTION_CACHE_LOCK = threading.Lock()
+
+
+def _normalize_tag(tag: str) -> str:
+    """Lowercases a tag and strips punctuation so aliases match the tables."""
+    tag = _TAG_CLEAN_RE.sub("", tag.lower().replace("-", " ").replace("'", ""))
+    return _WS_RE.sub(" ", tag).strip()
+
+
+def _entry_key(entry: str) -> str:
+    """Content hash of a single guest entry (the cache key)."""
+    return hashlib.blake2b(entry.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def split_entries(raw_text: str) -> List[str]:
+    """Splits a pasted guest list into individual guest entries."""
+    entries = []
+    for line in raw_text.splitlines():
+        line = _BULLET_RE.sub("", line)
+        chunks = [line] if _TAIL_LINE_RE.match(line) else _ENTRY_SPLIT_RE.split(line)
+        for chunk in chunks:
+            chunk = _WS_RE.sub(" ", chunk).strip()
+            if chunk:
+                entries.append(chunk)
+    return entries
+
+
+def classify_entry(entry: str) -> Optional[Tuple[str, str]]:
     """
-    Manages connection to local LLM for PII redaction.
+    Deterministic extractor for a single entry.
+    Returns (role, diet), or None if the entry is ambiguous and needs the LLM.
     """
+    match = _TAGGED_RE.match(entry)
+    if match:
+        name = match.group("name").strip()
+        tag_text = match.group("paren")
+        if tag_text is None:
+            tag_text = match.group("tail")
+    else:
+        name, tag_text = entry, ""
 
-    def __init__(self):
-        self.is_active = self._check_connection()
+    if not _NAME_RE.match(name):
+        return None
 
-    def _check_connection(self) -> bool:
-        """
-        Verifies if local Ollama instance is running.
-        """
+    roles: List[str] = []
+    diets: List[str] = []
+    for raw_tag in _TAG_SPLIT_RE.split(_NA_RE.sub("na", tag_text or "")):
+        tag = _normalize_tag(raw_tag)
+        if not tag:
+            continue
+        if tag in ROLE_KEYWORDS:
+            label = ROLE_KEYWORDS[tag]
+            if label not in roles:
+                roles.append(label)
+        elif tag in DIET_KEYWORDS:
+            label = DIET_KEYWORDS[tag]
+            if label not in diets:
+                diets.append(label)
+        else:
+            # Unknown token: not confident enough to classify without the LLM
+            return None
+
+    diets = [d for d in diets if d != DEFAULT_DIET] or [DEFAULT_DIET]
+    return (", ".join(roles) or DEFAULT_ROLE, ", ".join(diets))
+
+
+def _cache_get(key: str) -> Optional[Tuple[str, str]]:
+    """LRU read from the shared extraction cache."""
+    with _EXTRACTION_CACHE_LOCK:
+        value = _EXTRACTION_CACHE.get(key)
+        if value is not None:
+            _EXTRACTION_CACHE.move_to_end(key)
+        return value
+
+
+def _cache_put(key: str, value: Tuple[str, str]):
+    """LRU write to the shared extraction cache."""
+    with _EXTRACTION_CACHE_LOCK:
+        _EXTRACTION_CACHE[key] = value
+        _EXTRACTION_CACHE.move_to_end(key)
+        while len(_EXTRACTION_CACHE) > CACHE_MAX_ENTRIES:
+            _EXTRACTION_CACHE.popitem(last=False)
+
+
+class OllamaHealthProber:
+    """
+    Background health prober for the local Ollama instance.
+    Keeps a cached up/down status so callers never block on a network check,
+    and shares one pooled HTTP session for all traffic to the local LLM.
+    """
+
+    def __init__(self, base_url: str = OLLAMA_BASE_URL):
+        self.base_url = base_url
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=8)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.is_up = False
+        self.last_checked = 0.0
+        self.consecutive_failures = 0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        """Starts the daemon probe thread (idempotent)."""
+        with self._start_lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="ollama-health-prober", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stops the probe thread."""
+        self._stop.set()
+        self._wake.set()
+
+    def probe_now(self):
+        """Requests an immediate re-probe (e.g. after an LLM call failed)."""
+        self._wake.set()
+
+    def mark(self, is_up: bool):
+        """Records an out-of-band observation from real LLM traffic."""
+        if is_up:
+            self._set_status(True)
+        else:
+            self._set_status(False)
+            self.probe_now()
+
+    def check(self) -> bool:
+        """Single blocking probe against the Ollama root endpoint."""
         try:
-            # Simple check to tags endpoint usually works to verify service
-            # or just assume active if user says so, but let's try a mild ping
-            requests.get("http://localhost:11434/", timeout=2)
+            self.session.get(f"{self.base_url}/", timeout=PROBE_TIMEOUT_SECONDS)
             return True
         except requests.RequestException:
-            logger.warning(
-                "Local Ollama instance NOT found. Privacy Shield inactive.")
             return False
 
-    def sanitize_guest_list(self, raw_text: str) -> Dict[str, Any]:
+    def _set_status(self, is_up: bool):
+        """Updates the cached status, logging only on transitions."""
+        self.last_checked = time.time()
+        if is_up:
+            self.consecutive_failures = 0
+        else:
+            self.consecutive_failures += 1
+        if is_up != self.is_up:
+            if is_up:
+                logger.info("Local Ollama instance reachable. Privacy Shield active.")
+            else:
+                logger.warning(
+                    "Local Ollama instance NOT found. Privacy Shield inactive.")
+        self.is_up = is_up
+
+    def _next_delay(self) -> float:
+        """Steady interval while healthy, exponential backoff while down."""
+        if self.is_up:
+            return PROBE_INTERVAL_SECONDS
+        exponent = min(self.consecutive_failures - 1, 16)
+        return min(PROBE_BACKOFF_BASE_SECONDS * (2 ** exponent),
+                   PROBE_BACKOFF_MAX_SECONDS)
+
+    def _run(self):
+        """Probe loop."""
+        while not self._stop.is_set():
+            self._set_status(self.check())
+            self._wake.wait(self._next_delay())
+            self._wake.clear()
+
+
+_PROBER: Optional[OllamaHealthProber] = None
+_PROBER_LOCK = threading.Lock()
+
+
+def get_health_prober() -> OllamaHealthProber:
+    """Returns the process-wide prober, starting it on first use."""
+    global _PROBER  # pylint: disable=global-statement
+    if _PROBER is None:
+        with _PROBER_LOCK:
+            if _PROBER is None:
+                _PROBER = OllamaHealthProber()
+    _PROBER.start()
+    return _PROBER
+
+
+class PrivacyShield:
+    """
+    Manages connection to local LLM for PII redaction.
+    Construction is non-blocking: availability comes from the shared prober.
+    """
+
+    def __init__(self, prober: Optional[OllamaHealthProber] = None):
+        self.prober = prober or get_health_prober()
+
+    @property
+    def is_active(self) -> bool:
+        """Cached availability of the local Ollama instance."""
+        return self.prober.is_up
+
+    def _llm_classify(self, entries: List[str]) -> List[Tuple[str, str]]:
         """
-        Uses Local LLM to extract metadata (Diet, VIP Status) while masking Names.
-        Returns:
-            {
-                "sanitized_data": [...],
-                "stats": { "vip_count": X, "vegan_count": Y }
-            }
+        Sends a batch of ambiguous entries to the local LLM.
+        Returns one (role, diet) per entry, in the same order.
         """
-        if not self.is_active:
-            return {"error": "Privacy Shield Offline. Please run 'ollama serve'."}
+        numbered = "\n".join(f"{i + 1}. {e}" for i, e in enumerate(entries))
 
         # Prompt Engineering for Sanitization
         prompt = f"""
         You are a Privacy Officer. Analyze this guest list snippet.
-        
+
         Rules:
         1. Extract the 'Role' (Bride Side, Groom Side, VIP) and 'Dietary Preference'.
         2. DO NOT output the specific Names. Replace names with "Guest_ID".
-        3. Output ONLY valid JSON in this format:
+        3. Output exactly one object per numbered entry, in the same order.
+        4. Output ONLY valid JSON in this format:
         [
             {{ "id": "Guest_1", "role": "...", "diet": "..." }},
             ...
         ]
 
         Guest List:
-        {raw_text}
+        {numbered}
         """
 
         payload = {
@@ -79,38 +352,133 @@ class PrivacyShield:
         }
 
         try:
-            response = requests.post(OLLAMA_URL, json=payload, timeout=60)
-            response.raise_for_status()
-            result = response.json()
-
-            # Parse the LLM's 'response' field
-            sanitized_json = json.loads(result.get("response", "[]"))
-
-            # Calculate Metadata (The logic that can go to cloud)
-            vip_count = sum(
-                1 for g in sanitized_json if "VIP" in g.get("role", "").upper())
-            veg_count = sum(
-                1 for g in sanitized_json if "VEG" in g.get("diet", "").upper())
-
-            return {
-                "status": "secure",
-                "sanitized_data": sanitized_json,
-                "metadata": {
-                    "total_guests": len(sanitized_json),
-                    "vip_count": vip_count,
-                    "dietary_stats": {"vegan_vegetarian": veg_count}
-                }
+            response = self.prober.session.post(
+                f"{self.prober.base_url}{OLLAMA_GENERATE_PATH}", json=payload, timeout=60)
+        except (requests.ConnectionError, requests.Timeout):
+            # A hung host counts as down too, or every entry waits the full timeout
+            self.prober.mark(False)
+            raise
+        self.prober.mark(True)
+        response.raise_for_status()
+        result = response.json()
+
+        # Parse the LLM's 'response' field
+        parsed = json.loads(result.get("response", "[]"))
+        if isinstance(parsed, dict):
+            # JSON mode sometimes wraps the list: {"guests": [...]}
+            parsed = next(
+                (v for v in parsed.values() if isinstance(v, list)), [parsed])
+
+        classified = []
+        for i in range(len(entries)):
+            item = parsed[i] if i < len(parsed) and isinstance(
+                parsed[i], dict) else {}
+            classified.append((
+                str(item.get("role") or UNRESOLVED),
+                str(item.get("diet") or UNRESOLVED)
+            ))
+        return classified
+
+    def sanitize_guest_list(self, raw_text: str) -> Dict[str, Any]:
+        """
+        Extracts metadata (Diet, VIP Status) while masking Names.
+        Deterministic fast path first; only ambiguous entries reach the Local LLM.
+        Returns:
+            {
+                "sanitized_data": [...],
+                "metadata": { "vip_count": X, "dietary_stats": {...}, "performance": {...} }
             }
+        """
+        started = time.perf_counter()
+        entries = split_entries(raw_text)
+        results: List[Optional[Tuple[str, str]]] = [None] * len(entries)
+        cache_hits = fast_path = 0
+        pending: Dict[str, List[int]] = {}
+
+        for idx, entry in enumerate(entries):
+            key = _entry_key(entry)
+            cached = _cache_get(key)
+            if cached is not None:
+                results[idx] = cached
+                cache_hits += 1
+                continue
+            classified = classify_entry(entry)
+            if classified is not None:
+                _cache_put(key, classified)
+                results[idx] = classified
+                fast_path += 1
+            else:
+                # Identical ambiguous entries share one LLM slot
+                pending.setdefault(key, []).append(idx)
+
+        llm_calls = 0
+        llm_error = None
+        if pending and not self.is_active:
+            llm_error = "Privacy Shield Offline. Please run 'ollama serve'."
+        elif pending:
+            keys = list(pending)
+            try:
+                for start in range(0, len(keys), LLM_BATCH_SIZE):
+                    batch = keys[start:start + LLM_BATCH_SIZE]
+                    llm_calls += 1
+                    classified = self._llm_classify(
+                        [entries[pending[k][0]] for k in batch])
+                    for key, value in zip(batch, classified):
+                        # A truncated / partial answer is retried next time, not pinned
+                        if UNRESOLVED not in value:
+                            _cache_put(key, value)
+                        for idx in pending[key]:
+                            results[idx] = value
+            except Exception as e:  # pylint: disable=broad-except
+                logger.error("Privacy Shield Analysis Failed: %s", e)
+                llm_error = str(e)
+
+        sanitized = []
+        unresolved = 0
+        for idx, value in enumerate(results):
+            if value is None:
+                unresolved += 1
+                value = (UNRESOLVED, UNRESOLVED)
+            sanitized.append(
+                {"id": f"Guest_{idx + 1}", "role": value[0], "diet": value[1]})
+
+        if unresolved and unresolved == len(entries):
+            return {"error": llm_error}
 
-        except Exception as e:  # pylint: disable=broad-except
-            logger.error("Privacy Shield Analysis Failed: %s", e)
-            return {"error": str(e)}
+        # Calculate Metadata (The logic that can go to cloud)
+        vip_count = sum(1 for g in sanitized if "VIP" in g["role"].upper())
+        veg_count = sum(1 for g in sanitized if "VEG" in g["diet"].upper())
+        llm_lines = sum(len(v) for v in pending.values())
+
+        response = {
+            "status": "partial" if unresolved else "secure",
+            "sanitized_data": sanitized,
+            "metadata": {
+                "total_guests": len(sanitized),
+                "vip_count": vip_count,
+                "dietary_stats": {"vegan_vegetarian": veg_count},
+                "performance": {
+                    "fast_path_lines": fast_path,
+                    "cache_hits": cache_hits,
+                    "llm_lines": llm_lines,
+                    "llm_calls": llm_calls,
+                    "llm_call_rate": round(llm_lines / len(entries), 4) if entries else 0.0,
+                    "elapsed_ms": round((time.perf_counter() - started) * 1000, 3)
+                }
+            }
+        }
+        if unresolved:
+            response["unresolved_count"] = unresolved
+            response["error"] = llm_error
+        return response
 
 
 # Test Logic
 if __name__ == "__main__":
     try:
         shield = PrivacyShield()
+        # Give the background prober a moment to find a running Ollama
+        time.sleep(PROBE_TIMEOUT_SECONDS + 0.5)
         DUMMY_TEXT = (
             "John Doe (VIP, Vegan), Jane Smith (Bride Side, GF), "
             "Elon Musk (Ultra VIP, Paleo)"
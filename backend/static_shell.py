@@ -0,0 +1,218 @@
+"""
+SPA Shell & Static Asset Index
+------------------------------
+Resolves the React build once (and again only when it changes on disk) instead
+of re-reading index.html, listing assets and running regexes on every request.
+
+- index.html is corrected once, held in memory with gzip / brotli variants and a
+  strong ETag.
+- Every file under dist/ is indexed in memory (path -> stat / content type), so
+  request handling does no os.path.exists / isfile calls.
+- Content-hashed Vite assets (assets/index-3f9a1c.js) get immutable caching.
+"""
+
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+import threading
+import time
+from typing import Dict, NamedTuple, Optional
+
+try:
+    import brotli  # Optional: pip install brotli
+except ImportError:  # pragma: no cover - depends on the environment
+    brotli = None
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# How often (at most) the dist directory is re-checked for a new build
+RELOAD_CHECK_SECONDS = 2.0
+# Compressible assets up to this size are held in memory, precompressed
+INMEMORY_MAX_BYTES = 2 * 1024 * 1024
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json",
+                      "image/svg+xml", "application/xml")
+
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE = "no-cache"
+
+# Vite emits "<name>-<hash>.<ext>" under assets/
+_HASHED_ASSET_RE = re.compile(r"^assets/.+-[A-Za-z0-9_-]{8,}\.[a-z0-9]+$")
+_JS_LINK_RE = re.compile(r'src="/assets/index-[^"]+\.js"')
+_CSS_LINK_RE = re.compile(r'href="/assets/index-[^"]+\.css"')
+
+
+class EncodedBody(NamedTuple):
+    """Precompressed variants of one in-memory payload."""
+    identity: bytes
+    gzip: Optional[bytes]
+    br: Optional[bytes]
+
+
+class StaticEntry(NamedTuple):
+    """One indexed file under dist/."""
+    path: str
+    stat: os.stat_result
+    content_type: str
+    etag: str
+    cache_control: str
+    body: Optional[EncodedBody]  # None -> streamed from disk
+
+
+def _compress(data: bytes) -> EncodedBody:
+    """Builds gzip / brotli variants, dropping ones that do not shrink the body."""
+    gz = gzip.compress(data, compresslevel=9, mtime=0)
+    br = brotli.compress(data, quality=11) if brotli is not None else None
+    return EncodedBody(
+        data,
+        gz if len(gz) < len(data) else None,
+        br if br is not None and len(br) < len(data) else None
+    )
+
+
+def _strong_etag(data: bytes) -> str:
+    """Strong ETag from the identity body."""
+    return '"' + hashlib.blake2b(data, digest_size=16).hexdigest() + '"'
+
+
+def _stat_etag(stat: os.stat_result) -> str:
+    """Cheap validator for files streamed from disk."""
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def _is_compressible(content_type: str) -> bool:
+    """Text-like content types benefit from precompression."""
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def correct_index_html(content: str, asset_names) -> str:
+    """Rewrites stale index-*.js / index-*.css links to the files actually built."""
+    js, css = "", ""
+    for name in asset_names:
+        if name.startswith("index-") and name.endswith(".js"):
+            js = name
+        elif name.startswith("index-") and name.endswith(".css"):
+            css = name
+    if js:
+        content = _JS_LINK_RE.sub(f'src="/assets/{js}"', content)
+    if css:
+        content = _CSS_LINK_RE.sub(f'href="/assets/{css}"', content)
+    return content
+
+
+def pick_encoding(accept_encoding: Optional[str], body: EncodedBody):
+    """Returns (payload, content-encoding or None) for the client's Accept-Encoding."""
+    accepted = (accept_encoding or "").lower()
+    if body.br is not None and "br" in accepted:
+        return body.br, "br"
+    if body.gzip is not None and "gzip" in accepted:
+        return body.gzip, "gzip"
+    return body.identity, None
+
+
+class SpaShell:
+    """
+    In-memory index of the frontend build, rebuilt only when dist/ changes.
+    """
+
+    def __init__(self, dist_dir: str):
+        self.dist_dir = dist_dir
+        self.index: Optional[StaticEntry] = None
+        self.files: Dict[str, StaticEntry] = {}
+        self._signature = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.reload()
+
+    def _dist_signature(self):
+        """mtimes of dist/, index.html and assets/ (a rebuild touches them)."""
+        signature = []
+        for path in (self.dist_dir,
+                     os.path.join(self.dist_dir, "index.html"),
+                     os.path.join(self.dist_dir, "assets")):
+            try:
+                signature.append(os.stat(path).st_mtime_ns)
+            except OSError:
+                signature.append(None)
+        return tuple(signature)
+
+    def reload(self):
+        """Rebuilds the shell and the path index from disk."""
+        files: Dict[str, StaticEntry] = {}
+        for root, _, names in os.walk(self.dist_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                rel = os.path.relpath(path, self.dist_dir).replace(os.sep, "/")
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+                cache_control = IMMUTABLE_CACHE if _HASHED_ASSET_RE.match(rel) \
+                    else REVALIDATE_CACHE
+                body = None
+                etag = _stat_etag(stat)
+                if _is_compressible(content_type) and stat.st_size <= INMEMORY_MAX_BYTES:
+                    with open(path, "rb") as f:
+                        data = f.read()
+                    body = _compress(data)
+                    etag = _strong_etag(data)
+                files[rel] = StaticEntry(path, stat, content_type, etag, cache_control, body)
+
+        index = None
+        index_entry = files.get("index.html")
+        if index_entry is not None:
+            with open(index_entry.path, "r", encoding="utf-8") as f:
+                content = f.read()
+            asset_names = [rel[len("assets/"):] for rel in files if rel.startswith("assets/")]
+            data = correct_index_html(content, asset_names).encode("utf-8")
+            index = StaticEntry(index_entry.path, index_entry.stat,
+                                "text/html; charset=utf-8", _strong_etag(data),
+                                REVALIDATE_CACHE, _compress(data))
+
+        with self._lock:
+            self.files = files
+            self.index = index
+            self._signature = self._dist_signature()
+            self._next_check = time.monotonic() + RELOAD_CHECK_SECONDS
+        logger.info("SPA shell indexed: %d files, index=%s",
+                    len(files), "yes" if index else "missing")
+
+    def maybe_reload(self):
+        """Re-indexes if the build changed; stats disk at most every few seconds."""
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + RELOAD_CHECK_SECONDS
+        if self._dist_signature() != self._signature:
+            self.reload()
+
+    def start(self):
+        """Starts the watcher thread that re-indexes new builds (idempotent)."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._watch, name="spa-shell-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the watcher thread."""
+        self._stop.set()
+
+    def _watch(self):
+        """Re-indexing runs here, off the event loop that serves requests."""
+        while not self._stop.wait(RELOAD_CHECK_SECONDS):
+            try:
+                self.maybe_reload()
+            except OSError as e:
+                logger.error("SPA shell reload failed: %s", e)
+
+    def lookup(self, clean_path: str) -> Optional[StaticEntry]:
+        """Returns the indexed file for a request path, if it exists."""
+        return self.files.get(clean_path)
@@ -10,6 +10,8 @@ import time
 
 import requests
 
+from backend.tracing import traced
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -33,6 +35,7 @@ class TBOClient:
         self.token = None
         self.token_expiry = 0
 
+    @traced("tbo.authenticate")
     def _authenticate(self):
         """
         Authenticates with TBO API and caches the token.
@@ -75,6 +78,7 @@ class TBOClient:
             logger.error("Error during TBO Authentication: %s", e)
             raise
 
+    @traced("tbo.search_hotels")
     def search_hotels(self, result_count: int = 10, room_count: int = 1):
         """
         Performs a hotel search with specified result and room counts.
@@ -101,6 +105,7 @@ class TBOClient:
             logger.error("Error searching hotels: %s", e)
             raise
 
+    @traced("tbo.check_availability")
     def check_availability(self, session_id: str, result_index: int, hotel_code: str):
         """
         Pre-Book check: HotelRoomAvailability.
@@ -0,0 +1,378 @@
+"""
+Stage Tracing
+-------------
+Lightweight in-process tracing for the booking transaction and its
+dependencies (APT-1 risk scoring, inventory lock, checkout, TBO calls, webhook
+commit).
+
+- `span("booking.inventory_lock")` / `@traced("tbo.search_hotels")` record
+  nested spans through a ContextVar (works across Starlette's threadpool).
+- Every finished span feeds a per-stage aggregator (p50 / p99 / mean).
+- Finished traces can be exported as JSON lines or OTLP/JSON files
+  (ANCILE_TRACE_EXPORT=/path/traces.jsonl, ANCILE_TRACE_FORMAT=json|otlp).
+  Writes happen on a background thread.
+- Opt-in sampling profiler: ANCILE_PROFILE_SAMPLE_RATE=0.05 profiles that
+  fraction of root spans; if one runs longer than ANCILE_PROFILE_SLOW_MS its
+  collapsed stacks (flamegraph.pl / speedscope input) are written to
+  ANCILE_PROFILE_DIR.
+"""
+
+import functools
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, List, Optional
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+TRACE_EXPORT_PATH = os.getenv("ANCILE_TRACE_EXPORT")
+TRACE_EXPORT_FORMAT = os.getenv("ANCILE_TRACE_FORMAT", "json")
+TRACE_EXPORT_SAMPLE_RATE = float(os.getenv("ANCILE_TRACE_SAMPLE_RATE", "1.0"))
+
+PROFILE_SAMPLE_RATE = float(os.getenv("ANCILE_PROFILE_SAMPLE_RATE", "0"))
+PROFILE_SLOW_MS = float(os.getenv("ANCILE_PROFILE_SLOW_MS", "250"))
+PROFILE_DIR = os.getenv("ANCILE_PROFILE_DIR", "profiles")
+PROFILE_INTERVAL_SECONDS = 0.005
+
+# Recent durations kept per stage for percentile estimates
+STAGE_WINDOW = 4096
+
+SERVICE_NAME = "ancile-backend"
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("ancile_current_span", default=None)
+
+
+def _new_id(n_bytes: int) -> str:
+    """Random hex id (16 bytes for traces, 8 for spans, as in OTLP)."""
+    return random.getrandbits(n_bytes * 8).to_bytes(n_bytes, "big").hex()
+
+
+class Span:
+    """One timed stage of a trace."""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns",
+                 "attributes", "error", "trace", "profile")
+
+    def __init__(self, name: str, parent: Optional["Span"], attributes: Dict[str, Any]):
+        self.name = name
+        self.parent_id = parent.span_id if parent else None
+        self.trace_id = parent.trace_id if parent else _new_id(16)
+        self.span_id = _new_id(8)
+        self.attributes = attributes
+        self.error: Optional[str] = None
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        # Spans of the same trace share the root's list
+        self.trace: List["Span"] = parent.trace if parent else []
+        self.profile: Optional["_ProfileSession"] = None
+
+    @property
+    def duration_ms(self) -> float:
+        """Wall time of the span in milliseconds."""
+        return (self.end_ns - self.start_ns) / 1e6
+
+    def set_attribute(self, key: str, value: Any):
+        """Attaches a (JSON-serializable) attribute."""
+        self.attributes[key] = value
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Plain JSON representation."""
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_unix_ns": self.start_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """OTLP/JSON span representation."""
+        otlp = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [{"key": k, "value": _otlp_value(v)}
+                           for k, v in self.attributes.items()],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            otlp["parentSpanId"] = self.parent_id
+        return otlp
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    """Maps a Python value onto an OTLP AnyValue."""
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class StageAggregator:
+    """Per-stage rolling window of durations for p50 / p99."""
+
+    def __init__(self, window: int = STAGE_WINDOW):
+        self.window = window
+        self.samples: Dict[str, Deque[float]] = {}
+        self.counts: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, span: Span):
+        """Adds a finished span's duration to its stage."""
+        with self._lock:
+            samples = self.samples.get(span.name)
+            if samples is None:
+                samples = self.samples[span.name] = deque(maxlen=self.window)
+            samples.append(span.duration_ms)
+            self.counts[span.name] = self.counts.get(span.name, 0) + 1
+            if span.error:
+                self.errors[span.name] = self.errors.get(span.name, 0) + 1
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """p50 / p99 / mean over the recent window, per stage."""
+        with self._lock:
+            snapshot = {name: sorted(samples) for name, samples in self.samples.items()}
+            counts = dict(self.counts)
+            errors = dict(self.errors)
+        result = {}
+        for name, ordered in sorted(snapshot.items()):
+            result[name] = {
+                "count": counts.get(name, 0),
+                "errors": errors.get(name, 0),
+                "p50_ms": round(_percentile(ordered, 50), 3),
+                "p99_ms": round(_percentile(ordered, 99), 3),
+                "mean_ms": round(sum(ordered) / len(ordered), 3) if ordered else 0.0,
+            }
+        return result
+
+    def reset(self):
+        """Clears all stages."""
+        with self._lock:
+            self.samples.clear()
+            self.counts.clear()
+            self.errors.clear()
+
+
+def _percentile(ordered: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a sorted list."""
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+class _TraceExporter:
+    """Appends finished traces to a file from a background thread."""
+
+    def __init__(self, path: str, fmt: str):
+        self.path = path
+        self.fmt = fmt
+        self._queue: "queue.SimpleQueue[List[Span]]" = queue.SimpleQueue()
+        threading.Thread(target=self._run, name="trace-exporter", daemon=True).start()
+
+    def submit(self, spans: List[Span]):
+        """Queues one finished trace."""
+        self._queue.put(spans)
+
+    def _encode(self, spans: List[Span]) -> str:
+        """One line per trace in the configured format."""
+        if self.fmt == "otlp":
+            return json.dumps({"resourceSpans": [{
+                "resource": {"attributes": [
+                    {"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+                "scopeSpans": [{"scope": {"name": __name__},
+                                "spans": [s.to_otlp() for s in spans]}]
+            }]}, default=str)
+        return json.dumps({"spans": [s.to_dict() for s in spans]}, default=str)
+
+    def _run(self):
+        """Writer loop."""
+        while True:
+            spans = self._queue.get()
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(self._encode(spans) + "\n")
+            except OSError as e:
+                logger.error("Trace export failed: %s", e)
+
+
+class _ProfileSession:
+    """Collapsed-stack samples for one profiled root span."""
+
+    __slots__ = ("thread_id", "stacks")
+
+    def __init__(self, thread_id: int):
+        self.thread_id = thread_id
+        self.stacks: Counter = Counter()
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of threads running profiled requests.
+    The sampler thread only runs while at least one session is active.
+    """
+
+    def __init__(self, interval: float = PROFILE_INTERVAL_SECONDS):
+        self.interval = interval
+        self.sessions: List[_ProfileSession] = []
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> _ProfileSession:
+        """Begins sampling the calling thread."""
+        session = _ProfileSession(threading.get_ident())
+        with self._lock:
+            self.sessions.append(session)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="sampling-profiler", daemon=True)
+                self._thread.start()
+        return session
+
+    def stop(self, session: _ProfileSession):
+        """Ends a session."""
+        with self._lock:
+            if session in self.sessions:
+                self.sessions.remove(session)
+
+    def _run(self):
+        """Sampler loop; exits once no sessions remain."""
+        while True:
+            with self._lock:
+                sessions = list(self.sessions)
+                if not sessions:
+                    self._thread = None
+                    return
+            frames = sys._current_frames()  # pylint: disable=protected-access
+            for session in sessions:
+                frame = frames.get(session.thread_id)
+                if frame is not None:
+                    session.stacks[_collapse(frame)] += 1
+            time.sleep(self.interval)
+
+
+def _collapse(frame) -> str:
+    """Root-first 'file:function;...' stack, as used by flamegraph.pl."""
+    parts = []
+    while frame is not None:
+        code = frame.f_code
+        parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(parts))
+
+
+class Tracer:
+    """
+    Creates spans, aggregates stage latencies and dispatches exports / profiles.
+    """
+
+    def __init__(self, export_path: Optional[str] = TRACE_EXPORT_PATH,
+                 export_format: str = TRACE_EXPORT_FORMAT,
+                 export_sample_rate: float = TRACE_EXPORT_SAMPLE_RATE,
+                 profile_sample_rate: float = PROFILE_SAMPLE_RATE,
+                 profile_slow_ms: float = PROFILE_SLOW_MS,
+                 profile_dir: str = PROFILE_DIR):
+        self.aggregator = StageAggregator()
+        self.exporter = _TraceExporter(export_path, export_format) if export_path else None
+        self.export_sample_rate = export_sample_rate
+        self.profile_sample_rate = profile_sample_rate
+        self.profile_slow_ms = profile_slow_ms
+        self.profile_dir = profile_dir
+        self.profiler = SamplingProfiler()
+
+    def start(self, name: str, attributes: Dict[str, Any]) -> Span:
+        """Opens a span under the current one (or a new trace)."""
+        parent = _current_span.get()
+        span = Span(name, parent, attributes)
+        if parent is None and self.profile_sample_rate > 0 \
+                and random.random() < self.profile_sample_rate:
+            span.profile = self.profiler.start()
+        return span
+
+    def finish(self, span: Span):
+        """Closes a span; a finished root span flushes its whole trace."""
+        span.end_ns = time.time_ns()
+        span.trace.append(span)
+        self.aggregator.record(span)
+        if span.parent_id is not None:
+            return
+        if span.profile is not None:
+            self.profiler.stop(span.profile)
+            if span.duration_ms >= self.profile_slow_ms:
+                self._dump_profile(span)
+        if self.exporter is not None and random.random() < self.export_sample_rate:
+            self.exporter.submit(list(span.trace))
+
+    def _dump_profile(self, span: Span):
+        """Writes collapsed stacks for a slow profiled trace."""
+        try:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            path = os.path.join(self.profile_dir, f"{span.name}-{span.trace_id}.folded")
+            with open(path, "w", encoding="utf-8") as f:
+                for stack, count in span.profile.stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            logger.info("Slow trace %s (%.1fms) profiled: %s",
+                        span.trace_id, span.duration_ms, path)
+        except OSError as e:
+            logger.error("Profile dump failed: %s", e)
+
+
+class _SpanContext:
+    """Context manager returned by span()."""
+
+    __slots__ = ("tracer", "name", "attributes", "span", "token")
+
+    def __init__(self, tracer: Tracer, name: str, attributes: Dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.span: Optional[Span] = None
+        self.token = None
+
+    def __enter__(self) -> Span:
+        self.span = self.tracer.start(self.name, self.attributes)
+        self.token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.span.error = f"{exc_type.__name__}: {exc}"
+        _current_span.reset(self.token)
+        self.tracer.finish(self.span)
+        return False
+
+
+def span(name: str, **attributes: Any) -> _SpanContext:
+    """`with span("booking.inventory_lock", group_id=...):` records one stage."""
+    return _SpanContext(tracer, name, attributes)
+
+
+def traced(name: str):
+    """Decorator form of span() for whole functions / methods."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+tracer = Tracer()
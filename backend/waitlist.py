@@ -0,0 +1,417 @@
+"""
+Sold-Out Waitlist
+-----------------
+Fair FIFO queue per room block, so guests who hit a sold-out block wait for a
+room instead of hammering POST /bookings/initiate.
+
+1. A refused booking enqueues the guest (idempotent) and returns a position
+   and an opaque waitlist ticket.
+2. When a hold is released or expires, the head of the queue is promoted
+   straight into a hold (an "offer") by one atomic Lua script. The offer is
+   pushed to the group's availability stream (SSE `offer` event carrying the
+   guest's ticket) and published on the `waitlist_events` channel.
+3. The promoted guest's next POST /bookings/initiate claims the offer: the
+   hold is extended to the full payment window and returned as usual.
+
+Offers are short (OFFER_TTL_SECONDS), so a guest who walked away only blocks
+the room briefly before it passes to the next waiter.
+
+All keys of a block are named by its ledger group id (a subdomain finds the
+same queue) and share its hash tag (see inventory_defense), so every
+script touches a single cluster slot. Each worker runs one WaitlistPromoter
+thread: it reacts to "release" deltas on the inventory channel immediately
+and sweeps blocks with waiters every SWEEP_INTERVAL_SECONDS for expired holds.
+Concurrent promoters across workers are safe; the scripts are atomic.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+import redis
+
+from backend.inventory_defense import (
+    HOLD_TTL_SECONDS,
+    INVENTORY_EVENTS_CHANNEL,
+    MockRedis,
+    _get_db_inventory_counts,
+    _notify_inventory_change,
+    _now_ms,
+    block_group_id,
+    block_tag,
+    holds_key,
+    redis_client,
+    waitlist_key,
+)
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+WAITLIST_ENABLED = os.getenv("ANCILE_WAITLIST", "1") == "1"
+WAITLIST_EVENTS_CHANNEL = "waitlist_events"
+# Blocks that currently have waiters (swept for expired holds)
+ACTIVE_BLOCKS_KEY = "waitlist:blocks"
+
+OFFER_TTL_SECONDS = 120
+SWEEP_INTERVAL_SECONDS = 1.0
+# Upper bound on promotions per script call
+PROMOTE_BATCH = 32
+RECONNECT_BACKOFF_MAX_SECONDS = 10.0
+
+
+def waitseq_key(group_id: str, room_type: str) -> str:
+    """Arrival sequence counter (gives the waitlist its FIFO scores)."""
+    return f"inv:{block_tag(group_id, room_type)}:waitseq"
+
+
+def offers_key(group_id: str, room_type: str) -> str:
+    """Promoted guests -> "<lock_token>|<expiry ms>"."""
+    return f"inv:{block_tag(group_id, room_type)}:offers"
+
+
+def _guest_id(guest_email: str) -> str:
+    """Queue member for a guest (one place per guest per block)."""
+    return guest_email.strip().lower()
+
+
+def waitlist_ticket(group_id: str, room_type: str, guest_email: str) -> str:
+    """
+    Opaque id of a guest's place in a block's queue. Offers on the (shared)
+    availability stream carry this instead of the guest's email.
+    """
+    group_id = block_group_id(group_id) or group_id
+    member = f"{group_id}:{room_type}:{_guest_id(guest_email)}"
+    return hashlib.sha256(member.encode("utf-8")).hexdigest()[:20]
+
+
+# KEYS = waitlist, waitseq; ARGV = guest. Returns the 1-based position.
+ENQUEUE_LUA = """
+if not redis.call('ZSCORE', KEYS[1], ARGV[1]) then
+    redis.call('ZADD', KEYS[1], redis.call('INCR', KEYS[2]), ARGV[1])
+end
+return redis.call('ZRANK', KEYS[1], ARGV[1]) + 1
+"""
+
+# KEYS = holds, waitlist, offers
+# ARGV = now_ms, offer_ttl_ms, hold_ttl_ms, capacity (allocated - booked), tokens...
+# Returns {waiters_left, guest1, token1, expiry1, guest2, ...}
+PROMOTE_LUA = """
+local now = tonumber(ARGV[1])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+local free = tonumber(ARGV[4]) - redis.call('ZCARD', KEYS[1])
+local expiry = now + tonumber(ARGV[2])
+local out = {0}
+local i = 5
+while free > 0 and i <= #ARGV do
+    local head = redis.call('ZPOPMIN', KEYS[2])
+    if #head == 0 then break end
+    redis.call('ZADD', KEYS[1], expiry, ARGV[i])
+    redis.call('HSET', KEYS[3], head[1], ARGV[i] .. '|' .. expiry)
+    out[#out + 1] = head[1]
+    out[#out + 1] = ARGV[i]
+    out[#out + 1] = tostring(expiry)
+    free = free - 1
+    i = i + 1
+end
+if #out > 1 then
+    if redis.call('PTTL', KEYS[1]) < tonumber(ARGV[3]) then
+        redis.call('PEXPIRE', KEYS[1], ARGV[3])
+    end
+    redis.call('PEXPIRE', KEYS[3], ARGV[3])
+end
+out[1] = redis.call('ZCARD', KEYS[2])
+return out
+"""
+
+# KEYS = holds, offers; ARGV = guest, now_ms, hold_ttl_ms
+# Returns the offered lock_token (now held for the full window) or false.
+CLAIM_LUA = """
+local offer = redis.call('HGET', KEYS[2], ARGV[1])
+if not offer then return false end
+redis.call('HDEL', KEYS[2], ARGV[1])
+local token = string.match(offer, '^[^|]+')
+local expiry = redis.call('ZSCORE', KEYS[1], token)
+if not expiry or tonumber(expiry) <= tonumber(ARGV[2]) then return false end
+redis.call('ZADD', KEYS[1], tonumber(ARGV[2]) + tonumber(ARGV[3]), token)
+redis.call('PEXPIRE', KEYS[1], ARGV[3])
+return token
+"""
+
+
+def _parse_offer(raw: Optional[str]) -> Optional[Tuple[str, int]]:
+    """ "<lock_token>|<expiry ms>" -> (lock_token, expiry_ms)."""
+    if not raw:
+        return None
+    token, _, expiry = raw.partition("|")
+    return token, int(expiry)
+
+
+# --- MockRedis equivalents of the scripts (run under the mock's lock) ---
+
+def _mock_enqueue(client: MockRedis, keys: List[str], guest: str) -> int:
+    """ENQUEUE_LUA."""
+    queue_key, seq_key = keys
+    with client.lock:
+        if client.zscore(queue_key, guest) is None:
+            client.zadd(queue_key, {guest: client.incr(seq_key)})
+        return client.zrank(queue_key, guest) + 1
+
+
+def _mock_promote(client: MockRedis, keys: List[str], now_ms: int, offer_ttl_ms: int,
+                  capacity: int, tokens: List[str]) -> List[Any]:
+    """PROMOTE_LUA."""
+    holds, queue_key, offers = keys
+    with client.lock:
+        client.zremrangebyscore(holds, "-inf", now_ms)
+        free = capacity - client.zcard(holds)
+        expiry = now_ms + offer_ttl_ms
+        out: List[Any] = [0]
+        for token in tokens:
+            if free <= 0:
+                break
+            head = client.zpopmin(queue_key)
+            if not head:
+                break
+            client.zadd(holds, {token: expiry})
+            client.hset(offers, head[0][0], f"{token}|{expiry}")
+            out += [head[0][0], token, str(expiry)]
+            free -= 1
+        out[0] = client.zcard(queue_key)
+        return out
+
+
+def _mock_claim(client: MockRedis, keys: List[str], guest: str, now_ms: int,
+                hold_ttl_ms: int) -> Optional[str]:
+    """CLAIM_LUA."""
+    holds, offers = keys
+    with client.lock:
+        offer = _parse_offer(client.hget(offers, guest))
+        if offer is None:
+            return None
+        client.hdel(offers, guest)
+        expiry = client.zscore(holds, offer[0])
+        if expiry is None or expiry <= now_ms:
+            return None
+        client.zadd(holds, {offer[0]: now_ms + hold_ttl_ms})
+        return offer[0]
+
+
+class Waitlist:
+    """
+    Per-block FIFO waitlist with atomic promotion into holds.
+    """
+
+    def __init__(self, client=None, enabled: bool = WAITLIST_ENABLED):
+        self.client = client if client is not None else redis_client
+        self.enabled = enabled
+        self._scripts: Dict[str, Any] = {}
+
+    def _run(self, name: str, source: str, keys: List[str], args: List[Any]):
+        """Runs a Lua script (registered once per client)."""
+        script = self._scripts.get(name)
+        if script is None:
+            script = self._scripts[name] = self.client.register_script(source)
+        return script(keys=keys, args=args, client=self.client)
+
+    @property
+    def _is_mock(self) -> bool:
+        """MockRedis has no Lua; its script equivalents run under its lock."""
+        return isinstance(self.client, MockRedis)
+
+    def enqueue(self, group_id: str, room_type: str, guest_email: str) -> int:
+        """
+        Adds a guest to the block's queue (no-op if already queued).
+        Returns their 1-based position.
+        """
+        group_id = block_group_id(group_id) or group_id
+        guest = _guest_id(guest_email)
+        keys = [waitlist_key(group_id, room_type), waitseq_key(group_id, room_type)]
+        if self._is_mock:
+            position = _mock_enqueue(self.client, keys, guest)
+        else:
+            position = int(self._run("enqueue", ENQUEUE_LUA, keys, [guest]))
+        # After the ZADD, so a concurrent sweep can never drop a fresh waiter
+        self.client.sadd(ACTIVE_BLOCKS_KEY, f"{group_id}:{room_type}")
+        return position
+
+    def position(self, group_id: str, room_type: str, guest_email: str) -> Optional[int]:
+        """1-based queue position, or None if the guest is not waiting."""
+        group_id = block_group_id(group_id) or group_id
+        rank = self.client.zrank(waitlist_key(group_id, room_type), _guest_id(guest_email))
+        return None if rank is None else int(rank) + 1
+
+    def length(self, group_id: str, room_type: str) -> int:
+        """Number of waiting guests."""
+        group_id = block_group_id(group_id) or group_id
+        return int(self.client.zcard(waitlist_key(group_id, room_type)))
+
+    def promote(self, group_id: str, room_type: str) -> List[Dict[str, Any]]:
+        """
+        Turns free rooms into offers for the head of the queue.
+        Returns the promotions (already notified).
+        """
+        group_id = block_group_id(group_id) or group_id
+        counts = _get_db_inventory_counts(group_id, room_type)
+        capacity = counts["total_allocated"] - counts["total_booked"]
+        keys = [holds_key(group_id, room_type), waitlist_key(group_id, room_type),
+                offers_key(group_id, room_type)]
+        tokens = [str(uuid.uuid4()) for _ in range(PROMOTE_BATCH)]
+        now = _now_ms()
+        if self._is_mock:
+            result = _mock_promote(self.client, keys, now, OFFER_TTL_SECONDS * 1000,
+                                   capacity, tokens)
+        else:
+            result = self._run("promote", PROMOTE_LUA, keys,
+                               [now, OFFER_TTL_SECONDS * 1000, HOLD_TTL_SECONDS * 1000,
+                                capacity, *tokens])
+
+        waiters_left = int(result[0])
+        promotions = [
+            {"group_id": group_id, "room_type": room_type, "guest": result[i],
+             "lock_token": result[i + 1], "expires_at_ms": int(result[i + 2])}
+            for i in range(1, len(result), 3)
+        ]
+        if not waiters_left:
+            self._deactivate(group_id, room_type)
+        if promotions:
+            self._notify(promotions, waiters_left)
+        return promotions
+
+    def claim(self, group_id: str, room_type: str, guest_email: str) -> Optional[str]:
+        """
+        Converts a live offer into a full hold. Returns its lock_token, or None
+        if the guest has no (unexpired) offer.
+        """
+        group_id = block_group_id(group_id) or group_id
+        keys = [holds_key(group_id, room_type), offers_key(group_id, room_type)]
+        guest = _guest_id(guest_email)
+        if self._is_mock:
+            return _mock_claim(self.client, keys, guest, _now_ms(), HOLD_TTL_SECONDS * 1000)
+        token = self._run("claim", CLAIM_LUA, keys, [guest, _now_ms(), HOLD_TTL_SECONDS * 1000])
+        return token or None
+
+    def status(self, group_id: str, room_type: str, guest_email: str) -> Dict[str, Any]:
+        """Where a guest stands: offered, waiting (with position) or none."""
+        group_id = block_group_id(group_id) or group_id
+        guest = _guest_id(guest_email)
+        offer = _parse_offer(self.client.hget(offers_key(group_id, room_type), guest))
+        if offer is not None and offer[1] > _now_ms():
+            return {"status": "offered", "expires_at_ms": offer[1]}
+        position = self.position(group_id, room_type, guest_email)
+        if position is not None:
+            return {"status": "waiting", "position": position,
+                    "waiting": self.length(group_id, room_type)}
+        return {"status": "none"}
+
+    def active_blocks(self) -> List[Tuple[str, str]]:
+        """Blocks that have waiters."""
+        blocks = []
+        for member in self.client.smembers(ACTIVE_BLOCKS_KEY):
+            group_id, _, room_type = member.rpartition(":")
+            blocks.append((group_id, room_type))
+        return blocks
+
+    def _deactivate(self, group_id: str, room_type: str):
+        """Stops sweeping an empty block, re-adding it if a waiter raced in."""
+        member = f"{group_id}:{room_type}"
+        self.client.srem(ACTIVE_BLOCKS_KEY, member)
+        if self.length(group_id, room_type):
+            self.client.sadd(ACTIVE_BLOCKS_KEY, member)
+
+    def _notify(self, promotions: List[Dict[str, Any]], waiters_left: int):
+        """Tells promoted guests (and availability streams) about their offers."""
+        for promotion in promotions:
+            logger.info("Waitlist promotion: %s/%s -> %s", promotion["group_id"],
+                        promotion["room_type"], promotion["guest"])
+            event = {k: v for k, v in promotion.items() if k != "lock_token"}
+            event["waiting"] = waiters_left
+            offer = {"group_id": promotion["group_id"], "room_type": promotion["room_type"],
+                     "event": "offer", "expires_at_ms": promotion["expires_at_ms"],
+                     "ticket": waitlist_ticket(promotion["group_id"],
+                                               promotion["room_type"], promotion["guest"])}
+            try:
+                self.client.publish(INVENTORY_EVENTS_CHANNEL, json.dumps(offer))
+                self.client.publish(WAITLIST_EVENTS_CHANNEL, json.dumps(event))
+            except redis.RedisError as e:
+                logger.error("Failed to publish waitlist promotion: %s", e)
+        first = promotions[0]
+        _notify_inventory_change(first["group_id"], first["room_type"], "promote")
+
+
+class WaitlistPromoter:
+    """
+    Per-worker promotion loop: immediate on releases, periodic for expiries.
+    """
+
+    def __init__(self, waitlist: Waitlist = None,
+                 sweep_interval: float = SWEEP_INTERVAL_SECONDS):
+        self.waitlist = waitlist if waitlist is not None else Waitlist()
+        self.sweep_interval = sweep_interval
+        self.promoted = 0
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def start(self):
+        """Starts the promoter thread (idempotent)."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="waitlist-promoter", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the promoter thread."""
+        self._stop.set()
+
+    def sweep(self):
+        """Promotes into every block with waiters (catches expired holds)."""
+        for group_id, room_type in self.waitlist.active_blocks():
+            self._promote(group_id, room_type)
+
+    def _promote(self, group_id: str, room_type: str):
+        """One block's promotion; a failure is logged and never stops the thread."""
+        try:
+            self.promoted += len(self.waitlist.promote(group_id, room_type))
+        except Exception as e:  # pylint: disable=broad-except
+            logger.error("Waitlist promotion failed for %s: %s",
+                         waitlist_key(group_id, room_type), e)
+
+    def _run(self):
+        """Listens for releases on the inventory channel between sweeps."""
+        backoff = 0.5
+        while not self._stop.is_set():
+            pubsub = None
+            try:
+                pubsub = self.waitlist.client.pubsub()
+                pubsub.subscribe(INVENTORY_EVENTS_CHANNEL)
+                backoff = 0.5
+                next_sweep = time.monotonic()
+                while not self._stop.is_set():
+                    if time.monotonic() >= next_sweep:
+                        self.sweep()
+                        next_sweep = time.monotonic() + self.sweep_interval
+                    message = pubsub.get_message(
+                        ignore_subscribe_messages=True,
+                        timeout=max(next_sweep - time.monotonic(), 0.01))
+                    if not message or message.get("type") != "message":
+                        continue
+                    delta = json.loads(message["data"])
+                    if delta.get("event") == "release":
+                        self._promote(delta["group_id"], delta["room_type"])
+            except (redis.RedisError, ValueError, KeyError) as e:
+                logger.error("Waitlist promoter error: %s", e)
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, RECONNECT_BACKOFF_MAX_SECONDS)
+            finally:
+                if pubsub is not None:
+                    pubsub.close()
+
+
+waitlist = Waitlist()
+waitlist_promoter = WaitlistPromoter(waitlist)
@@ -0,0 +1,7 @@
+"""Benchmarks run against a throwaway in-memory database unless told otherwise."""
+
+import os
+import tempfile
+
+os.environ.setdefault("ANCILE_DATABASE_URL", "sqlite:///:memory:")
+os.environ.setdefault("ANCILE_ONBOARDING_DIR", tempfile.mkdtemp(prefix="ancile-onboarding-"))
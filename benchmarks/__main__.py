@@ -0,0 +1,37 @@
+"""
+Benchmark Suite
+---------------
+Runs the micro-benchmarks and the flash-sale load test and writes one
+machine-readable result file (bench_results/suite-<commit>.json).
+
+Usage:
+    python -m benchmarks [--quick] [--redis-url redis://localhost:6379/0]
+    python -m benchmarks.compare bench_results/suite-OLD.json bench_results/suite-NEW.json
+"""
+
+import argparse
+
+from benchmarks import bench_booking, bench_micro
+from benchmarks.common import write_results
+
+
+def main():
+    """CLI entry point."""
+    parser = argparse.ArgumentParser(description="Ancile benchmark suite")
+    parser.add_argument("--quick", action="store_true", help="Smaller runs for CI smoke")
+    parser.add_argument("--redis-url", default="redis://localhost:6379/0")
+    parser.add_argument("--output", help="Result file (default bench_results/)")
+    args = parser.parse_args()
+
+    iterations = 500 if args.quick else 5000
+    guests, rooms = (300, 20) if args.quick else (2000, 100)
+
+    results = bench_micro.run(iterations, args.redis_url)
+    results["flash_sale"] = bench_booking.run(guests, rooms, concurrency=200)
+    for name, metrics in results.items():
+        print(f"{name:20s} {metrics}")
+    print("results:", write_results(results, "suite", args.output))
+
+
+if __name__ == "__main__":
+    main()
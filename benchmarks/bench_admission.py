@@ -0,0 +1,178 @@
+"""
+Mixed-Tenant Admission Load Test
+--------------------------------
+A celebrity wedding goes on sale while other groups keep booking normally.
+Measures the quiet tenants' booking latency in three runs:
+
+- baseline:      quiet tenants only;
+- spike_open:    plus a hot-group burst, admission control disabled;
+- spike_guarded: plus the same burst, admission control enabled.
+
+Quiet tenants send open-loop traffic (one request every --cold-interval-ms
+per tenant). The hot group sends --hot-rate requests/s for most of the run,
+with at most --hot-concurrency in flight. Every simulated guest has its own
+client address (X-Forwarded-For, the client bucket key) and email (the guest
+bucket key).
+
+Client and server share one event loop here, so every request (even a 429)
+costs the loop some client-side work too; keep --hot-rate below the rate the
+loop can generate.
+
+Usage:
+    python -m benchmarks.bench_admission --hot-rate 2500 --hot-concurrency 400
+"""
+
+import argparse
+import asyncio
+import time
+from typing import Any, Dict, List
+
+import httpx
+
+from backend import db, inventory_defense
+from backend.admission import BUCKET_KEY_PREFIX, admission_controller
+from benchmarks.common import latency_summary, quiet_logging, write_results
+
+HOT_GROUP = "celebrity-wedding"
+COLD_GROUPS = [f"quiet-tenant-{i}" for i in range(5)]
+ROOM = "STANDARD"
+
+
+def reset_tenants():
+    """Large blocks for every tenant, no holds, empty buckets."""
+    client = inventory_defense.redis_client
+    for group_id in [HOT_GROUP, *COLD_GROUPS]:
+        db.seed_group(group_id, [{
+            "room_type_code": ROOM, "tbo_hotel_id": "TBO-BENCH",
+            "total_allocated": 1_000_000, "total_booked": 0, "rate": 150.0}])
+        client.delete(inventory_defense.holds_key(group_id, ROOM))
+    for key in list(client.scan_iter(match=f"{BUCKET_KEY_PREFIX}:*")):
+        client.delete(key)
+    for bucket in (admission_controller.groups, admission_controller.clients,
+                   admission_controller.guests):
+        bucket.leases.clear()
+    admission_controller.shed.clear()
+    admission_controller.admitted = 0
+
+
+def payload(group_id: str, guest: int) -> Dict[str, Any]:
+    """One guest's booking request."""
+    return {
+        "group_id": group_id, "room_type": ROOM,
+        "guest_email": f"{group_id}-{guest}@example.com", "guest_name": f"Guest {guest}",
+        "origin_city": "Delhi", "booking_lead_time": 45, "room_price": 150.0,
+        "agent_id": "bench-agent"
+    }
+
+
+async def scenario(app, hot: bool, guarded: bool, duration: float, cold_interval_ms: float,
+                   hot_rate: float, hot_concurrency: int) -> Dict[str, Any]:
+    """Runs one mixed-tenant scenario."""
+    reset_tenants()
+    admission_controller.enabled = guarded
+    transport = httpx.ASGITransport(app=app)
+    cold_latencies: List[float] = []
+    cold_status: Dict[int, int] = {}
+    hot_status: Dict[int, int] = {}
+    guest_ids = iter(range(10_000_000))
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench",
+                                 timeout=120.0) as client:
+        async def post(group_id: str):
+            guest = next(guest_ids)
+            headers = {"x-forwarded-for": f"10.{guest >> 16 & 255}.{guest >> 8 & 255}."
+                                          f"{guest & 255}"}
+            return await client.post("/api/bookings/initiate",
+                                     json=payload(group_id, guest), headers=headers)
+
+        async def cold_request(group_id: str):
+            t0 = time.perf_counter()
+            response = await post(group_id)
+            cold_status[response.status_code] = cold_status.get(response.status_code, 0) + 1
+            if response.status_code != 429:
+                cold_latencies.append(time.perf_counter() - t0)
+
+        async def cold_tenant(group_id: str):
+            tasks = []
+            started = time.perf_counter()
+            tick = 0
+            while time.perf_counter() - started < duration:
+                tasks.append(asyncio.create_task(cold_request(group_id)))
+                tick += 1
+                await asyncio.sleep(max(started + tick * cold_interval_ms / 1000.0
+                                        - time.perf_counter(), 0.0))
+            await asyncio.gather(*tasks)
+
+        async def hot_burst():
+            await asyncio.sleep(duration * 0.15)
+            semaphore = asyncio.Semaphore(hot_concurrency)
+
+            async def one():
+                async with semaphore:
+                    response = await post(HOT_GROUP)
+                    hot_status[response.status_code] = hot_status.get(
+                        response.status_code, 0) + 1
+
+            tasks = []
+            started = time.perf_counter()
+            for tick in range(int(hot_rate * duration * 0.7)):
+                await asyncio.sleep(max(started + tick / hot_rate - time.perf_counter(), 0.0))
+                tasks.append(asyncio.create_task(one()))
+            await asyncio.gather(*tasks)
+
+        jobs = [cold_tenant(group_id) for group_id in COLD_GROUPS]
+        if hot:
+            jobs.append(hot_burst())
+        started = time.perf_counter()
+        await asyncio.gather(*jobs)
+        elapsed = time.perf_counter() - started
+
+    return {
+        "cold_requests": sum(cold_status.values()),
+        "cold_status": {str(k): v for k, v in sorted(cold_status.items())},
+        "cold": latency_summary(cold_latencies),
+        "hot_status": {str(k): v for k, v in sorted(hot_status.items())},
+        "shed": dict(admission_controller.shed),
+        "elapsed_s": round(elapsed, 2),
+    }
+
+
+def run(duration: float = 3.0, cold_interval_ms: float = 50.0, hot_rate: float = 2500.0,
+        hot_concurrency: int = 400) -> Dict[str, Any]:
+    """Baseline, unguarded spike and guarded spike."""
+    from backend.main import app  # pylint: disable=import-outside-toplevel
+    quiet_logging()
+    enabled, trust = admission_controller.enabled, admission_controller.trust_forwarded
+    admission_controller.trust_forwarded = True
+    args = (duration, cold_interval_ms, hot_rate, hot_concurrency)
+    try:
+        return {
+            "baseline": asyncio.run(scenario(app, False, True, *args)),
+            "spike_open": asyncio.run(scenario(app, True, False, *args)),
+            "spike_guarded": asyncio.run(scenario(app, True, True, *args)),
+        }
+    finally:
+        admission_controller.enabled = enabled
+        admission_controller.trust_forwarded = trust
+
+
+def main():
+    """CLI entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--duration", type=float, default=3.0)
+    parser.add_argument("--cold-interval-ms", type=float, default=50.0)
+    parser.add_argument("--hot-rate", type=float, default=2500.0)
+    parser.add_argument("--hot-concurrency", type=int, default=400)
+    parser.add_argument("--output", help="Result file (default bench_results/)")
+    args = parser.parse_args()
+    result = run(args.duration, args.cold_interval_ms, args.hot_rate,
+                 args.hot_concurrency)
+    for name, metrics in result.items():
+        print(name)
+        for key, value in metrics.items():
+            print(f"  {key:14s} {value}")
+    print("results:", write_results({"mixed_tenant": result}, "admission", args.output))
+
+
+if __name__ == "__main__":
+    main()
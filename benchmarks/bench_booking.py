@@ -0,0 +1,110 @@
+"""
+Flash-Sale Booking Load Test
+----------------------------
+Drives POST /api/bookings/initiate in-process (ASGI, no sockets) with N guests
+racing for M rooms of one block, and reports throughput, latency percentiles
+and the oversell count (holds granted beyond the allocation).
+
+Usage:
+    python -m benchmarks.bench_booking --guests 2000 --rooms 100 --concurrency 200
+"""
+
+import argparse
+import asyncio
+import time
+from typing import Any, Dict
+
+import httpx
+
+from backend import db, inventory_defense, waitlist
+from benchmarks.common import latency_summary, quiet_logging, write_results
+
+SALE_GROUP = "flash-sale"
+SALE_ROOM = "FLASH_SUITE"
+
+
+def reset_block(rooms: int):
+    """Fresh block with `rooms` free rooms, no holds and no waitlist."""
+    db.seed_group(SALE_GROUP, [{
+        "room_type_code": SALE_ROOM, "tbo_hotel_id": "TBO-FLASH",
+        "total_allocated": rooms, "total_booked": 0, "rate": 199.0}])
+    for key in (inventory_defense.holds_key(SALE_GROUP, SALE_ROOM),
+                inventory_defense.waitlist_key(SALE_GROUP, SALE_ROOM),
+                waitlist.waitseq_key(SALE_GROUP, SALE_ROOM),
+                waitlist.offers_key(SALE_GROUP, SALE_ROOM)):
+        inventory_defense.redis_client.delete(key)
+
+
+def booking_payload(guest: int) -> Dict[str, Any]:
+    """One guest's booking request."""
+    return {
+        "group_id": SALE_GROUP, "room_type": SALE_ROOM,
+        "guest_email": f"guest{guest}@example.com", "guest_name": f"Guest {guest}",
+        "origin_city": "Mumbai", "booking_lead_time": 30, "room_price": 199.0,
+        "agent_id": "bench-agent"
+    }
+
+
+async def flash_sale(app, guests: int, rooms: int, concurrency: int) -> Dict[str, Any]:
+    """Runs one flash sale and summarizes it."""
+    reset_block(rooms)
+    latencies, statuses = [], {}
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench",
+                                 timeout=60.0) as client:
+        async def guest(i: int):
+            async with semaphore:
+                t0 = time.perf_counter()
+                response = await client.post("/api/bookings/initiate",
+                                             json=booking_payload(i))
+                latencies.append(time.perf_counter() - t0)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(guest(i) for i in range(guests)))
+        elapsed = time.perf_counter() - started
+
+    granted = statuses.get(200, 0)
+    holds = inventory_defense.count_active_holds(SALE_GROUP, SALE_ROOM)
+    return {
+        "guests": guests,
+        "rooms": rooms,
+        "concurrency": concurrency,
+        "req_per_sec": round(guests / elapsed, 1),
+        "granted": granted,
+        "sold_out_409": statuses.get(409, 0),
+        "other_status": {str(k): v for k, v in statuses.items() if k not in (200, 409)},
+        "oversell": max(granted - rooms, 0),
+        "active_holds": holds,
+        **latency_summary(latencies),
+    }
+
+
+def run(guests: int, rooms: int, concurrency: int) -> Dict[str, Any]:
+    """Imports the app quietly and runs the scenario."""
+    from backend.main import app  # pylint: disable=import-outside-toplevel
+    from backend.admission import admission_controller  # pylint: disable=import-outside-toplevel
+    quiet_logging()
+    # Measures inventory contention, not the admission limits (bench_admission)
+    admission_controller.enabled = False
+    return asyncio.run(flash_sale(app, guests, rooms, concurrency))
+
+
+def main():
+    """CLI entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--guests", type=int, default=2000)
+    parser.add_argument("--rooms", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--output", help="Result file (default bench_results/)")
+    args = parser.parse_args()
+    result = run(args.guests, args.rooms, args.concurrency)
+    for key, value in result.items():
+        print(f"{key:14s} {value}")
+    print("results:", write_results({"flash_sale": result}, "booking", args.output))
+
+
+if __name__ == "__main__":
+    main()
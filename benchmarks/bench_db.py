@@ -0,0 +1,154 @@
+"""
+Data Access Latency Benchmark
+-----------------------------
+Latency of the hot queries (block counts, group by subdomain, guest upsert)
+through the pooled async API at several concurrency levels, against a fresh
+file-backed SQLite database (WAL):
+
+- pooled:      Database.afetchone / aexecute (prepared, pooled connections);
+- per_query:   a new connection per query (what ad-hoc access would cost);
+- bulk_upsert: upsert_guests (chunked executemany) vs one upsert per guest.
+
+Usage:
+    python -m benchmarks.bench_db --requests 4000 --concurrency 1 8 32
+"""
+
+import argparse
+import asyncio
+import os
+import sqlite3
+import tempfile
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List
+
+from backend import db
+from benchmarks.common import latency_summary, quiet_logging, write_results
+
+GROUPS = 200
+ROOMS = ("DELUXE_OCEAN", "STANDARD_GARDEN", "SUITE")
+
+
+def seed(database: db.Database):
+    """GROUPS groups with one block per room type."""
+    for g in range(GROUPS):
+        db.seed_group(f"bench-db-{g}", [
+            {"room_type_code": room, "total_allocated": 100, "rate": 150.0}
+            for room in ROOMS], database, city="Goa")
+
+
+async def drive(call: Callable[[int], Awaitable[Any]], requests: int,
+                concurrency: int) -> Dict[str, Any]:
+    """`concurrency` workers issue `requests` calls in total."""
+    latencies: List[float] = []
+
+    async def worker(offset: int):
+        for i in range(offset, requests, concurrency):
+            t0 = time.perf_counter()
+            await call(i)
+            latencies.append(time.perf_counter() - t0)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(w) for w in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {"ops_per_sec": round(requests / elapsed, 1), **latency_summary(latencies)}
+
+
+def hot_queries(database: db.Database) -> Dict[str, Callable[[int], Awaitable[Any]]]:
+    """The three hot paths as async calls."""
+    sqlite = database.backend.name == "sqlite"
+
+    def group_id(i: int) -> str:
+        key = f"bench-db-{i % GROUPS}"
+        return key if sqlite else db.resolve_group_id(key, database)
+
+    return {
+        "block_counts": lambda i: database.afetchone(
+            db.BLOCK_COUNTS, (group_id(i), ROOMS[i % len(ROOMS)])),
+        "group_by_subdomain": lambda i: database.afetchone(
+            db.GROUP_BY_SUBDOMAIN, (f"bench-db-{i % GROUPS}",)),
+        "guest_upsert": lambda i: database.aexecute(db.UPSERT_GUEST, (
+            str(uuid.uuid4()), group_id(i), f"guest{i % 5000}@example.com", None,
+            "Delhi", 0.25)),
+    }
+
+
+def per_query_call(path: str, executor_db: db.Database) -> Callable[[int], Awaitable[Any]]:
+    """Block counts through a brand-new connection each time."""
+    statement = executor_db.backend.translate(db.BLOCK_COUNTS)
+
+    def query(i: int):
+        conn = sqlite3.connect(path)
+        try:
+            return conn.execute(statement, (f"bench-db-{i % GROUPS}",
+                                            ROOMS[i % len(ROOMS)])).fetchone()
+        finally:
+            conn.close()
+
+    return lambda i: executor_db._offload(query, i)  # pylint: disable=protected-access
+
+
+def bench_bulk(database: db.Database, guests: int) -> Dict[str, Any]:
+    """One upsert per guest vs the chunked bulk path."""
+    rows = [{"email": f"bulk{i}@example.com", "origin_city": "Jaipur"} for i in range(guests)]
+    t0 = time.perf_counter()
+    for guest in rows:
+        db.upsert_guest("bench-db-0", guest, database)
+    single = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    db.upsert_guests("bench-db-1", rows, database)
+    bulk = time.perf_counter() - t0
+    return {
+        "guests": guests,
+        "single_rows_per_sec": round(guests / single, 1),
+        "bulk_rows_per_sec": round(guests / bulk, 1),
+        "speedup_x": round(single / bulk, 1),
+    }
+
+
+def run(requests: int = 4000, concurrency: List[int] = None, bulk_guests: int = 5000,
+        url: str = None) -> Dict[str, Any]:
+    """Every scenario against one fresh database."""
+    quiet_logging()
+    concurrency = concurrency or [1, 8, 32]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        database = db.Database(url or f"sqlite:///{path}", size=max(concurrency))
+        try:
+            seed(database)
+            results: Dict[str, Any] = {"backend": database.backend.name}
+            for name, call in hot_queries(database).items():
+                results[name] = {
+                    f"c{c}": asyncio.run(drive(call, requests, c)) for c in concurrency}
+            if database.backend.name == "sqlite":
+                results["block_counts_per_query_connect"] = {
+                    f"c{c}": asyncio.run(drive(per_query_call(path, database), requests, c))
+                    for c in concurrency}
+            results["bulk_upsert"] = bench_bulk(database, bulk_guests)
+        finally:
+            database.close()
+    return results
+
+
+def main():
+    """CLI entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--requests", type=int, default=4000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--bulk-guests", type=int, default=5000)
+    parser.add_argument("--url", help="Database URL (default: temporary SQLite file)")
+    parser.add_argument("--output", help="Result file (default bench_results/)")
+    args = parser.parse_args()
+    result = run(args.requests, args.concurrency, args.bulk_guests, args.url)
+    for name, metrics in result.items():
+        if not isinstance(metrics, dict):
+            print(name, metrics)
+            continue
+        print(name)
+        for key, value in metrics.items():
+            print(f"  {key:22s} {value}")
+    print("results:", write_results({"db": result}, "db", args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Origin Distance Lookup Benchmark
+--------------------------------
+Cost of the APT-1 origin distance feature over a synthetic guest list
+(--lookups guests, origins drawn Zipf-like from the city table plus a share
+of unknown or messy spellings):
+
+- single_cold:  origin_distance_km per guest with an empty pair cache;
+- single_warm:  the same calls again (every (origin, venue) pair cached);
+- batch:        origin_distances_km over the whole list (vectorized);
+- csv_scan:     baseline that parses the city CSV and scans it per guest.
+
+Usage:
+    python -m benchmarks.bench_geo --lookups 10000
+"""
+
+import argparse
+import csv
+import math
+import random
+import time
+from typing import Any, Dict, List
+
+from backend import geo_distance
+from benchmarks.common import quiet_logging, time_per_call, write_results
+
+VENUE = "Udaipur"
+
+
+def guest_origins(lookups: int, seed: int = 7) -> List[str]:
+    """Origins as guests type them: mostly popular cities, some noise."""
+    rng = random.Random(seed)
+    with open(geo_distance.SOURCE_PATH, "r", encoding="utf-8", newline="") as f:
+        cities = [row["name"] for row in csv.DictReader(f)]
+    origins = []
+    for _ in range(lookups):
+        city = cities[min(int(rng.paretovariate(1.1)) - 1, len(cities) - 1)]
+        roll = rng.random()
+        if roll < 0.1:
+            city = f"  {city.upper()}, India "
+        elif roll < 0.15:
+            city = f"Unknown Town {rng.randrange(500)}"
+        origins.append(city)
+    return origins
+
+
+def csv_scan_km(origin: str, venue: str) -> float:
+    """What per-request lookup without an index costs."""
+    coords = {}
+    with open(geo_distance.SOURCE_PATH, "r", encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            names = [row["name"], *filter(None, row["aliases"].split("|"))]
+            for name in names:
+                coords.setdefault(geo_distance.normalize_city(name),
+                                  (math.radians(float(row["lat"])), math.radians(float(row["lon"]))))
+    a = coords.get(geo_distance.normalize_city(origin.split(",")[0]))
+    b = coords.get(geo_distance.normalize_city(venue))
+    if a is None or b is None:
+        return geo_distance.DEFAULT_DISTANCE_KM
+    return geo_distance._haversine_scalar(*a, *b)  # pylint: disable=protected-access
+
+
+def per_lookup(func, origins: List[str]) -> Dict[str, Any]:
+    """Runs func over every origin once."""
+    it = iter(origins)
+    return time_per_call(lambda: func(next(it), VENUE), len(origins))
+
+
+def run(lookups: int = 10000) -> Dict[str, Any]:
+    """Every lookup mode over one guest list."""
+    quiet_logging()
+    index = geo_distance.geo_index
+    origins = guest_origins(lookups)
+    index._pairs.clear()  # pylint: disable=protected-access
+    results: Dict[str, Any] = {"cities": len(index), "lookups": lookups}
+    results["single_cold"] = per_lookup(geo_distance.origin_distance_km, origins)
+    results["single_warm"] = per_lookup(geo_distance.origin_distance_km, origins)
+
+    t0 = time.perf_counter()
+    batch = geo_distance.origin_distances_km(origins, VENUE)
+    elapsed = time.perf_counter() - t0
+    single = [geo_distance.origin_distance_km(o, VENUE) for o in origins]
+    results["batch"] = {
+        "total_ms": round(elapsed * 1000, 3),
+        "us_per_guest": round(elapsed / lookups * 1e6, 3),
+        "matches_single": bool(all(abs(a - b) < 1e-6 for a, b in zip(batch, single))),
+        "unknown_share": round(sum(1 for km in single
+                                   if km == geo_distance.DEFAULT_DISTANCE_KM) / lookups, 3),
+    }
+    results["csv_scan"] = per_lookup(csv_scan_km, origins[:max(lookups // 50, 1)])
+    return results
+
+
+def main():
+    """CLI entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--lookups", type=int, default=10000)
+    parser.add_argument("--output", help="Result file (default bench_results/)")
+    args = parser.parse_args()
+    result = run(args.lookups)
+    for name, metrics in result.items():
+        print(f"{name:12s} {metrics}")
+    print("results:", write_results({"geo": result}, "geo", args.output))
+
+
+if __name__ == "__main__":
+    main()
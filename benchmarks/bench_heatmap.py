@@ -0,0 +1,98 @@
+"""
+Demand Heatmap Benchmark
+------------------------
+Feeds a synthetic event stream (Zipf-skewed across cities / groups / room
+types) into DemandAggregator and measures ingest rate, rollup (query) latency,
+snapshot cost and memory of the ring buffers.
+
+Usage:
+    python -m benchmarks.bench_heatmap --events 500000 --cities 200 --groups 2000
+"""
+
+import argparse
+import random
+import time
+import tracemalloc
+from typing import Any, Dict
+
+from backend import db, demand_heatmap, inventory_defense
+from benchmarks.common import quiet_logging, time_per_call, write_results
+
+ROOM_TYPES = ("DELUXE_OCEAN", "STANDARD_GARDEN", "VILLA", "SUITE")
+
+
+class _FakeClock:
+    """Advances simulated time so events span several buckets."""
+
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+def run(events: int, cities: int, groups: int, seed: int = 7) -> Dict[str, Any]:
+    """Ingest + query benchmark."""
+    quiet_logging()
+    rng = random.Random(seed)
+    for g in range(groups):
+        db.seed_group(f"bench-g{g}", [], name=f"Bench {g}",
+                      city=f"City-{int(rng.paretovariate(1.2)) % cities}")
+
+    clock = _FakeClock()
+    aggregator = demand_heatmap.DemandAggregator(
+        client=inventory_defense.MockRedis(), worker_id="bench", clock=clock)
+    stream = [(f"bench-g{int(rng.paretovariate(1.1)) % groups}",
+               ROOM_TYPES[rng.randrange(len(ROOM_TYPES))],
+               demand_heatmap.HOLDS if rng.random() < 0.2 else demand_heatmap.INITIATIONS)
+              for _ in range(events)]
+    seconds_per_event = (demand_heatmap.BUCKET_SECONDS * 90) / events  # ~1.5 windows
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    for group_id, room_type, series in stream:
+        clock.now += seconds_per_event
+        aggregator.record(group_id, room_type, series)
+    ingest_seconds = time.perf_counter() - started
+    ring_bytes, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    def query():
+        aggregator._rollup = None  # pylint: disable=protected-access
+        aggregator.rollup()
+
+    rollup = time_per_call(query, 200)
+    cached = time_per_call(aggregator.rollup, 10_000)
+    started = time.perf_counter()
+    aggregator.snapshot()
+    snapshot_ms = (time.perf_counter() - started) * 1000
+
+    return {
+        "events": events,
+        "ingest_events_per_sec": round(events / ingest_seconds, 1),
+        "cities_active": len(aggregator.cities),
+        "block_rings": len(aggregator.blocks),
+        "ring_memory_kib": round(ring_bytes / 1024, 1),
+        "rollup_rebuild_p50_ms": rollup["p50_ms"],
+        "rollup_rebuild_p99_ms": rollup["p99_ms"],
+        "rollup_cached_p50_ms": cached["p50_ms"],
+        "snapshot_ms": round(snapshot_ms, 3),
+    }
+
+
+def main():
+    """CLI entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--events", type=int, default=500_000)
+    parser.add_argument("--cities", type=int, default=200)
+    parser.add_argument("--groups", type=int, default=2000)
+    parser.add_argument("--output", help="Result file (default bench_results/)")
+    args = parser.parse_args()
+    result = run(args.events, args.cities, args.groups)
+    for key, value in result.items():
+        print(f"{key:24s} {value}")
+    print("results:", write_results({"heatmap": result}, "heatmap", args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Response Serialization Benchmark
+--------------------------------
+Per-endpoint cost of turning a handler's result into response bytes, before
+and after the fast JSON path (backend/fast_json.py):
+
+- before: what each endpoint used to do, i.e. jsonable_encoder + stdlib
+          JSONResponse for plain dict returns, stdlib json.dumps for the
+          pre-serialized caches, pydantic dump_json for response models;
+- after:  orjson rendering, or a cached byte payload where the data is static
+          (health, login, hotel search mock) or cached (heatmap rollup).
+
+Payloads are synthetic but shaped like production: a 12-block microsite, a
+300-city heatmap, a 200-group dashboard snapshot.
+
+Usage:
+    python -m benchmarks.bench_json --iterations 5000
+"""
+
+import argparse
+import json
+import random
+from typing import Any, Callable, Dict, Tuple
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+from backend.fast_json import FastJSONResponse, StaticJSON, dumps, orjson
+from benchmarks.common import quiet_logging, time_per_call, write_results
+
+
+def payloads(seed: int = 5) -> Dict[str, Any]:
+    """Representative response bodies per endpoint."""
+    rng = random.Random(seed)
+    blocks = [{"room_type": f"ROOM_{i}", "price": 150.0 + i, "allocated": 40,
+               "booked": rng.randrange(30), "held": rng.randrange(5),
+               "remaining": rng.randrange(10)} for i in range(12)]
+    regions = [{"city": f"City-{i}", "demand_score": rng.randrange(1000),
+                "status": "High", "initiations": rng.randrange(500),
+                "holds": rng.randrange(100)} for i in range(300)]
+    n = 600
+    return {
+        "group_config": {"group_id": "demo", "name": "Demo Wedding", "event_date": "2026-12-12",
+                         "microsite_url": "https://demo.ancile.app", "theme": "dark_modern",
+                         "inventory": blocks},
+        "heatmap": {"regions": regions, "window_seconds": 3600, "generated_at": 1792430386.668},
+        "heatmap_city": {"city": "City-1", "blocks": [
+            {"group_id": f"g{i}", "room_type": "SUITE", "initiations": rng.randrange(99),
+             "holds": rng.randrange(9)} for i in range(200)]},
+        "snapshot": {"as_of_ms": 1792430386681, "groups": [f"group-{i}" for i in range(200)],
+                     "not_found": [], "blocks": {
+                         "group": [i // 3 for i in range(n)],
+                         "room_type": [f"ROOM_{i % 3}" for i in range(n)],
+                         "allocated": [40] * n, "booked": [rng.randrange(30) for _ in range(n)],
+                         "held": [rng.randrange(5) for _ in range(n)],
+                         "remaining": [rng.randrange(10) for _ in range(n)]}},
+        "hotel_search": {"status": "mock_fallback", "provider": "TBO (Simulated)",
+                         "data": {"HotelResult": [
+                             {"HotelName": "Grand Hyatt Bali", "StarRating": 5, "Price": 250},
+                             {"HotelName": "Ubud Hanging Gardens", "StarRating": 5,
+                              "Price": 450}]},
+                         "error_detail": "Mock Mode Enforced"},
+        "health": {"status": "active", "version": "1.0.0", "ai_status": "pickle"},
+        "booking_initiate": {"lock_token": "d72952e8-ffcc-4703-9419-be7382cc4e55",
+                             "checkout_url": "https://checkout.stripe.com/test-mock-url",
+                             "risk_score": 0.42},
+    }
+
+
+def stdlib_dict(payload: Any) -> Callable[[], bytes]:
+    """FastAPI's path for a plain dict return with the stock JSONResponse."""
+    return lambda: JSONResponse(jsonable_encoder(payload)).body
+
+
+def stdlib_compact(payload: Any) -> Callable[[], bytes]:
+    """The caches' old serializer."""
+    return lambda: json.dumps(payload, separators=(",", ":")).encode("utf-8")
+
+
+def cases(data: Dict[str, Any]) -> Dict[str, Tuple[Callable[[], Any], Callable[[], Any]]]:
+    """(before, after) per endpoint."""
+    from backend.main import BookingResponse  # pylint: disable=import-outside-toplevel
+    booking = TypeAdapter(BookingResponse)
+    static = {name: StaticJSON(data[name]) for name in ("hotel_search", "health")}
+    rollup_bytes = dumps(data["heatmap"])
+    return {
+        "group_config": (stdlib_compact(data["group_config"]),
+                         lambda: dumps(data["group_config"])),
+        "heatmap": (stdlib_dict(data["heatmap"]), lambda: rollup_bytes),
+        "heatmap_rebuild": (stdlib_dict(data["heatmap"]), lambda: dumps(data["heatmap"])),
+        "heatmap_city": (stdlib_dict(data["heatmap_city"]),
+                         lambda: FastJSONResponse(data["heatmap_city"]).body),
+        "snapshot": (stdlib_compact(data["snapshot"]), lambda: dumps(data["snapshot"])),
+        "hotel_search": (stdlib_dict(data["hotel_search"]),
+                         lambda: static["hotel_search"].response().body),
+        "health": (stdlib_dict(data["health"]), lambda: static["health"].response().body),
+        "booking_initiate": (
+            lambda: booking.dump_json(booking.validate_python(data["booking_initiate"])),
+            lambda: FastJSONResponse(booking.dump_python(
+                booking.validate_python(data["booking_initiate"]), mode="json")).body),
+    }
+
+
+def run(iterations: int = 5000) -> Dict[str, Any]:
+    """Before / after per endpoint."""
+    quiet_logging()
+    data = payloads()
+    results: Dict[str, Any] = {"orjson": orjson is not None}
+    for name, (before, after) in cases(data).items():
+        old = time_per_call(before, iterations)
+        new = time_per_call(after, iterations)
+        results[name] = {
+            "before_p50_us": round(old["p50_ms"] * 1000, 2),
+            "after_p50_us": round(new["p50_ms"] * 1000, 2),
+            "speedup_x": round(new["ops_per_sec"] / old["ops_per_sec"], 1),
+            "bytes": len(after()),
+        }
+    return results
+
+
+def main():
+    """CLI entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--iterations", type=int, default=5000)
+    parser.add_argument("--output", help="Result file (default bench_results/)")
+    args = parser.parse_args()
+    result = run(args.iterations)
+    for name, metrics in result.items():
+        print(f"{name:18s} {metrics}")
+    print("results:", write_results({"serialization": result}, "json", args.output))
+
+
+if __name__ == "__main__":
+    main()
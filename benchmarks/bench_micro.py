@@ -0,0 +1,119 @@
+"""
+Micro-benchmarks
+----------------
+Hot-path building blocks in isolation:
+  - inventory lock acquire + release against MockRedis and a local redis-server
+  - APT-1 risk scoring (_score_cancellation_risk)
+  - SPA index serving (SpaShell lookup + encoding pick, and ASGI round trip)
+
+Usage:
+    python -m benchmarks.bench_micro --iterations 5000 [--redis-url redis://localhost:6379/0]
+"""
+
+import argparse
+import asyncio
+import tempfile
+from typing import Any, Dict
+
+import redis
+
+from backend import db, inventory_defense
+from backend.static_shell import SpaShell, pick_encoding
+from benchmarks.bench_static import build_app, drive, make_dist
+from benchmarks.common import quiet_logging, time_per_call, write_results
+
+LOCK_GROUP = "bench-lock"
+LOCK_ROOM = "BENCH_ROOM"
+
+
+def _register_bench_block():
+    """A block large enough that acquire never hits InventoryFull."""
+    db.seed_group(LOCK_GROUP, [{
+        "room_type_code": LOCK_ROOM, "tbo_hotel_id": "TBO-BENCH",
+        "total_allocated": 10_000_000, "total_booked": 0, "rate": 100.0}])
+
+
+def bench_lock(client, iterations: int) -> Dict[str, Any]:
+    """acquire_inventory_lock + release_inventory_lock pairs on one block."""
+    original = inventory_defense.redis_client
+    inventory_defense.redis_client = client
+    try:
+        def cycle():
+            token = inventory_defense.acquire_inventory_lock(LOCK_GROUP, LOCK_ROOM)
+            inventory_defense.release_inventory_lock(LOCK_GROUP, LOCK_ROOM, token)
+        return time_per_call(cycle, iterations)
+    finally:
+        inventory_defense.redis_client = original
+
+
+def connect_redis(url: str):
+    """Returns a live redis client, or None if no server is reachable."""
+    try:
+        client = redis.Redis.from_url(url, decode_responses=True)
+        client.ping()
+        return client
+    except redis.RedisError:
+        return None
+
+
+def bench_apt1(iterations: int) -> Dict[str, Any]:
+    """APT-1 scoring for one booking request."""
+    from backend import main  # pylint: disable=import-outside-toplevel
+    request = main.BookingRequest(
+        group_id="demo", room_type="DELUXE_OCEAN", guest_email="g@example.com",
+        guest_name="Bench Guest", origin_city="New York", booking_lead_time=90,
+        room_price=250.0, agent_id="bench")
+    result = time_per_call(lambda: main._score_cancellation_risk(request),  # pylint: disable=protected-access
+                           iterations)
+    result["model_loaded"] = main.sklearn_pipeline is not None
+    return result
+
+
+def bench_index(iterations: int) -> Dict[str, Any]:
+    """SPA shell lookup cost and in-process ASGI throughput."""
+    with tempfile.TemporaryDirectory() as tmp:
+        dist = make_dist(tmp)
+        shell = SpaShell(dist)
+
+        def serve():
+            shell.maybe_reload()
+            entry = shell.lookup("guest/deep/link") or shell.index
+            pick_encoding("gzip, br", entry.body)
+
+        result = time_per_call(serve, iterations)
+        result["asgi_req_per_sec"] = round(asyncio.run(drive(
+            build_app(dist), ["/", "/assets/index-B7xk2QaZ.js"], iterations,
+            {"accept-encoding": "gzip, br"})), 1)
+        return result
+
+
+def run(iterations: int, redis_url: str) -> Dict[str, Any]:
+    """Runs every micro-benchmark."""
+    quiet_logging()
+    _register_bench_block()
+    results = {"lock_mock_redis": bench_lock(inventory_defense.MockRedis(), iterations)}
+    live = connect_redis(redis_url)
+    if live is not None:
+        results["lock_redis_server"] = bench_lock(live, iterations)
+    else:
+        results["lock_redis_server"] = {"skipped": f"no redis-server at {redis_url}"}
+    results["apt1_scoring"] = bench_apt1(iterations)
+    results["index_serving"] = bench_index(iterations)
+    return results
+
+
+def main():
+    """CLI entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--iterations", type=int, default=5000)
+    parser.add_argument("--redis-url", default="redis://localhost:6379/0")
+    parser.add_argument("--output", help="Result file (default bench_results/)")
+    args = parser.parse_args()
+    results = run(args.iterations, args.redis_url)
+    for name, metrics in results.items():
+        print(f"{name:20s} {metrics}")
+    print("results:", write_results(results, "micro", args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""
+Group Onboarding Benchmark
+--------------------------
+Onboards one --guests manifest into a fresh block two ways, in-process (ASGI):
+
+- per_guest: what the agent's browser did before, i.e. POST /api/identity/verify
+             then POST /api/bookings/initiate per guest, one after the other;
+- job:       POST /api/onboarding/jobs once, then poll the status endpoint.
+
+Identity verification is given --verify-ms of provider latency on both paths
+(the real check is a remote call). Browser round trips are not simulated;
+`projected_s` adds --rtt-ms per HTTP request to the measured time.
+
+Also runs a crash / resume check: a job is stopped half way, the last
+checkpoint lines are dropped (holds taken but never recorded) and a fresh
+engine resumes from the checkpoint. Every guest must end with one result and
+the block must carry exactly one hold per held guest.
+
+Usage:
+    python -m benchmarks.bench_onboarding --guests 400 --verify-ms 20 --rtt-ms 40
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import uuid
+from typing import Any, Dict, List
+
+import httpx
+
+from backend import db, inventory_defense, onboarding
+from benchmarks.bench_micro import connect_redis
+from benchmarks.common import quiet_logging, write_results
+
+ROOM = "ONBOARD_SUITE"
+CITIES = ("Mumbai", "Delhi", "London", "Singapore", "Dubai", "New York", "Bengaluru")
+
+
+def seed_block(guests: int) -> str:
+    """A fresh group with room for every guest."""
+    group_id = f"onboard-{uuid.uuid4().hex[:8]}"
+    db.seed_group(group_id, [{"room_type_code": ROOM, "total_allocated": guests,
+                              "total_booked": 0, "rate": 180.0}], city="Goa")
+    return group_id
+
+
+def manifest(guests: int) -> List[Dict[str, Any]]:
+    """Guest rows as the agent would upload them."""
+    return [{"guest_name": f"Guest {i}", "guest_email": f"guest{i}@example.com",
+             "passport_number": f"P{i:07d}", "origin_city": CITIES[i % len(CITIES)],
+             "booking_lead_time": 30 + i % 90, "relation_to_host": "Friend"}
+            for i in range(guests)]
+
+
+def slow_verify(delay: float):
+    """verify_guest_identity with provider latency."""
+    def verify(*args):
+        time.sleep(delay)
+        return onboarding.verify_guest_identity(*args)
+    return verify
+
+
+async def per_guest(app, group_id: str, guests: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Two sequential calls per guest."""
+    transport = httpx.ASGITransport(app=app)
+    held = requests = 0
+    t0 = time.perf_counter()
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for guest in guests:
+            await client.post("/api/identity/verify", json={
+                "guest_name": guest["guest_name"], "passport_number": guest["passport_number"]})
+            response = await client.post("/api/bookings/initiate", json={
+                **guest, "group_id": group_id, "room_type": ROOM, "room_price": 180.0,
+                "agent_id": "bench"})
+            requests += 2
+            held += response.status_code == 200
+    return {"wall_s": round(time.perf_counter() - t0, 3), "requests": requests, "held": held}
+
+
+async def job(app, group_id: str, guests: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """One job submission plus status polls."""
+    transport = httpx.ASGITransport(app=app)
+    t0 = time.perf_counter()
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        response = await client.post("/api/onboarding/jobs", json={
+            "group_id": group_id, "room_type": ROOM, "room_price": 180.0,
+            "agent_id": "bench", "guests": guests})
+        response.raise_for_status()
+        status_url = response.json()["status_url"]
+        requests, since, first_result = 1, 0, None
+        while True:
+            await asyncio.sleep(0.05)
+            status = (await client.get(status_url, params={"since": since})).json()
+            requests += 1
+            if first_result is None and status["processed"]:
+                first_result = time.perf_counter() - t0
+            since = status["next"]
+            if status["status"] in ("completed", "failed"):
+                break
+    return {"wall_s": round(time.perf_counter() - t0, 3), "requests": requests,
+            "first_result_s": round(first_result or 0.0, 3),
+            "held": status["counts"].get(onboarding.HELD, 0), "counts": status["counts"]}
+
+
+def crash_and_resume(guests: int, verify_ms: float, dropped: int = 10) -> Dict[str, Any]:
+    """Stops a job half way, loses its last checkpoint lines, resumes it in a new engine."""
+    group_id = seed_block(guests)
+    rows = [{**guest, "room_price": 180.0} for guest in manifest(guests)]
+    directory = tempfile.mkdtemp(prefix="ancile-onboarding-")
+    engine = onboarding.OnboardingEngine(verify=slow_verify(verify_ms / 1000.0),
+                                         directory=directory)
+    engine.start()
+    submitted = engine.submit(group_id, ROOM, "bench", rows)
+    while len(submitted.results) < guests // 2:
+        time.sleep(0.005)
+    engine.stop()  # The process "dies" here
+    path = os.path.join(directory, f"{submitted.job_id}.jsonl")
+    with open(path, "r", encoding="utf-8") as f:
+        lines = f.readlines()
+    before = len(lines) - 1
+    with open(path, "w", encoding="utf-8") as f:
+        f.writelines(lines[:-dropped])
+        f.write(lines[-dropped][:7])  # Torn final write
+
+    restarted = onboarding.OnboardingEngine(verify=slow_verify(verify_ms / 1000.0),
+                                            directory=directory)
+    resumed = restarted.start()
+    resumed_job = restarted.get(submitted.job_id)
+    while not resumed_job.finished:
+        time.sleep(0.01)
+    restarted.stop()
+    held = [r for r in resumed_job.results if r["status"] == onboarding.HELD]
+    holds = inventory_defense.redis_client.zcard(inventory_defense.holds_key(group_id, ROOM))
+    return {
+        "checkpointed_before_crash": before,
+        "lines_dropped": dropped,
+        "resumed_jobs": resumed,
+        "results": len(resumed_job.results),
+        "unique_guests": len({r["i"] for r in resumed_job.results}),
+        "held": len(held),
+        "holds_in_redis": holds,
+        "duplicate_holds": holds - len(held),
+    }
+
+
+def run(guests: int = 400, verify_ms: float = 20.0, rtt_ms: float = 40.0,
+        redis_url: str = "redis://localhost:6379/0") -> Dict[str, Any]:
+    """Per-guest calls vs one job, plus the resume check."""
+    from backend import main  # pylint: disable=import-outside-toplevel
+    quiet_logging()
+    # Sequential calls from one agent would otherwise be paced by the per-client
+    # bucket (bench_admission covers the limits)
+    admission = main.admission_controller.enabled
+    main.admission_controller.enabled = False
+    live = connect_redis(redis_url)
+    original = inventory_defense.redis_client
+    inventory_defense.redis_client = live if live is not None else inventory_defense.MockRedis()
+    verify = slow_verify(verify_ms / 1000.0)
+    original_verify = main.verify_guest_identity, main.onboarding_engine.verify
+    main.verify_guest_identity = main.onboarding_engine.verify = verify
+    # ASGITransport skips the app lifespan, which normally starts the engine
+    main.onboarding_engine.start()
+    try:
+        rows = manifest(guests)
+        sequential = asyncio.run(per_guest(main.app, seed_block(guests), rows))
+        batched = asyncio.run(job(main.app, seed_block(guests), rows))
+        for result in (sequential, batched):
+            result["projected_s"] = round(result["wall_s"] + result["requests"] * rtt_ms / 1000, 2)
+        return {
+            "redis": "server" if live is not None else "mock",
+            "guests": guests,
+            "verify_ms": verify_ms,
+            "rtt_ms": rtt_ms,
+            "per_guest": sequential,
+            "job": batched,
+            "speedup_x": round(sequential["projected_s"] / batched["projected_s"], 1),
+            "resume": crash_and_resume(guests, verify_ms),
+        }
+    finally:
+        main.onboarding_engine.stop()
+        main.verify_guest_identity, main.onboarding_engine.verify = original_verify
+        main.admission_controller.enabled = admission
+        inventory_defense.redis_client = original
+
+
+def main():
+    """CLI entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--guests", type=int, default=400)
+    parser.add_argument("--verify-ms", type=float, default=20.0)
+    parser.add_argument("--rtt-ms", type=float, default=40.0)
+    parser.add_argument("--redis-url", default="redis://localhost:6379/0")
+    parser.add_argument("--output", help="Result file (default bench_results/)")
+    args = parser.parse_args()
+    result = run(args.guests, args.verify_ms, args.rtt_ms, args.redis_url)
+    for name, metrics in result.items():
+        print(f"{name:10s} {metrics}")
+    print("results:", write_results({"onboarding": result}, "onboarding", args.output))
+
+
+if __name__ == "__main__":
+    main()
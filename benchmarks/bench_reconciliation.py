@@ -0,0 +1,256 @@
+"""
+Payment Reconciliation Benchmark
+--------------------------------
+Builds a local Stripe-export stand-in (a JSON-lines event file) and a
+matching bookings ledger (file-backed SQLite) with --events paid sessions,
+seeds known anomalies at a fixed rate, runs the reconciliation job in a
+child process and checks it finds exactly the seeded anomalies:
+
+    split_error, mismatch, missing_booking, orphaned_hold (paid but never
+    committed, and committed but still held), duplicate_payment,
+    unpaid_booking, unattributed; plus non-checkout events to skip.
+
+Reports wall time, events/s and the child's peak RSS (VmHWM, Linux) per
+size. Bounded memory means the RSS barely moves between 100k and 1M events.
+
+A crash / resume check kills the job (SIGKILL) part way through the event
+spill, restarts it on the same run directory and compares the findings to
+the clean run's.
+
+Holds live in Redis, so the two orphaned-hold cases need a server at
+--redis-url. Without one they are left out of the expectations.
+
+Usage:
+    python -m benchmarks.bench_reconciliation --events 100000 1000000
+"""
+
+import argparse
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from typing import Any, Dict, Optional, Tuple
+
+from backend import db, inventory_defense
+from backend.fast_json import dumps
+from benchmarks.bench_micro import connect_redis
+from benchmarks.common import ROOT_DIR, quiet_logging, write_results
+
+GROUPS = 50
+ROOMS = ("DELUXE_OCEAN", "STANDARD_GARDEN", "SUITE")
+ANOMALY_EVERY = 1000  # One of each anomaly per 1000 sessions
+AMOUNT, MARKUP = 25000, 5000
+
+# Position within each ANOMALY_EVERY window -> seeded anomaly
+SPLIT, MISMATCHED, MISSING, ORPHANED, STALE_HOLD, DUPLICATE, UNPAID, UNATTRIBUTED = range(1, 9)
+
+
+def session_event(i: int, token: Optional[str], group: str, room: str, amount: int = AMOUNT,
+                  markup: int = MARKUP, net: Optional[int] = None) -> Dict[str, Any]:
+    """A checkout.session.completed event shaped like Stripe's."""
+    metadata = {"type": "hotel_booking", "markup": str(markup),
+                "net_rate_held": str(amount - markup if net is None else net),
+                "group_id": group, "room_type": room}
+    if token:
+        metadata["lock_token"] = token
+    return {"id": f"evt_{i:010d}", "object": "event", "type": "checkout.session.completed",
+            "created": 1790000000 + i, "data": {"object": {
+                "id": f"cs_test_{i:010d}", "object": "checkout.session",
+                "amount_total": amount, "currency": "usd", "payment_status": "paid",
+                "customer_email": f"guest{i}@example.com", "metadata": metadata}}}
+
+
+def build_dataset(workdir: str, events: int, client) -> Tuple[str, str, Dict[str, int], list]:
+    """Writes the export and the ledger; returns paths, expected counts and hold keys."""
+    run_id = uuid.uuid4().hex[:6]
+    database = db.Database(f"sqlite:///{os.path.join(workdir, 'ledger.db')}")
+    groups = [db.seed_group(f"recon-{run_id}-{g}", [
+        {"room_type_code": room, "total_allocated": 10 ** 7, "rate": 250.0} for room in ROOMS],
+        database) for g in range(GROUPS)]
+    expected = {kind: 0 for kind in ("split_error", "mismatch", "missing_booking",
+                                     "orphaned_hold", "duplicate_payment", "unpaid_booking",
+                                     "unattributed", "matched")}
+    expiry = int(time.time() * 1000) + 3600_000
+    holds: Dict[str, Dict[str, int]] = {}
+    bookings = []
+    export = os.path.join(workdir, "events.jsonl")
+    with open(export, "wb") as out:
+        for i in range(events):
+            token = str(uuid.UUID(int=(0xA4C1 << 64) | i))
+            group, room = groups[i % GROUPS], ROOMS[i % len(ROOMS)]
+            kind = i % ANOMALY_EVERY
+            if client is None and kind in (ORPHANED, STALE_HOLD):
+                kind = MISSING if kind == ORPHANED else 0
+            booked = (token, group, room, f"cs_test_{i:010d}", AMOUNT, MARKUP, AMOUNT - MARKUP)
+            if i % 10 == 9:
+                # Noise the job must skip: other event types, non-booking sessions
+                out.write(dumps({"id": f"evt_pi_{i}", "type": "payment_intent.succeeded",
+                                 "data": {"object": {"id": f"pi_{i}"}}}) + b"\n")
+                other = session_event(i, None, group, room)
+                other["data"]["object"]["metadata"] = {"type": "gift_card"}
+                out.write(dumps(other) + b"\n")
+            if kind == UNPAID:
+                bookings.append(booked)
+                expected["unpaid_booking"] += 1
+                continue
+            if kind == UNATTRIBUTED:
+                out.write(dumps(session_event(i, None, group, room)) + b"\n")
+                expected["unattributed"] += 1
+                continue
+            event = session_event(i, token, group, room,
+                                  net=AMOUNT - MARKUP + 100 if kind == SPLIT else None)
+            out.write(dumps(event) + b"\n")
+            if kind in (MISSING, ORPHANED):
+                expected["missing_booking" if kind == MISSING else "orphaned_hold"] += 1
+                if kind == ORPHANED:
+                    holds.setdefault(inventory_defense.holds_key(group, room), {})[token] = expiry
+                continue
+            if kind == MISMATCHED:
+                booked = booked[:4] + (AMOUNT - 100,) + booked[5:]
+            elif kind == SPLIT:
+                booked = booked[:6] + (AMOUNT - MARKUP + 100,)  # The ledger copies the metadata
+            bookings.append(booked)
+            if kind == STALE_HOLD:
+                holds.setdefault(inventory_defense.holds_key(group, room), {})[token] = expiry
+                expected["orphaned_hold"] += 1
+            elif kind == DUPLICATE:
+                again = session_event(i + events, token, group, room)
+                out.write(dumps(again) + b"\n")
+                expected["duplicate_payment"] += 1
+                expected["matched"] += 1
+            elif kind == SPLIT:
+                expected["split_error"] += 1
+            elif kind == MISMATCHED:
+                expected["mismatch"] += 1
+            else:
+                expected["matched"] += 1
+    database.executemany(db.INSERT_BOOKING, (
+        (str(uuid.uuid4()), group, room, token, session, f"guest@{group}", amount, markup, net)
+        for token, group, room, session, amount, markup, net in bookings))
+    database.close()
+    for key, members in holds.items():
+        client.zadd(key, members)
+    return export, f"sqlite:///{os.path.join(workdir, 'ledger.db')}", expected, list(holds)
+
+
+def run_job(export: str, database_url: str, run_dir: str, partitions: int, redis_url: str,
+            kill_after_pages: Optional[int] = None) -> Dict[str, Any]:
+    """The reconciliation CLI in a child process; its summary, wall time and peak RSS."""
+    env = {**os.environ, "ANCILE_DATABASE_URL": database_url, "ANCILE_REDIS_URL": redis_url}
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(  # pylint: disable=consider-using-with
+        [sys.executable, "-m", "backend.fintech.reconciliation", "--export", export,
+         "--run-dir", run_dir, "--partitions", str(partitions)],
+        cwd=ROOT_DIR, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    checkpoint = os.path.join(run_dir, "checkpoint.json")
+    peak_kb = 0
+    # Sample VmHWM (the child's own high-water mark) until it exits; ru_maxrss
+    # would include the pages the child inherited from this process at fork.
+    while os.waitid(os.P_PID, proc.pid, os.WEXITED | os.WNOHANG | os.WNOWAIT) is None:
+        peak_kb = max(peak_kb, _vm_hwm_kb(proc.pid))
+        if kill_after_pages is not None:
+            try:
+                with open(checkpoint, "r", encoding="utf-8") as f:
+                    if json.load(f)["pages"] >= kill_after_pages:
+                        proc.send_signal(signal.SIGKILL)
+            except (OSError, ValueError):
+                pass
+        time.sleep(0.01)
+    out = proc.stdout.read()
+    proc.stdout.close()
+    proc.wait()
+    result = {"wall_s": round(time.perf_counter() - t0, 2),
+              "peak_rss_mb": round(peak_kb / 1024, 1),
+              "exit_code": proc.returncode}
+    if proc.returncode == 0:
+        result["summary"] = json.loads(out)
+    return result
+
+
+def _vm_hwm_kb(pid: int) -> int:
+    """Peak resident set of a live process (0 once it is gone)."""
+    try:
+        with open(f"/proc/{pid}/status", "r", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def check(expected: Dict[str, int], summary: Dict[str, Any]) -> Dict[str, Any]:
+    """Seeded vs found, per kind."""
+    counts = summary["counts"]
+    found = {kind: counts.get(kind, 0) for kind in expected}
+    return {"found": found, "exact": found == expected}
+
+
+def run(sizes=(100000,), partitions: int = 64, redis_url: str = "redis://localhost:6379/0",
+        resume_check: bool = True) -> Dict[str, Any]:
+    """Reconciles each size from a clean run directory, then the resume check."""
+    quiet_logging()
+    client = connect_redis(redis_url)
+    results: Dict[str, Any] = {"redis": "server" if client is not None else "none",
+                               "partitions": partitions}
+    for events in sizes:
+        workdir = tempfile.mkdtemp(prefix="ancile-recon-")
+        hold_keys = []
+        try:
+            t0 = time.perf_counter()
+            export, database_url, expected, hold_keys = build_dataset(workdir, events, client)
+            build_s = time.perf_counter() - t0
+            job = run_job(export, database_url, os.path.join(workdir, "run"), partitions,
+                          redis_url)
+            summary = job.pop("summary")
+            entry = {"build_s": round(build_s, 1), **job,
+                     "export_mb": round(os.path.getsize(export) / 2 ** 20, 1),
+                     "events_per_s": round(summary["counts"]["events"] / job["wall_s"]),
+                     "counts": summary["counts"], "expected": expected,
+                     **check(expected, summary)}
+            if resume_check:
+                resumed_dir = os.path.join(workdir, "resumed")
+                killed = run_job(export, database_url, resumed_dir, partitions, redis_url,
+                                 kill_after_pages=max(1, events // 100 // 4))
+                resumed = run_job(export, database_url, resumed_dir, partitions, redis_url)
+                entry["resume"] = {
+                    "killed_exit_code": killed["exit_code"],
+                    "consistent": resumed["summary"]["counts"] == summary["counts"],
+                    "report_identical": _report_lines(resumed_dir) == _report_lines(
+                        os.path.join(workdir, "run")),
+                }
+            results[str(events)] = entry
+        finally:
+            for key in hold_keys:
+                client.delete(key)
+            shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def _report_lines(run_dir: str) -> list:
+    with open(os.path.join(run_dir, "report.jsonl"), "rb") as f:
+        return sorted(f.read().splitlines())
+
+
+def main():
+    """CLI entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--events", type=int, nargs="+", default=[100000])
+    parser.add_argument("--partitions", type=int, default=64)
+    parser.add_argument("--redis-url", default="redis://localhost:6379/0")
+    parser.add_argument("--no-resume", action="store_true", help="Skip the crash / resume check")
+    parser.add_argument("--output", help="Result file (default bench_results/)")
+    args = parser.parse_args()
+    result = run(args.events, args.partitions, args.redis_url, not args.no_resume)
+    for name, metrics in result.items():
+        print(f"{name:10s} {metrics}")
+    print("results:", write_results({"reconciliation": result}, "reconciliation", args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Agent Dashboard Availability Benchmark
+--------------------------------------
+An agent dashboard showing every block of --groups groups (--rooms room types
+each, with live holds), built two ways:
+
+- per_group: get_group_availability per group (group + blocks queries and
+             one ZCOUNT per block, i.e. what the dashboard did before);
+- snapshot:  get_availability_snapshot (one SQL query + one Redis pipeline).
+
+Also reports the end-to-end POST /api/availability/snapshot latency and the
+columnar payload size against the equivalent row-per-block JSON.
+
+Runs on the in-memory Redis stand-in unless a server answers at --redis-url
+(round trips are what the snapshot saves, so a real server is the fairer test).
+
+Usage:
+    python -m benchmarks.bench_snapshot --groups 200 --redis-url redis://localhost:6379/0
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from typing import Any, Dict, List
+
+import httpx
+
+from backend import db, inventory_defense
+from benchmarks.bench_micro import connect_redis
+from benchmarks.common import latency_summary, quiet_logging, time_per_call, write_results
+
+
+def seed_dashboard(groups: int, rooms: int, client, seed: int = 11) -> List[str]:
+    """Groups with `rooms` blocks each and a few live holds per block."""
+    rng = random.Random(seed)
+    run_id = uuid.uuid4().hex[:6]
+    group_ids = []
+    expiry = int(time.time() * 1000) + 600_000
+    for g in range(groups):
+        group_id = f"dash-{run_id}-{g}"
+        blocks = [{"room_type_code": f"ROOM_{r}", "total_allocated": 40,
+                   "total_booked": rng.randrange(30), "rate": 120.0} for r in range(rooms)]
+        db.seed_group(group_id, blocks)
+        for block in blocks:
+            holds = {str(uuid.uuid4()): expiry for _ in range(rng.randrange(5))}
+            if holds:
+                client.zadd(inventory_defense.holds_key(group_id, block["room_type_code"]),
+                            holds)
+        group_ids.append(group_id)
+    return group_ids
+
+
+def per_group(group_ids: List[str]) -> List[Dict[str, Any]]:
+    """The old dashboard: one availability lookup per group."""
+    return [inventory_defense.get_group_availability(group_id) for group_id in group_ids]
+
+
+def row_payload(snapshot: Dict[str, Any]) -> bytes:
+    """The same data as one JSON object per block (for the size comparison)."""
+    blocks = snapshot["blocks"]
+    rows = [{"group_id": snapshot["groups"][g], "room_type": blocks["room_type"][i],
+             "allocated": blocks["allocated"][i], "booked": blocks["booked"][i],
+             "held": blocks["held"][i], "remaining": blocks["remaining"][i]}
+            for i, g in enumerate(blocks["group"])]
+    return json.dumps(rows).encode("utf-8")
+
+
+async def drive_endpoint(app, group_ids: List[str], iterations: int) -> Dict[str, Any]:
+    """POST /api/availability/snapshot end to end (in-process ASGI)."""
+    transport = httpx.ASGITransport(app=app)
+    latencies = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for _ in range(iterations):
+            t0 = time.perf_counter()
+            response = await client.post("/api/availability/snapshot",
+                                         json={"group_ids": group_ids})
+            latencies.append(time.perf_counter() - t0)
+            response.raise_for_status()
+    return {"iterations": iterations, **latency_summary(latencies),
+            "payload_bytes": len(response.content)}
+
+
+def run(groups: int = 200, rooms: int = 3, iterations: int = 50,
+        redis_url: str = "redis://localhost:6379/0") -> Dict[str, Any]:
+    """Both dashboard strategies on the same data."""
+    from backend.main import app  # pylint: disable=import-outside-toplevel
+    quiet_logging()
+    live = connect_redis(redis_url)
+    original = inventory_defense.redis_client
+    inventory_defense.redis_client = live if live is not None else inventory_defense.MockRedis()
+    try:
+        group_ids = seed_dashboard(groups, rooms, inventory_defense.redis_client)
+        snapshot = inventory_defense.get_availability_snapshot(group_ids)
+        old = per_group(group_ids)
+        blocks = snapshot["blocks"]
+        consistent = sorted(
+            (g["group"]["id"], b["room_type"], b["remaining"]) for g in old for b in g["blocks"]
+        ) == sorted(zip((snapshot["groups"][i] for i in blocks["group"]),
+                        blocks["room_type"], blocks["remaining"]))
+        columnar = json.dumps(snapshot, separators=(",", ":")).encode("utf-8")
+        return {
+            "redis": "server" if live is not None else "mock",
+            "groups": groups,
+            "blocks": len(snapshot["blocks"]["group"]),
+            "per_group": time_per_call(lambda: per_group(group_ids), iterations),
+            "snapshot": time_per_call(
+                lambda: inventory_defense.get_availability_snapshot(group_ids), iterations),
+            "endpoint": asyncio.run(drive_endpoint(app, group_ids, iterations)),
+            "consistent": consistent,
+            "columnar_bytes": len(columnar),
+            "row_json_bytes": len(row_payload(snapshot)),
+        }
+    finally:
+        inventory_defense.redis_client = original
+
+
+def main():
+    """CLI entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--groups", type=int, default=200)
+    parser.add_argument("--rooms", type=int, default=3)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--redis-url", default="redis://localhost:6379/0")
+    parser.add_argument("--output", help="Result file (default bench_results/)")
+    args = parser.parse_args()
+    result = run(args.groups, args.rooms, args.iterations, args.redis_url)
+    for name, metrics in result.items():
+        print(f"{name:16s} {metrics}")
+    print("results:", write_results({"dashboard": result}, "snapshot", args.output))
+
+
+if __name__ == "__main__":
+    main()
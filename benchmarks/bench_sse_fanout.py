@@ -0,0 +1,106 @@
+"""
+SSE Fan-out Load Test
+---------------------
+Drives N concurrent local availability subscribers through the same
+stream_group_availability generator the SSE endpoint uses, publishes deltas
+through Redis (or MockRedis) and measures:
+  - memory per connected subscriber (tracemalloc)
+  - publish -> delivery latency across all subscribers (p50 / p99 / max)
+
+Usage:
+    python -m benchmarks.bench_sse_fanout --subscribers 5000 --deltas 20
+"""
+
+import argparse
+import asyncio
+import json
+import time
+import tracemalloc
+
+from backend.availability_stream import AvailabilityHub, stream_group_availability
+from backend.inventory_defense import INVENTORY_EVENTS_CHANNEL, redis_client
+from benchmarks.common import percentile
+
+GROUP_ID = "bench-sse"
+SNAPSHOT = json.dumps({"group_id": GROUP_ID, "inventory": []}).encode("utf-8")
+
+
+async def consume(hub, latencies, ready, expected):
+    """One simulated SSE client: reads frames and records delivery latency."""
+    received = 0
+    stream = stream_group_availability(hub, hub.subscribe(GROUP_ID), SNAPSHOT)
+    try:
+        async for frame in stream:
+            if frame.startswith("event: snapshot"):
+                ready.release()
+                continue
+            if not frame.startswith("event: availability"):
+                continue
+            data = frame.rsplit("data: ", 1)[1]
+            delta = json.loads(data)
+            latencies.append(time.perf_counter() - delta["sent_at"])
+            received += 1
+            if delta["version"] >= expected:
+                return received
+    finally:
+        await stream.aclose()
+    return received
+
+
+async def run(subscribers: int, deltas: int, interval: float):
+    """Connects subscribers, publishes deltas, reports memory and latency."""
+    hub = AvailabilityHub()
+    latencies = []
+    ready = asyncio.Semaphore(0)
+
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    tasks = [asyncio.create_task(consume(hub, latencies, ready, deltas))
+             for _ in range(subscribers)]
+    for _ in range(subscribers):
+        await ready.acquire()
+    connected, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # Let the listener thread subscribe before publishing
+    while hub.loop is None or hub._thread is None:  # pylint: disable=protected-access
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(0.5)
+
+    started = time.perf_counter()
+    for version in range(1, deltas + 1):
+        delta = {"group_id": GROUP_ID, "room_type": "DELUXE_OCEAN",
+                 "event": "hold", "version": version, "remaining": deltas - version,
+                 "sent_at": time.perf_counter()}
+        redis_client.publish(INVENTORY_EVENTS_CHANNEL, json.dumps(delta))
+        await asyncio.sleep(interval)
+    received = await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+    hub.stop()
+
+    per_conn = (connected - baseline) / subscribers
+    print(f"subscribers           : {subscribers}")
+    print(f"deltas published      : {deltas}")
+    print(f"deliveries            : {sum(received)} "
+          f"(conflated: {subscribers * deltas - sum(received)})")
+    print(f"memory / subscriber   : {per_conn / 1024:.2f} KiB")
+    print(f"latency p50 / p99 / max (ms): "
+          f"{percentile(latencies, 50) * 1000:.2f} / "
+          f"{percentile(latencies, 99) * 1000:.2f} / "
+          f"{max(latencies, default=0) * 1000:.2f}")
+    print(f"wall time             : {elapsed:.2f}s")
+
+
+def main():
+    """CLI entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--subscribers", type=int, default=5000)
+    parser.add_argument("--deltas", type=int, default=20)
+    parser.add_argument("--interval", type=float, default=0.05,
+                        help="Seconds between published deltas")
+    args = parser.parse_args()
+    asyncio.run(run(args.subscribers, args.deltas, args.interval))
+
+
+if __name__ == "__main__":
+    main()
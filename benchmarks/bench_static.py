@@ -0,0 +1,136 @@
+"""
+Static Path Throughput Benchmark
+--------------------------------
+Compares the legacy per-request index.html rewrite (open + listdir + 2 regex
+substitutions, exists/isfile checks) with the precomputed SpaShell, both as raw
+handler cost and end-to-end through the ASGI app (in-process, no sockets).
+
+A throwaway Vite-like dist/ is generated in a temp dir so the benchmark runs
+without a frontend build.
+
+Usage:
+    python -m benchmarks.bench_static --requests 5000
+"""
+
+import argparse
+import asyncio
+import os
+import re
+import tempfile
+import time
+
+import httpx
+from fastapi import FastAPI, Request
+
+from backend.main import _serve_entry
+from backend.static_shell import SpaShell
+
+INDEX_HTML = """<!doctype html><html><head>
+<link rel="stylesheet" href="/assets/index-OLDHASH1.css">
+<script type="module" src="/assets/index-OLDHASH1.js"></script>
+</head><body><div id="root"></div>{padding}</body></html>"""
+
+
+def make_dist(root: str) -> str:
+    """Creates a fake Vite build with hashed assets."""
+    dist = os.path.join(root, "dist")
+    os.makedirs(os.path.join(dist, "assets"))
+    with open(os.path.join(dist, "index.html"), "w", encoding="utf-8") as f:
+        f.write(INDEX_HTML.format(padding="<!-- pad -->" * 200))
+    with open(os.path.join(dist, "assets", "index-B7xk2QaZ.js"), "w", encoding="utf-8") as f:
+        f.write("export const app = () => 'ancile';\n" * 4000)
+    with open(os.path.join(dist, "assets", "index-C9pL0sWe.css"), "w", encoding="utf-8") as f:
+        f.write(".glass-card { backdrop-filter: blur(8px); }\n" * 2000)
+    with open(os.path.join(dist, "vite.svg"), "w", encoding="utf-8") as f:
+        f.write("<svg xmlns='http://www.w3.org/2000/svg'></svg>")
+    return dist
+
+
+def legacy_index(dist: str) -> str:
+    """The pre-SpaShell get_corrected_index, reproduced for comparison."""
+    index_file = os.path.join(dist, "index.html")
+    if not os.path.exists(index_file):
+        return None
+    with open(index_file, "r", encoding="utf-8") as f:
+        content = f.read()
+    assets_dir = os.path.join(dist, "assets")
+    if os.path.exists(assets_dir):
+        js, css = "", ""
+        for name in os.listdir(assets_dir):
+            if name.startswith("index-") and name.endswith(".js"):
+                js = name
+            elif name.startswith("index-") and name.endswith(".css"):
+                css = name
+        if js:
+            content = re.sub(
+                r'src="/assets/index-[^"]+\.js"', f'src="/assets/{js}"', content)
+        if css:
+            content = re.sub(
+                r'href="/assets/index-[^"]+\.css"', f'href="/assets/{css}"', content)
+    return content
+
+
+def build_app(dist: str) -> FastAPI:
+    """Minimal app wired like backend.main's frontend route, on the temp dist."""
+    app = FastAPI()
+    shell = SpaShell(dist)
+
+    @app.get("/{full_path:path}")
+    async def serve(full_path: str, request: Request):
+        shell.maybe_reload()
+        entry = shell.lookup(full_path.strip("/")) if full_path.strip("/") else None
+        return _serve_entry(entry or shell.index, request)
+
+    return app
+
+
+async def drive(app: FastAPI, paths, requests: int, headers):
+    """Sequential in-process requests; returns req/s."""
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await client.get(paths[0], headers=headers)
+        started = time.perf_counter()
+        for i in range(requests):
+            response = await client.get(paths[i % len(paths)], headers=headers)
+            assert response.status_code in (200, 304)
+        return requests / (time.perf_counter() - started)
+
+
+def main():
+    """CLI entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        dist = make_dist(tmp)
+        shell = SpaShell(dist)
+
+        n = args.requests
+        started = time.perf_counter()
+        for _ in range(n):
+            legacy_index(dist)
+        legacy_us = (time.perf_counter() - started) / n * 1e6
+
+        started = time.perf_counter()
+        for _ in range(n):
+            shell.maybe_reload()
+            _ = shell.index.body.gzip
+        shell_us = (time.perf_counter() - started) / n * 1e6
+
+        print(f"index handler cost   legacy: {legacy_us:8.2f} us   shell: {shell_us:8.2f} us")
+
+        app = build_app(dist)
+        paths = ["/", "/guest/deep/link", "/assets/index-B7xk2QaZ.js"]
+        gzip_rps = asyncio.run(drive(app, paths, n, {"accept-encoding": "gzip, br"}))
+        etag = shell.index.etag
+        cond_rps = asyncio.run(drive(app, ["/"], n, {"if-none-match": etag}))
+        print(f"ASGI throughput      200 (compressed): {gzip_rps:8.0f} req/s")
+        print(f"ASGI throughput      304 (revalidate): {cond_rps:8.0f} req/s")
+        idx = shell.index.body
+        print(f"index.html bytes     identity={len(idx.identity)} "
+              f"gzip={len(idx.gzip or b'')} br={len(idx.br or b'')}")
+
+
+if __name__ == "__main__":
+    main()
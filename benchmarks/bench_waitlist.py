@@ -0,0 +1,205 @@
+"""
+Sell-Out Retry Load Test
+------------------------
+Measures how much booking traffic a sold-out block attracts, with and without
+the waitlist:
+
+- retry:    409s carry no position, so refused guests poll
+            POST /bookings/initiate every --retry-ms until they get a room.
+- waitlist: refused guests are queued, wait for their promotion on the
+            waitlist_events channel, then make one claiming request.
+
+In both modes the flash sale oversubscribes the block, then a share of the
+holders abandon checkout (their holds are released over --window seconds),
+and the freed rooms go back to the refused guests.
+
+Usage:
+    python -m benchmarks.bench_waitlist --guests 1000 --rooms 50 --window 2
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+from typing import Any, Dict, List
+
+import httpx
+
+from backend import inventory_defense
+from backend.waitlist import WAITLIST_EVENTS_CHANNEL, waitlist, waitlist_promoter
+from benchmarks.bench_booking import SALE_GROUP, SALE_ROOM, booking_payload, reset_block
+from benchmarks.common import latency_summary, quiet_logging, write_results
+
+
+class PromotionListener:
+    """Resolves a per-guest future when their waitlist promotion is published."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.waiters: Dict[str, asyncio.Future] = {}
+        self._stop = threading.Event()
+        self._pubsub = inventory_defense.redis_client.pubsub()
+        self._pubsub.subscribe(WAITLIST_EVENTS_CHANNEL)
+        self._thread = threading.Thread(target=self._listen, daemon=True)
+        self._thread.start()
+
+    def wait_for(self, guest_email: str) -> asyncio.Future:
+        """Future completed when this guest is promoted."""
+        return self.waiters.setdefault(guest_email.lower(), self.loop.create_future())
+
+    def _resolve(self, guest: str):
+        future = self.waiters.setdefault(guest, self.loop.create_future())
+        if not future.done():
+            future.set_result(time.perf_counter())
+
+    def _listen(self):
+        while not self._stop.is_set():
+            message = self._pubsub.get_message(ignore_subscribe_messages=True, timeout=0.2)
+            if message and message.get("type") == "message":
+                event = json.loads(message["data"])
+                self.loop.call_soon_threadsafe(self._resolve, event["guest"])
+
+    def close(self):
+        """Stops listening."""
+        self._stop.set()
+        self._thread.join()
+        self._pubsub.close()
+
+
+async def sell_out(app, mode: str, guests: int, rooms: int, abandon: float,
+                   window: float, retry_ms: float, concurrency: int) -> Dict[str, Any]:
+    """Runs one sell-out in the given mode and counts the booking traffic."""
+    waitlist.enabled = mode == "waitlist"
+    reset_block(rooms)
+    loop = asyncio.get_running_loop()
+    listener = PromotionListener(loop) if waitlist.enabled else None
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+    counters = {"requests": 0, "granted_first": 0, "granted_later": 0}
+    tokens: List[str] = []
+    promotion_to_hold: List[float] = []
+    first_round = asyncio.Event()
+    first_done = [0]
+    deadline = [float("inf")]
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench",
+                                 timeout=60.0) as client:
+        async def attempt(i: int) -> httpx.Response:
+            async with semaphore:
+                counters["requests"] += 1
+                return await client.post("/api/bookings/initiate", json=booking_payload(i))
+
+        async def guest(i: int):
+            response = await attempt(i)
+            first_done[0] += 1
+            if first_done[0] == guests:
+                deadline[0] = time.perf_counter() + window + 1.0
+                first_round.set()
+            if response.status_code == 200:
+                counters["granted_first"] += 1
+                tokens.append(response.json()["lock_token"])
+                return
+            await first_round.wait()
+            if listener is not None:
+                try:
+                    promoted_at = await asyncio.wait_for(
+                        listener.wait_for(booking_payload(i)["guest_email"]),
+                        timeout=max(deadline[0] - time.perf_counter(), 0.0))
+                except asyncio.TimeoutError:
+                    return
+                if (await attempt(i)).status_code == 200:
+                    counters["granted_later"] += 1
+                    promotion_to_hold.append(time.perf_counter() - promoted_at)
+                return
+            while time.perf_counter() < deadline[0]:
+                await asyncio.sleep(retry_ms / 1000.0 * random.uniform(0.5, 1.5))
+                if (await attempt(i)).status_code == 200:
+                    counters["granted_later"] += 1
+                    return
+
+        async def abandon_checkouts():
+            await first_round.wait()
+            quitters = random.sample(tokens, int(len(tokens) * abandon))
+            offsets = sorted(random.uniform(0, window) for _ in quitters)
+            started = time.perf_counter()
+            for offset, token in zip(offsets, quitters):
+                await asyncio.sleep(max(started + offset - time.perf_counter(), 0.0))
+                await asyncio.to_thread(inventory_defense.release_inventory_lock,
+                                        SALE_GROUP, SALE_ROOM, token)
+            return len(quitters)
+
+        started = time.perf_counter()
+        results = await asyncio.gather(abandon_checkouts(), *(guest(i) for i in range(guests)))
+        elapsed = time.perf_counter() - started
+
+    if listener is not None:
+        listener.close()
+    released = results[0]
+    retries = counters["requests"] - guests
+    return {
+        "mode": mode,
+        "guests": guests,
+        "rooms": rooms,
+        "released": released,
+        "initiate_requests": counters["requests"],
+        "retry_requests": retries,
+        "retries_per_reassigned_room": round(retries / max(counters["granted_later"], 1), 1),
+        "granted_first": counters["granted_first"],
+        "granted_later": counters["granted_later"],
+        "elapsed_s": round(elapsed, 2),
+        "promotion_to_hold": latency_summary(promotion_to_hold),
+    }
+
+
+def run(guests: int, rooms: int, abandon: float = 0.4, window: float = 2.0,
+        retry_ms: float = 100.0, concurrency: int = 200) -> Dict[str, Any]:
+    """Both modes back to back, plus the traffic reduction."""
+    from backend.main import app  # pylint: disable=import-outside-toplevel
+    from backend.admission import admission_controller  # pylint: disable=import-outside-toplevel
+    quiet_logging()
+    # Measures inventory contention, not the admission limits (bench_admission)
+    admission_controller.enabled = False
+    enabled = waitlist.enabled
+    # ASGITransport skips the app lifespan, which normally starts the promoter
+    waitlist_promoter.start()
+    try:
+        results = {
+            mode: asyncio.run(sell_out(app, mode, guests, rooms, abandon, window,
+                                       retry_ms, concurrency))
+            for mode in ("retry", "waitlist")
+        }
+    finally:
+        waitlist_promoter.stop()
+        waitlist.enabled = enabled
+    results["retry_reduction_x"] = round(
+        results["retry"]["retry_requests"] / max(results["waitlist"]["retry_requests"], 1), 1)
+    return results
+
+
+def main():
+    """CLI entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--guests", type=int, default=1000)
+    parser.add_argument("--rooms", type=int, default=50)
+    parser.add_argument("--abandon", type=float, default=0.4,
+                        help="Share of holders who abandon checkout")
+    parser.add_argument("--window", type=float, default=2.0,
+                        help="Seconds over which abandoned holds are released")
+    parser.add_argument("--retry-ms", type=float, default=100.0)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--output", help="Result file (default bench_results/)")
+    args = parser.parse_args()
+    result = run(args.guests, args.rooms, args.abandon, args.window,
+                 args.retry_ms, args.concurrency)
+    for mode in ("retry", "waitlist"):
+        print(mode)
+        for key, value in result[mode].items():
+            print(f"  {key:28s} {value}")
+    print(f"retry traffic reduced {result['retry_reduction_x']}x")
+    print("results:", write_results({"sell_out": result}, "waitlist", args.output))
+
+
+if __name__ == "__main__":
+    main()
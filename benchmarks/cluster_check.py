@@ -0,0 +1,250 @@
+"""
+Redis Cluster Inventory Check
+-----------------------------
+Runs the inventory engine against a real multi-node Redis Cluster and verifies
+the hash-tagged keyspace end to end:
+
+- every key of a block hashes to one slot, and blocks spread across shards;
+- concurrent acquires never oversell a block (atomic Lua check-and-hold);
+- release / commit / expiry keep the hold count exact;
+- legacy lock:* holds migrate into the new keyspace with their TTL;
+- the waitlist scripts promote in FIFO order.
+
+Either point it at an existing cluster, or let it spawn a throwaway local
+3-primary cluster from a redis-server binary:
+
+    python -m benchmarks.cluster_check --redis-server $(which redis-server)
+    python -m benchmarks.cluster_check --url redis://127.0.0.1:7000
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+import redis
+
+from benchmarks.common import quiet_logging, write_results
+
+CLUSTER_SLOTS = 16384
+
+
+class LocalCluster:
+    """Throwaway N-primary cluster (no replicas) on consecutive ports."""
+
+    def __init__(self, binary: str, nodes: int = 3, base_port: int = 7100):
+        self.binary = binary
+        self.ports = [base_port + i for i in range(nodes)]
+        self.workdir = tempfile.mkdtemp(prefix="ancile-cluster-")
+        self.processes: List[subprocess.Popen] = []
+
+    def start(self):
+        """Launches the nodes, joins them and assigns the slot ranges."""
+        for port in self.ports:
+            self.processes.append(subprocess.Popen(
+                [self.binary, "--port", str(port), "--bind", "127.0.0.1",
+                 "--cluster-enabled", "yes",
+                 "--cluster-config-file", f"nodes-{port}.conf",
+                 "--dir", self.workdir, "--save", "", "--appendonly", "no"],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+        clients = [redis.Redis(port=port) for port in self.ports]
+        for client in clients:
+            self._wait(client.ping)
+
+        per_node = CLUSTER_SLOTS // len(clients)
+        for i, client in enumerate(clients):
+            first = i * per_node
+            last = CLUSTER_SLOTS - 1 if i == len(clients) - 1 else first + per_node - 1
+            # ADDSLOTS (not ADDSLOTSRANGE) so pre-7.0 servers work too
+            for chunk in range(first, last + 1, 1024):
+                client.execute_command(
+                    "CLUSTER ADDSLOTS", *range(chunk, min(chunk + 1024, last + 1)))
+        for client in clients[1:]:
+            client.execute_command("CLUSTER MEET", "127.0.0.1", self.ports[0])
+
+        def converged():
+            for client in clients:
+                info = client.cluster("info")
+                if info.get("cluster_state") != "ok" or \
+                        int(info.get("cluster_known_nodes", 0)) != len(clients):
+                    raise redis.ConnectionError("cluster not converged")
+        self._wait(converged, timeout=20.0)
+        return self
+
+    @staticmethod
+    def _wait(check, timeout: float = 10.0):
+        """Retries check() until it stops raising."""
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                return check()
+            except redis.RedisError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.1)
+
+    @property
+    def url(self) -> str:
+        """Startup node URL."""
+        return f"redis://127.0.0.1:{self.ports[0]}"
+
+    def stop(self):
+        """Kills the nodes and removes their state."""
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.wait(timeout=10)
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+def _check(results: Dict[str, Any], name: str, ok: bool, **details):
+    """Records one check."""
+    results[name] = {"ok": bool(ok), **details}
+    print(f"  [{'PASS' if ok else 'FAIL'}] {name} {details if details else ''}")
+
+
+def run(url: str, guests: int = 400, rooms: int = 50) -> Dict[str, Any]:
+    """Runs every check against the cluster at `url`."""
+    # The engine reads its client config at import time
+    os.environ["ANCILE_REDIS_MODE"] = "cluster"
+    os.environ["ANCILE_REDIS_URL"] = url
+    from backend import inventory_defense as inv  # pylint: disable=import-outside-toplevel
+    from backend import db  # pylint: disable=import-outside-toplevel
+    quiet_logging()
+
+    client = inv.redis_client
+    if isinstance(client, inv.MockRedis):
+        raise SystemExit(f"Could not reach a Redis Cluster at {url}")
+
+    results: Dict[str, Any] = {}
+    run_id = uuid.uuid4().hex[:6]
+
+    def make_block(name: str, allocated: int, booked: int = 0):
+        group_id = f"cc-{run_id}-{name}"
+        db.seed_group(group_id, [{
+            "room_type_code": "SUITE", "tbo_hotel_id": "TBO-CC",
+            "total_allocated": allocated, "total_booked": booked, "rate": 100.0}])
+        return group_id, "SUITE"
+
+    # 1. Slot co-location and shard spread
+    blocks = [(f"cc-{run_id}-g{i}", f"ROOM{i % 3}") for i in range(60)]
+    colocated = all(
+        client.keyslot(inv.holds_key(g, r)) == client.keyslot(inv.block_tag(g, r))
+        for g, r in blocks)
+    nodes = {client.get_node_from_key(inv.holds_key(g, r)).name for g, r in blocks}
+    _check(results, "slot_colocation", colocated and len(nodes) > 1, shards_used=len(nodes))
+
+    # 2. Flash sale: concurrent acquires on one block never oversell
+    group_id, room = make_block("flash", rooms)
+
+    def attempt(_):
+        try:
+            inv.acquire_inventory_lock(group_id, room)
+            return True
+        except inv.InventoryFullException:
+            return False
+
+    with ThreadPoolExecutor(max_workers=32) as pool:
+        granted = sum(pool.map(attempt, range(guests)))
+    holds = inv.count_active_holds(group_id, room)
+    _check(results, "no_oversell", granted == rooms and holds == rooms,
+           guests=guests, rooms=rooms, granted=granted, active_holds=holds)
+
+    # 3. Release frees a room, commit books it
+    group_id, room = make_block("lifecycle", 2)
+    first = inv.acquire_inventory_lock(group_id, room)
+    second = inv.acquire_inventory_lock(group_id, room)
+    inv.release_inventory_lock(group_id, room, first)
+    third = inv.acquire_inventory_lock(group_id, room)
+    inv.commit_inventory_lock(group_id, room, second)
+    counts = inv._get_db_inventory_counts(group_id, room)  # pylint: disable=protected-access
+    _check(results, "release_commit",
+           third != first and inv.count_active_holds(group_id, room) == 1
+           and counts["total_booked"] == 1)
+
+    # 4. Expired holds stop counting and free their room
+    group_id, room = make_block("expiry", 1)
+    ttl = inv.HOLD_TTL_SECONDS
+    inv.HOLD_TTL_SECONDS = 1
+    try:
+        inv.acquire_inventory_lock(group_id, room)
+        time.sleep(1.2)
+        expired = inv.count_active_holds(group_id, room) == 0
+        inv.acquire_inventory_lock(group_id, room)
+    finally:
+        inv.HOLD_TTL_SECONDS = ttl
+    _check(results, "hold_expiry", expired and inv.count_active_holds(group_id, room) == 1)
+
+    # 5. Legacy lock:* holds move into the hash-tagged keyspace
+    group_id, room = make_block("legacy", 10)
+    legacy_tokens = [str(uuid.uuid4()) for _ in range(5)]
+    for token in legacy_tokens:
+        client.set(f"lock:{group_id}:{room}:{token}", "LOCKED", ex=300)
+    moved = inv.migrate_legacy_holds()
+    left = sum(1 for _ in client.scan_iter(match=f"lock:{group_id}:{room}:*"))
+    key = inv.holds_key(group_id, room)
+    ttl_ms = client.pttl(key)
+    _check(results, "legacy_migration",
+           moved >= len(legacy_tokens) and left == 0
+           and inv.count_active_holds(group_id, room) == len(legacy_tokens)
+           and 0 < ttl_ms <= 300_000,
+           moved=moved, key_ttl_ms=ttl_ms)
+
+    # 6. Waitlist scripts (multi-key, same slot) promote in FIFO order
+    from backend.waitlist import Waitlist  # pylint: disable=import-outside-toplevel
+    queue = Waitlist(client)
+    group_id, room = make_block("waitlist", 1)
+    token = inv.acquire_inventory_lock(group_id, room)
+    positions = [queue.enqueue(group_id, room, f"guest{i}@example.com") for i in range(3)]
+    inv.release_inventory_lock(group_id, room, token)
+    promoted = queue.promote(group_id, room)
+    claimed = queue.claim(group_id, room, "guest0@example.com")
+    _check(results, "waitlist_promotion",
+           positions == [1, 2, 3] and [p["guest"] for p in promoted] == ["guest0@example.com"]
+           and claimed == promoted[0]["lock_token"]
+           and queue.status(group_id, room, "guest1@example.com")["position"] == 1)
+
+    results["all_ok"] = all(v["ok"] for v in results.values() if isinstance(v, dict))
+    return results
+
+
+def main():
+    """CLI entry point."""
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Startup node of an existing cluster")
+    parser.add_argument("--redis-server", help="Spawn a local cluster with this binary")
+    parser.add_argument("--nodes", type=int, default=3)
+    parser.add_argument("--base-port", type=int, default=7100)
+    parser.add_argument("--guests", type=int, default=400)
+    parser.add_argument("--rooms", type=int, default=50)
+    args = parser.parse_args()
+
+    if not args.url and not args.redis_server:
+        parser.error("pass --url or --redis-server")
+
+    cluster = None
+    url = args.url
+    if url is None:
+        cluster = LocalCluster(args.redis_server, args.nodes, args.base_port)
+        url = cluster.url
+    try:
+        if cluster is not None:
+            cluster.start()
+            print(f"Local cluster: {args.nodes} primaries on ports {cluster.ports}")
+        results = run(url, args.guests, args.rooms)
+    finally:
+        if cluster is not None:
+            cluster.stop()
+    print(f"Results written to {write_results(results, 'cluster_check')}")
+    sys.exit(0 if results["all_ok"] else 1)
+
+
+if __name__ == "__main__":
+    main()
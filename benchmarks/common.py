@@ -0,0 +1,95 @@
+"""
+Benchmark Helpers
+-----------------
+Shared timing, percentile and result-file helpers so every benchmark reports
+in the same machine-readable shape:
+
+    {
+      "meta": {"commit": "...", "timestamp": ..., "python": "...", ...},
+      "results": {"<benchmark>": {"<metric>": value, ...}, ...}
+    }
+"""
+
+import json
+import logging
+import os
+import platform
+import subprocess
+import time
+from typing import Any, Callable, Dict, List
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT_DIR, "bench_results")
+
+
+def quiet_logging():
+    """Per-request INFO logs would dominate the measurements."""
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger("ancile_backend.access").setLevel(logging.WARNING)
+    for name in list(logging.root.manager.loggerDict):
+        if name.startswith("backend") or name in ("httpx", "ancile_backend"):
+            logging.getLogger(name).setLevel(logging.WARNING)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile."""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def latency_summary(seconds: List[float]) -> Dict[str, float]:
+    """p50 / p95 / p99 / max in milliseconds."""
+    return {
+        "p50_ms": round(percentile(seconds, 50) * 1000, 4),
+        "p95_ms": round(percentile(seconds, 95) * 1000, 4),
+        "p99_ms": round(percentile(seconds, 99) * 1000, 4),
+        "max_ms": round(max(seconds, default=0.0) * 1000, 4),
+    }
+
+
+def time_per_call(func: Callable[[], Any], iterations: int) -> Dict[str, float]:
+    """Runs func repeatedly; returns ops/s and per-call latency percentiles."""
+    samples = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - started
+    return {"iterations": iterations,
+            "ops_per_sec": round(iterations / elapsed, 1),
+            **latency_summary(samples)}
+
+
+def git_commit() -> str:
+    """Current commit (so result files can be compared across commits)."""
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR,
+            stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def write_results(results: Dict[str, Any], name: str, output: str = None) -> str:
+    """Writes a result file and returns its path."""
+    commit = git_commit()
+    payload = {
+        "meta": {
+            "suite": name,
+            "commit": commit,
+            "timestamp": time.time(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{name}-{commit}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(payload, f, indent=2, sort_keys=True)
+    return output
@@ -0,0 +1,76 @@
+"""
+Benchmark Comparison
+--------------------
+Diffs two result files written by the suite and flags regressions.
+
+Metric direction is inferred from the name: *_ms is lower-is-better,
+*_per_sec is higher-is-better, and 'oversell' must not grow.
+
+Usage:
+    python -m benchmarks.compare OLD.json NEW.json [--threshold 10]
+"""
+
+import argparse
+import json
+import sys
+
+
+def _direction(metric: str) -> int:
+    """+1 if higher is better, -1 if lower is better, 0 if informational."""
+    if metric.endswith("_per_sec"):
+        return 1
+    if metric.endswith("_ms") or metric == "oversell":
+        return -1
+    return 0
+
+
+def compare(old, new, threshold: float, min_ms: float = 0.01):
+    """Yields (benchmark, metric, old, new, change %, regressed)."""
+    for bench, new_metrics in sorted(new["results"].items()):
+        old_metrics = old["results"].get(bench, {})
+        for metric, new_value in sorted(new_metrics.items()):
+            old_value = old_metrics.get(metric)
+            if not isinstance(new_value, (int, float)) or isinstance(new_value, bool) \
+                    or not isinstance(old_value, (int, float)):
+                continue
+            direction = _direction(metric)
+            if direction == 0:
+                continue
+            change = ((new_value - old_value) / old_value * 100) if old_value else 0.0
+            if metric == "oversell":
+                regressed = new_value > old_value
+            elif metric.endswith("_ms") and abs(new_value - old_value) < min_ms:
+                regressed = False  # Timer noise on sub-microsecond paths
+            else:
+                regressed = -direction * change > threshold
+            yield bench, metric, old_value, new_value, change, regressed
+
+
+def main():
+    """CLI entry point; exits 1 if any metric regressed."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=10.0,
+                        help="Allowed regression in percent")
+    parser.add_argument("--min-ms", type=float, default=0.01,
+                        help="Ignore latency changes smaller than this (ms)")
+    args = parser.parse_args()
+    with open(args.old, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)
+
+    print(f"{old['meta']['commit']} -> {new['meta']['commit']}")
+    regressions = 0
+    for bench, metric, old_value, new_value, change, regressed in compare(
+            old, new, args.threshold, args.min_ms):
+        flag = "REGRESSION" if regressed else ""
+        regressions += regressed
+        print(f"{bench:20s} {metric:14s} {old_value:>12.4f} -> {new_value:>12.4f} "
+              f"({change:+7.1f}%) {flag}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
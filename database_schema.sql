@@ -1,8 +1,10 @@
 -- Phase 0: The Infrastructure & Data Foundation
 -- Instruction Set 0.1: Database Schema Design (PostgreSQL)
+-- Also applied verbatim to the local SQLite database (backend/db.py), so keep
+-- statements idempotent (IF NOT EXISTS) and within the common SQL subset.
 -- ENTITY: GROUPS (The Wedding/Event)
 -- Represents the core event container that holds inventory and revenue.
-CREATE TABLE groups (
+CREATE TABLE IF NOT EXISTS groups (
     id UUID PRIMARY KEY,
     agent_id UUID NOT NULL,
     -- Links to the travel agent managing this group
@@ -13,12 +15,16 @@ CREATE TABLE groups (
     event_date DATE NOT NULL,
     total_revenue_held DECIMAL(10, 2) DEFAULT 0.00,
     -- The Float: Total cash collected/held before settlement
+    city VARCHAR(100),
+    -- Destination city (demand heatmap)
+    theme VARCHAR(50) NOT NULL DEFAULT 'dark_modern',
+    -- Microsite theme
     status VARCHAR(20) NOT NULL CHECK (status IN ('ACTIVE', 'SETTLED', 'ARCHIVED')) -- Lifecycle status
 );
 -- ENTITY: INVENTORY_BLOCKS (The "Shielded" Rooms)
 -- Manages the specific allocations of rooms from a hotel API (e.g., TBO).
 -- Includes a critical CHECK constraint to enforce atomic inventory locking.
-CREATE TABLE inventory_blocks (
+CREATE TABLE IF NOT EXISTS inventory_blocks (
     id UUID PRIMARY KEY,
     group_id UUID REFERENCES groups(id) ON DELETE CASCADE,
     tbo_hotel_id VARCHAR(50) NOT NULL,
@@ -31,13 +37,15 @@ CREATE TABLE inventory_blocks (
     -- Current count of booked rooms
     markup_percentage DECIMAL(5, 2) NOT NULL DEFAULT 0.00,
     -- Agent's added margin percentage
+    rate DECIMAL(10, 2) NOT NULL DEFAULT 0.00,
+    -- Nightly guest-facing rate shown on the microsite
     release_date DATE NOT NULL,
     -- Date when unbooked inventory must be released
     CONSTRAINT check_inventory_limit CHECK (total_booked <= total_allocated) -- CRITICAL: Prevents overbooking at the schema level
 );
 -- ENTITY: GUESTS (The Data Goldmine)
 -- Stores guest details and links them to the prediction engine.
-CREATE TABLE guests (
+CREATE TABLE IF NOT EXISTS guests (
     id UUID PRIMARY KEY,
     group_id UUID REFERENCES groups(id) ON DELETE CASCADE,
     email VARCHAR(255) NOT NULL,
@@ -51,9 +59,33 @@ CREATE TABLE guests (
     -- Tracks the flow of funds
     apt1_cancellation_risk_score DECIMAL(3, 2) -- AI Prediction Score: 0.00 (Low Risk) to 1.00 (High Risk)
 );
+-- ENTITY: BOOKINGS (The Ledger)
+-- One row per committed hold, written in the same transaction as the
+-- total_booked increment. Payment reconciliation joins Stripe events to it.
+CREATE TABLE IF NOT EXISTS bookings (
+    id UUID PRIMARY KEY,
+    group_id UUID REFERENCES groups(id) ON DELETE CASCADE,
+    room_type_code VARCHAR(50) NOT NULL,
+    lock_token VARCHAR(64) NOT NULL,
+    -- The committed hold (also in the Stripe session metadata)
+    stripe_session_id VARCHAR(255),
+    guest_email VARCHAR(255),
+    amount_total_cents INT,
+    markup_cents INT,
+    -- Split as committed: markup -> agent, net rate -> held for TBO settlement
+    net_rate_cents INT,
+    committed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
 -- INDEXES
 -- Optimization for common lookup patterns
-CREATE INDEX idx_groups_subdomain ON groups(subdomain);
-CREATE INDEX idx_inventory_blocks_group_id ON inventory_blocks(group_id);
-CREATE INDEX idx_guests_group_id ON guests(group_id);
-CREATE INDEX idx_guests_email ON guests(email);
\ No newline at end of file
+CREATE INDEX IF NOT EXISTS idx_groups_subdomain ON groups(subdomain);
+CREATE INDEX IF NOT EXISTS idx_inventory_blocks_group_id ON inventory_blocks(group_id);
+CREATE INDEX IF NOT EXISTS idx_guests_group_id ON guests(group_id);
+CREATE INDEX IF NOT EXISTS idx_guests_email ON guests(email);
+-- Hot-path lookups and upsert conflict targets (one block per room type, one
+-- guest row per email per group)
+CREATE UNIQUE INDEX IF NOT EXISTS idx_inventory_blocks_group_room ON inventory_blocks(group_id, room_type_code);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_guests_group_email ON guests(group_id, email);
+-- One booking per hold: a redelivered webhook cannot book the room twice
+CREATE UNIQUE INDEX IF NOT EXISTS idx_bookings_lock_token ON bookings(lock_token);
+CREATE INDEX IF NOT EXISTS idx_bookings_group_id ON bookings(group_id);